@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_cors import CORS
 from .config import Config
+from . import extensions
 from .extensions import init_extensions
 from .routes import register_blueprints
 
@@ -19,4 +20,8 @@ def create_app(config_class: type[Config] = Config) -> Flask:
     def healthz():
         return {"status": "ok"}
 
+    @app.get("/api/cache-stats")
+    def cache_stats():
+        return extensions.cache.info()
+
     return app
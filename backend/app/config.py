@@ -4,8 +4,30 @@ from datetime import timedelta
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret")
     DATASETS_DIR = os.environ.get("DATASETS_DIR", os.path.abspath(os.path.join(os.getcwd(), "datasets")))
+    DATA_DIR = os.environ.get("DATA_DIR", os.path.abspath(os.path.join(os.getcwd(), "data")))
+    CACHE_DIR = os.environ.get("CACHE_DIR", os.path.abspath(os.path.join(os.getcwd(), ".cache")))
     MODELS_DIR = os.environ.get("MODELS_DIR", os.path.abspath(os.path.join(os.getcwd(), "models")))
     REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_POOL_SIZE = int(os.environ.get("REDIS_POOL_SIZE", "10"))
+    CACHE_MEMORY_MB = float(os.environ.get("CACHE_MEMORY_MB", "64"))  # in-process tier per worker
+    CACHE_TTL = int(os.environ.get("CACHE_TTL", "3600"))
     DATA_KEY = os.environ.get("DATA_KEY", None)  # if None utils will generate per-run key
     MOCK_MODE = os.environ.get("MOCK_MODE", "true").lower() == "true"  # CI default
+    DATASET_MEMORY_MB = float(os.environ.get("DATASET_MEMORY_MB", "512"))  # in-memory budget per worker
+    SIM_MEMORY_MB = float(os.environ.get("SIM_MEMORY_MB", "256"))  # per-array budget before chunking
+    SIM_WORKERS = int(os.environ.get("SIM_WORKERS", "0")) or None  # None -> os.cpu_count()
+    RESULTS_DB = os.environ.get("RESULTS_DB")  # default: CACHE_DIR/results.sqlite, shared by workers
+    RESULTS_MAX_MB = float(os.environ.get("RESULTS_MAX_MB", "256"))
+    RESULTS_TTL = float(os.environ.get("RESULTS_TTL", str(7 * 86400)))
+    LINEAGE_DB = os.environ.get("LINEAGE_DB")  # default: CACHE_DIR/lineage.sqlite, shared by workers
+    COMPARE_WORKERS = int(os.environ.get("COMPARE_WORKERS", "0")) or None  # None -> os.cpu_count()
+    COMPARE_TIMEOUT = float(os.environ.get("COMPARE_TIMEOUT", "60"))  # seconds per model
+    SAS_IMAGE = os.environ.get("SAS_IMAGE", "sas-grid")
+    SAS_WORKERS = int(os.environ.get("SAS_WORKERS", "2"))  # SAS jobs running at once per worker
+    SAS_MAX_QUEUED = int(os.environ.get("SAS_MAX_QUEUED", "50"))
+    SAS_TIMEOUT = float(os.environ.get("SAS_TIMEOUT", "600"))
+    SAS_JOBS_DB = os.environ.get("SAS_JOBS_DB")  # default: CACHE_DIR/sas_jobs.sqlite, shared by workers
+    SENSITIVITY_WORKERS = int(os.environ.get("SENSITIVITY_WORKERS", "0")) or None  # None -> os.cpu_count()
+    SENSITIVITY_SHARD = int(os.environ.get("SENSITIVITY_SHARD", "50"))  # grid points per streamed shard
+    SENSITIVITY_MAX_POINTS = int(os.environ.get("SENSITIVITY_MAX_POINTS", "5000"))
     SEND_FILE_MAX_AGE_DEFAULT = timedelta(seconds=0)
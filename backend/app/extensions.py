@@ -1,15 +1,35 @@
 import os
-import redis
 from cryptography.fernet import Fernet
+from .utils.cache import TwoTierCache
+from .utils.dataset_store import DatasetStore
+from .utils.lineage import LineageStore
+from .utils.result_store import ResultStore
+from .utils.sas_runner import DockerExecutor, MockExecutor, SasJobQueue
 
 cache = None
+datasets = None
+results = None
+lineage = None
+sas_jobs = None
 
 def init_extensions(app):
-    global cache
-    cache = redis.Redis.from_url(app.config["REDIS_URL"]) if app.config["REDIS_URL"] else None
+    global cache, datasets, results, lineage, sas_jobs
+    # local LRU in front of Redis; runs local-only without REDIS_URL or while Redis is down
+    cache = TwoTierCache(app.config["REDIS_URL"] or None, max_bytes=int(app.config["CACHE_MEMORY_MB"] * 2 ** 20),
+                         default_ttl=app.config["CACHE_TTL"], pool_size=app.config["REDIS_POOL_SIZE"])
     # ensure folders exist
     os.makedirs(app.config["DATASETS_DIR"], exist_ok=True)
     os.makedirs(app.config["MODELS_DIR"], exist_ok=True)
+    os.makedirs(app.config["CACHE_DIR"], exist_ok=True)
+    datasets = DatasetStore(app.config["DATASETS_DIR"], int(app.config["DATASET_MEMORY_MB"] * 2 ** 20))
+    results = ResultStore(app.config["RESULTS_DB"] or os.path.join(app.config["CACHE_DIR"], "results.sqlite"),
+                          int(app.config["RESULTS_MAX_MB"] * 2 ** 20), app.config["RESULTS_TTL"])
+    lineage = LineageStore(app.config["LINEAGE_DB"] or os.path.join(app.config["CACHE_DIR"], "lineage.sqlite"))
+    executor = (MockExecutor() if app.config["MOCK_MODE"]
+                else DockerExecutor(app.config["SAS_IMAGE"], app.config["SAS_TIMEOUT"]))
+    sas_jobs = SasJobQueue(app.config["SAS_JOBS_DB"] or os.path.join(app.config["CACHE_DIR"], "sas_jobs.sqlite"),
+                           executor, datasets, cache, app.config["SAS_WORKERS"], app.config["SAS_MAX_QUEUED"],
+                           os.path.join(app.config["CACHE_DIR"], "sas"))
 
 def get_cipher(app):
     key = app.config.get("DATA_KEY") or Fernet.generate_key()
@@ -5,6 +5,9 @@ from .cleaning import bp as cleaning_bp
 from .models import bp as models_bp
 from .report import bp as report_bp
 from .compare import bp as compare_bp
+from .lineage import bp as lineage_bp
+from .sas import bp as sas_bp
+from .actuarial import bp as actuarial_bp
 
 
 def register_blueprints(app):
@@ -14,3 +17,6 @@ def register_blueprints(app):
     app.register_blueprint(models_bp, url_prefix="/api")
     app.register_blueprint(compare_bp, url_prefix="/api")
     app.register_blueprint(report_bp, url_prefix="/api")
+    app.register_blueprint(lineage_bp, url_prefix="/api")
+    app.register_blueprint(sas_bp, url_prefix="/api")
+    app.register_blueprint(actuarial_bp, url_prefix="/api")
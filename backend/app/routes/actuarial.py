@@ -0,0 +1,349 @@
+import hashlib, json
+import numpy as np
+import pandas as pd
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from .. import extensions
+from ..utils.decrements import ASSUMPTIONS, multiple_decrement_table, to_dependent, to_independent
+from ..utils.life_table import COLUMNS, RADIX, life_table, lx_from_qx
+from ..utils.mortality import per_sex, rate_surface
+from ..utils import scenarios
+from ..utils.tables import HMD_RATE_COLUMNS, hmd_digest, hmd_table
+from ..utils.valuation import BENEFITS, commutation_table
+from .compare import rate_source
+from .models import request_bounds
+
+bp = Blueprint("actuarial", __name__)
+
+
+def _cached(kind, source_hash, body, compute):
+    """Runs `compute` through the shared cache under the dataset version and request,
+    mapping data errors to HTTP responses."""
+    key = f"{kind}:" + hashlib.sha256(json.dumps([source_hash, body], sort_keys=True, default=str).encode()).hexdigest()
+    try:
+        return jsonify(extensions.cache.get_or_compute(key, compute))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def life_table_surface(table, sexes, years=None, radix: float = RADIX):
+    """(years, ages, life table) of every requested sex and year over all ages of `table`;
+    table columns are (sex, year, age) arrays."""
+    years, ages, m = rate_surface(table, sexes, years)
+    return years, ages, life_table(np.moveaxis(m, 1, 2), ages, sexes, radix)
+
+
+@bp.post("/life-table")
+def life_table_route():
+    """Period life tables (mx, qx, ax, lx, dx, Lx, Tx, ex) for every year and sex at once.
+    Body: datasetId (default HMD), sexes, startYear/endYear, ages (list) or startAge/endAge
+    to pick output ages, columns, radix. Tables are always built on all ages so the open
+    interval stays the last age; results are cached per dataset version.
+    """
+    body = request.get_json() or {}
+    try:
+        table, source_hash = rate_source(body)
+    except FileNotFoundError:
+        return jsonify({"error": "Dataset not found"}), 404
+    sexes = [s for s in (body.get("sexes") or HMD_RATE_COLUMNS) if s in table.column_names]
+    if not sexes:
+        return jsonify({"error": "None of the requested sexes are in the dataset"}), 400
+    columns = body.get("columns") or list(COLUMNS)
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown:
+        return jsonify({"error": f"Unknown columns {unknown}; use {list(COLUMNS)}"}), 400
+    try:
+        radix = float(body.get("radix", RADIX))
+        years_req = request_bounds(body, "startYear", "endYear")
+        bounds = request_bounds(body, "startAge", "endAge")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    ages_req = body.get("ages")
+
+    def compute():
+        years, ages, lt = life_table_surface(table, sexes, years_req, radix)
+        if not len(years):
+            raise ValueError("no years in the requested range")
+        pick = np.isin(ages, [int(a) for a in ages_req]) if ages_req else np.ones(len(ages), bool)
+        if bounds and bounds[0] is not None:
+            pick &= ages >= int(bounds[0])
+        if bounds and bounds[1] is not None:
+            pick &= ages <= int(bounds[1])
+        return {"sexes": sexes, "years": years.tolist(), "ages": ages[pick].tolist(),
+                "table": per_sex(sexes, {c: lt[c][..., pick] for c in columns})}
+
+    return _cached("lifetable", source_hash, [sexes, columns, radix, years_req, ages_req, bounds], compute)
+
+
+def _decrement_source(spec):
+    """Content hash of the table a decrement spec reads (for cache keys)."""
+    if spec.get("source") == "hmd":
+        return f"hmd:{hmd_digest()}"
+    if spec.get("datasetId"):
+        meta = extensions.datasets.meta(spec["datasetId"])
+        return meta.get("fingerprint") or f"{meta['id']}:{meta.get('created')}"
+    return None
+
+
+def _decrement_rates(spec, ages):
+    """One decrement's rates at `ages` from its spec: {"source": "hmd", "sex", "year"} (q_x of
+    that period life table), {"datasetId", "column", "ageColumn"}, {"rates": [...]} from the
+    first age on, or {"constant": q}; times an optional "scale"."""
+    if spec.get("source") == "hmd":
+        sex, year = spec.get("sex", "Total"), int(spec["year"])
+        if sex not in HMD_RATE_COLUMNS:
+            raise ValueError(f"unknown sex {sex}")
+        years, table_ages, lt = life_table_surface(hmd_table(), [sex], (year, year))
+        if not len(years):
+            raise ValueError(f"HMD has no year {year}")
+        rates = pd.Series(lt["qx"][0, 0], index=table_ages)
+    elif spec.get("datasetId"):
+        df = extensions.datasets.get(spec["datasetId"])
+        names = {str(c).lower(): c for c in df.columns}
+        age_col = names.get(str(spec.get("ageColumn", "age")).lower())
+        col = names.get(str(spec.get("column", "")).lower())
+        if age_col is None or col is None:
+            raise ValueError(f"dataset {spec['datasetId']} has no column {spec.get('column')} or age column")
+        age_index = pd.to_numeric(df[age_col].astype(str).str.rstrip("+"))
+        if age_index.duplicated().any():
+            raise ValueError(f"dataset {spec['datasetId']} has several rows per age; filter it first")
+        rates = pd.Series(pd.to_numeric(df[col]).to_numpy(dtype=float), index=age_index.to_numpy())
+    elif "rates" in spec:
+        rates = pd.Series(np.asarray(spec["rates"], dtype=float), index=ages[0] + np.arange(len(spec["rates"])))
+    elif "constant" in spec:
+        rates = pd.Series(float(spec["constant"]), index=ages)
+    else:
+        raise ValueError("a decrement needs source hmd, datasetId, rates or constant")
+    rates = rates.reindex(ages)
+    if rates.isna().any():
+        raise ValueError(f"decrement {spec.get('name')} has no rate for ages {rates.index[rates.isna()].tolist()[:10]}")
+    return rates.to_numpy() * float(spec.get("scale", 1.0))
+
+
+@bp.post("/multiple-decrement")
+def multiple_decrement():
+    """Multiple-decrement table (e.g. death, lapse, disability, retirement) with the
+    conversion between dependent and associated single-decrement rates.
+    Body: decrements [{"name", source spec (see _decrement_rates)}], rateType "independent"
+    (default) or "dependent", assumption "udd" | "constant_force", startAge/endAge, radix,
+    scenarios {name: {decrement: multiplier}} applied to the given rates. All scenarios
+    and ages are converted in one array operation; results are cached per input tables.
+    """
+    body = request.get_json() or {}
+    specs = body.get("decrements") or []
+    names = [str(d.get("name") or f"decrement_{i + 1}") for i, d in enumerate(specs)]
+    if not specs or len(set(names)) != len(names):
+        return jsonify({"error": "give one or more decrements with distinct names"}), 400
+    assumption = body.get("assumption", "udd")
+    rate_type = body.get("rateType", "independent")
+    if assumption not in ASSUMPTIONS or rate_type not in ("independent", "dependent"):
+        return jsonify({"error": f"assumption must be one of {list(ASSUMPTIONS)}, "
+                                 "rateType independent or dependent"}), 400
+    scenarios = body.get("scenarios") or {"base": {}}
+    try:
+        sources = [_decrement_source(d) for d in specs]
+    except KeyError:
+        return jsonify({"error": "Unknown dataset"}), 404
+    except FileNotFoundError:
+        return jsonify({"error": "HMD raw dataset not found"}), 404
+
+    def compute():
+        ages = np.arange(int(body.get("startAge", 0)), int(body.get("endAge", 110)) + 1)
+        if not len(ages):
+            raise ValueError("startAge must not exceed endAge")
+        base = np.stack([_decrement_rates(d, ages) for d in specs])  # (decrement, age)
+        scale = np.array([[float(scenarios[s].get(n, 1.0)) for n in names] for s in scenarios])
+        given = np.clip(base[:, None, :] * scale.T[:, :, None], 0.0, 1.0)  # (decrement, scenario, age)
+        if rate_type == "independent":
+            indep, dep = given, to_dependent(given, assumption)
+        else:
+            dep, indep = given, to_independent(given, assumption)
+        table = multiple_decrement_table(dep, float(body.get("radix", RADIX)))
+        out = {}
+        for s, scen in enumerate(scenarios):
+            out[scen] = {"independent": dict(zip(names, indep[:, s].tolist())),
+                         "dependent": dict(zip(names, dep[:, s].tolist())),
+                         "q_total": table["q_total"][s].tolist(), "lx": table["lx"][s].tolist(),
+                         "dx": dict(zip(names, table["dx"][:, s].tolist()))}
+        return {"ages": ages.tolist(), "decrements": names, "assumption": assumption, "rateType": rate_type,
+                "scenarios": out}
+
+    return _cached("decrements", sources, body, compute)
+
+
+WHOLE_LIFE_TERM = 200  # terms past the end of the table look up to 0, i.e. cover for life
+_POLICY_FIELDS = {"issueage": "age", "age": "age", "term": "term", "duration": "duration", "benefit": "benefit",
+                  "premiumterm": "premium_term", "sumassured": "sum_assured", "sex": "sex"}
+
+
+def _policies(body):
+    """Policy columns from `policies` ({column: list}) or the stored dataset
+    `policiesDatasetId`; names match case-insensitively, with or without underscores."""
+    if body.get("policiesDatasetId"):
+        raw = extensions.datasets.get(body["policiesDatasetId"])
+    else:
+        raw = pd.DataFrame(body.get("policies") or {})
+    cols = {}
+    for name in raw.columns:
+        field = _POLICY_FIELDS.get(str(name).lower().replace("_", ""))
+        if field:
+            cols[field] = raw[name].to_numpy()
+    if "age" not in cols:
+        raise ValueError("policies need an issueAge column")
+    n = len(cols["age"])
+    benefit = np.asarray(cols.get("benefit", np.full(n, "whole")), dtype=str)
+    if not np.isin(benefit, BENEFITS).all():
+        raise ValueError(f"benefit must be one of {list(BENEFITS)}")
+    term = np.asarray(cols.get("term", np.full(n, WHOLE_LIFE_TERM)), dtype=float)
+    term = np.where(np.isnan(term) | (benefit == "whole"), WHOLE_LIFE_TERM, term).astype(int)
+    if np.any((benefit != "whole") & (term <= 0)):
+        raise ValueError("term and endowment policies need a positive term")
+    premium_term = np.asarray(cols.get("premium_term", term), dtype=float)
+    premium_term = np.where(np.isnan(premium_term), term, premium_term).astype(int)
+    sexes = [str(s)[:1].upper() for s in cols.get("sex", np.full(n, "T"))]
+    sex = np.array([{"F": 0, "M": 1}.get(s, 2) for s in sexes])
+    return {"age": np.asarray(cols["age"], dtype=int), "term": term, "premium_term": premium_term,
+            "duration": np.asarray(cols.get("duration", np.zeros(n)), dtype=int), "benefit": benefit,
+            "sum_assured": np.asarray(cols.get("sum_assured", np.ones(n)), dtype=float), "sex": sex}
+
+
+def _rate_year(table, year=None) -> int:
+    years = np.unique(table.column("Year").to_numpy())
+    year = int(years[-1] if year is None else year)
+    if year not in years:
+        raise ValueError(f"no rates for year {year}")
+    return year
+
+
+def period_qx(table, year: int):
+    """(ages, q_x (sex, age)) of the Female/Male/Total period life tables of `year`."""
+    _, ages, lt = life_table_surface(table, HMD_RATE_COLUMNS, (year, year))
+    return ages, lt["qx"][:, 0]
+
+
+def commutation_for(table, source_hash, year=None, interest: float = 0.03, radix: float = RADIX,
+                    mortality_scale: float = 1.0):
+    """Cached commutation columns for the Female/Male/Total life tables of `year` (default:
+    the latest), with q_x scaled by `mortality_scale`. Returns (year, CommutationTable)."""
+    year = _rate_year(table, year)
+
+    def build():
+        ages, qx = period_qx(table, year)
+        if mortality_scale != 1.0:
+            qx = np.minimum(qx * mortality_scale, 1.0)
+            qx[..., -1] = 1.0
+        return ages, lx_from_qx(qx, radix)
+
+    return year, commutation_table((source_hash, year, radix, float(mortality_scale)), interest, build)
+
+
+@bp.post("/valuation")
+def valuation():
+    """Net premiums and prospective net premium reserves for a batch of policies.
+    Body: datasetId (mortality, default HMD), year (default latest), interest (0.03),
+    mortalityScale, and policies as columns {issueAge, term, duration, benefit
+    (whole | term | endowment), premiumTerm, sumAssured, sex} or policiesDatasetId.
+    Commutation columns are cached per life table and interest, so each request is a set
+    of array lookups; `summaryOnly` leaves out the per-policy values.
+    """
+    body = request.get_json() or {}
+    try:
+        table, source_hash = rate_source(body)
+        if not all(s in table.column_names for s in HMD_RATE_COLUMNS):
+            raise ValueError(f"mortality data needs {HMD_RATE_COLUMNS} columns")
+        pol = _policies(body)
+        year, ct = commutation_for(table, source_hash, body.get("year"), float(body.get("interest", 0.03)),
+                                   float(body.get("radix", RADIX)), float(body.get("mortalityScale", 1.0)))
+        args = dict(term=pol["term"], benefit=pol["benefit"], premium_term=pol["premium_term"], row=pol["sex"])
+        premium = ct.net_premium(pol["age"], **args) * pol["sum_assured"]
+        reserve = ct.reserve(pol["age"], pol["duration"], **args) * pol["sum_assured"]
+    except (FileNotFoundError, KeyError):
+        return jsonify({"error": "Dataset not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    out = {"year": year, "interest": ct.interest, "count": int(len(reserve)),
+           "totals": {"reserve": float(reserve.sum()), "annualPremium": float(premium.sum()),
+                      "sumAssured": float(pol["sum_assured"].sum())}}
+    if not body.get("summaryOnly"):
+        out["policies"] = {"netPremium": premium.tolist(), "reserve": reserve.tolist()}
+    return jsonify(out)
+
+
+# reference book for the sensitivity grid when the request brings no policies
+DEFAULT_PORTFOLIO = {"issueAge": [30, 40, 50, 60], "term": [20, None, 20, 10], "duration": [5, 5, 5, 5],
+                     "benefit": ["endowment", "whole", "term", "endowment"], "sex": ["T", "T", "T", "T"]}
+
+
+@bp.post("/sensitivity")
+def sensitivity():
+    """Scenario grid over shock intensity x tail type x named scenario x age-group
+    coefficients. Body: intensities (0.8-1.5), tails (轻尾/中尾/重尾), scenarios
+    (基准/疫情延续/二次爆发), ageGroups ([{"0-39": 0.5, "65+": 1.5}, ...]), interest, year,
+    datasetId, policies (default DEFAULT_PORTFOLIO; premiums are locked in on the
+    unshocked basis), format ("ndjson" or "sse").
+    Every grid point multiplies the baseline q_x of `year` by its (projection year, age)
+    shock and follows each cohort along the diagonal. Shards of points run on a process pool
+    and stream back as they finish: a "grid" line with the baseline, one "progress" line per
+    shard (points carry their grid "id", cohort e0 / e65, annuity65, reserve and
+    reserveImpact against the baseline), then "done".
+    """
+    body = request.get_json() or {}
+    cfg = current_app.config
+    try:
+        table, source_hash = rate_source(body)
+        if not all(s in table.column_names for s in HMD_RATE_COLUMNS):
+            raise ValueError(f"mortality data needs {HMD_RATE_COLUMNS} columns")
+        age_groups = body.get("ageGroups") or [{}]
+        if isinstance(age_groups, dict):
+            age_groups = [age_groups]
+        if not isinstance(age_groups, list) or not all(isinstance(g, dict) for g in age_groups):
+            raise ValueError('ageGroups must be an object or a list of objects like {"65+": 1.5}')
+        if not all(isinstance(v, (int, float, str)) and not isinstance(v, bool) for g in age_groups for v in g.values()):
+            raise ValueError("ageGroups coefficients must be numbers")
+        points = scenarios.grid(body.get("intensities") or scenarios.INTENSITIES,
+                                body.get("tails") or list(scenarios.TAILS),
+                                body.get("scenarios") or scenarios.SCENARIOS, age_groups)
+        limit = cfg["SENSITIVITY_MAX_POINTS"]
+        if not points or len(points) > limit:
+            raise ValueError(f"the grid must have 1 to {limit} points, not {len(points)}")
+        year, ct = commutation_for(table, source_hash, body.get("year"), float(body.get("interest", 0.03)))
+        ages, q_base = period_qx(table, year)
+        scenarios.multipliers(points, ages, age_groups, 1)  # unknown names or age groups fail here
+        pol = _policies({"policies": body.get("policies") or DEFAULT_PORTFOLIO,
+                         "policiesDatasetId": body.get("policiesDatasetId")})
+        attained = pol["age"] + pol["duration"]
+        policies = {"sex": pol["sex"], "benefit": pol["benefit"], "sum_assured": pol["sum_assured"],
+                    "attained": np.clip(attained - int(ages[0]), 0, len(ages) - 1),
+                    "left": np.maximum(pol["term"] - pol["duration"], 0),
+                    "pay_left": np.maximum(pol["premium_term"] - pol["duration"], 0),
+                    "premium": ct.net_premium(pol["age"], pol["term"], pol["benefit"], pol["premium_term"], pol["sex"])}
+    except (FileNotFoundError, KeyError):
+        return jsonify({"error": "Dataset not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    for n, p in enumerate(points):
+        p["id"] = n
+    (base,) = scenarios.evaluate_points(q_base, ages, [{"intensity": 1.0, "tail": "轻尾", "scenario": "基准",
+                                                        "ageGroup": 0}], [{}], ct.interest, policies)
+    sse = (body.get("format") or "").lower() == "sse"
+
+    def line(obj):
+        return f"data: {json.dumps(obj)}\n\n" if sse else json.dumps(obj) + "\n"
+
+    def generate():
+        yield line({"type": "grid", "total": len(points), "year": year, "sexes": list(HMD_RATE_COLUMNS),
+                    "ageGroups": age_groups, "baseline": {k: base[k] for k in ("e0", "e65", "annuity65", "reserve")}})
+        try:
+            for done, res in scenarios.run_grid(q_base, ages, points, age_groups, ct.interest, policies,
+                                                cfg["SENSITIVITY_SHARD"], cfg["SENSITIVITY_WORKERS"]):
+                for p in res:
+                    p["reserveImpact"] = p["reserve"] / base["reserve"] - 1.0 if base["reserve"] else None
+                yield line({"type": "progress", "done": done, "total": len(points), "points": res})
+        except Exception as e:  # a failed shard ends the stream with an error line
+            yield line({"type": "error", "error": str(e)})
+            return
+        yield line({"type": "done", "total": len(points)})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream" if sse else "application/x-ndjson",
+                    headers={"X-Total-Count": str(len(points)), "Cache-Control": "no-cache"})
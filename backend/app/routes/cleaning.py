@@ -1,21 +1,61 @@
 import hashlib, json
+import pandas as pd
 from flask import Blueprint, request, jsonify
-from ..extensions import cache
+from .. import extensions
+from ..utils.cleaning import run_pipeline
+from ..utils.dataset_store import to_records
 
 bp = Blueprint("cleaning", __name__)
 
+DEFAULT_STEPS = [{"op": "drop_null_rows"}]
+
+
 @bp.post("/clean-data")
 def clean_data():
+    """Runs a list of vectorized cleaning steps on a stored dataset.
+    Body: {"datasetId": ..., "steps": [{"op": "dedupe"}, {"op": "clip", "column": "q", "min": 0}, ...]}.
+    The result is stored as a new dataset version whose id derives from the source
+    fingerprint plus the steps, so repeating a cleaning is a lookup. A legacy inline
+    `data` payload is still accepted and cleaned without being stored.
+    """
     payload = request.get_json() or {}
-    data = payload.get("data", [])
-    opts = payload.get("options", {})
-    key = "clean:" + hashlib.sha256(json.dumps({"data": data, "opts": opts}, default=str).encode()).hexdigest()
-    if cache is not None and (cached := cache.get(key)):
-        return jsonify(json.loads(cached))
-
-    # simple cleaner: drop null-only rows
-    cleaned = [r for r in data if any(v not in (None, "", "NA") for v in r.values())]
-    result = {"rows": len(cleaned), "data": cleaned[:200]}
-    if cache is not None:
-        cache.setex(key, 3600, json.dumps(result))
-    return jsonify(result)
+    steps = payload.get("steps") or DEFAULT_STEPS
+    dsid = payload.get("datasetId")
+    store = extensions.datasets
+
+    if not dsid:
+        try:
+            cleaned, report = run_pipeline(pd.DataFrame(payload.get("data", [])), steps)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"rows": int(len(cleaned)), "data": to_records(cleaned, 200), "steps": report})
+
+    try:
+        source = store.meta(dsid)
+    except KeyError:
+        return jsonify({"error": "Unknown dataset"}), 404
+    key = hashlib.sha256(json.dumps({"source": source.get("fingerprint") or dsid, "steps": steps},
+                                    sort_keys=True, default=str).encode()).hexdigest()
+    out_id = f"clean-{key[:32]}"
+
+    cached = store.exists(out_id)
+    if cached:
+        cleaned, report = store.get(out_id), store.meta(out_id).get("report", [])
+    else:
+        try:
+            cleaned, report = run_pipeline(store.get(dsid), steps)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        store.put(cleaned, f"{source.get('name')} (cleaned)", id=out_id, parent=dsid, steps=steps,
+                  report=report, version=int(source.get("version", 1)) + 1)
+        extensions.lineage.record("clean", {dsid: source.get("fingerprint")},
+                                  {out_id: store.meta(out_id)["fingerprint"]}, {"steps": steps})
+
+    return jsonify({
+        "id": out_id,
+        "parent": dsid,
+        "cached": cached,
+        "rows": int(len(cleaned)),
+        "data": to_records(cleaned, 200),
+        "steps": report
+    })
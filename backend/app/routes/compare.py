@@ -1,64 +1,313 @@
-import numpy as np, io, zipfile, json
-import pandas as pd
-from flask import Blueprint, request, jsonify, send_file
+import numpy as np, json, hashlib, warnings
+import pyarrow as pa
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from .. import extensions
+from ..utils.backtest import BACKTEST_MODELS, MIN_TRAIN_YEARS, origin_years, run_backtest
+from ..utils.comparison import COMPARABLE_MODELS, METRICS, common_mask, rank, run_parallel
+from ..utils.export import chart_entries, csv_chunks, json_chunks, stream_zip, table_chunks
+from ..utils.lineage import fingerprint
+from ..utils.mortality import jsonable, rate_surface
+from ..utils.simulation import FAN_LEVELS, iter_fan_quantiles, iter_index_paths, rw_drift
+from ..utils.tables import frame_rate_table, hmd_digest, hmd_table
+from .models import (DEFAULT_AGES, FORECAST_FACTORS, MAX_HORIZON, MAX_SIMULATIONS, find_model, forecast_factors,
+                     request_bounds)
 
 bp = Blueprint("compare", __name__)
 
-_RESULTS = {}
+DEFAULT_HOLDOUT = 10
+BACKTEST_HORIZON = 10
+MAX_BACKTEST_HORIZON = 30
+
+
+def _items(body):
+    """[(model id, options)] for the requested items (ids, names or {"id"/"name", ...})."""
+    out = []
+    for it in body.get("items") or COMPARABLE_MODELS:
+        key = (it.get("id") or it.get("name")) if isinstance(it, dict) else it
+        model = find_model(key)
+        if model is None or model["id"] not in COMPARABLE_MODELS:
+            raise ValueError(f"{key} cannot be compared")
+        options = {k: v for k, v in it.items() if k not in ("id", "name")} if isinstance(it, dict) else {}
+        if "minCohortCells" in options:
+            try:
+                options["minCohortCells"] = int(options["minCohortCells"])
+            except (TypeError, ValueError):
+                raise ValueError("minCohortCells must be an integer") from None
+        out.append((model["id"], options))
+    return out
+
+
+def rate_source(body):
+    """(Arrow rate table, fingerprint) of the dataset to compare on: datasetId or HMD."""
+    dsid = body.get("datasetId")
+    if not dsid:
+        return hmd_table(), hmd_digest()
+    store = extensions.datasets
+    try:
+        meta = store.meta(dsid)
+    except KeyError:
+        raise FileNotFoundError(dsid) from None
+    return frame_rate_table(store.get(dsid)), meta.get("fingerprint") or f"{dsid}:{meta.get('created')}"
+
 
 @bp.post("/compare")
 def compare():
+    """Fits the requested models on one rate surface concurrently and compares AIC, BIC,
+    residual autocorrelation, MAPE and out-of-sample error on the last `holdout` years.
+    The summary ranks models by AIC + 100 * |residual autocorrelation|.
+    """
     body = request.get_json() or {}
-    items = body.get("items", [])
-    metrics = body.get("metrics", ["AIC","BIC","Residual"])
+    metrics = body.get("metrics") or list(METRICS)
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        return jsonify({"error": f"Unknown metrics {unknown}; use {list(METRICS)}"}), 400
+    try:
+        items = _items(body)
+        ages_req = request_bounds(body, "startAge", "endAge")
+        years_req = request_bounds(body, "startYear", "endYear")
+        holdout = int(body["holdout"]) if body.get("holdout") not in (None, "") else None
+        table, source_hash = rate_source(body)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Dataset not found"}), 404
+
+    # models with an age range of their own are compared on the common one
+    ranges = [DEFAULT_AGES[mid] for mid, _ in items if mid in DEFAULT_AGES]
+    default_ages = (max(r[0] for r in ranges), min(r[1] for r in ranges)) if ranges else None
+    ages_req = ages_req or default_ages
+    sexes = [s for s in (body.get("sexes") or ["Total"]) if s in table.column_names]
+    if not sexes:
+        return jsonify({"error": "None of the requested sexes are in the dataset"}), 400
+    years, ages, m = rate_surface(table, sexes, years_req, ages_req)
+    if len(years) < 3 or not len(ages):
+        return jsonify({"error": "need at least 3 years and one age"}), 400
+    if holdout is None:
+        holdout = min(DEFAULT_HOLDOUT, len(years) // 5)
 
+    cfg = current_app.config
+    key = "compare:" + hashlib.sha256(json.dumps(
+        [source_hash, items, sexes, years.tolist(), ages.tolist(), holdout], sort_keys=True).encode()).hexdigest()
+    results = extensions.cache.get(key)
+    if results is None:
+        mask = common_mask(items, ages, years)  # AIC etc. over the same cells for every model
+        jobs = {str(i): (mid, m, ages, years, holdout, options, mask) for i, (mid, options) in enumerate(items)}
+        results = jsonable(run_parallel(jobs, cfg["COMPARE_TIMEOUT"], cfg["COMPARE_WORKERS"]))
+        if not any("error" in r for r in results.values()):
+            extensions.cache.set(key, results)
+
+    names = [find_model(mid)["name"] + (" (Makeham)" if options.get("makeham") else "") for mid, options in items]
     res = {"items": [], "metrics": {m: [] for m in metrics}, "details": [], "visualizations": []}
-    for idx, it in enumerate(items or ["Model A","Model B","Model C"]):
-        name = it.get("name") if isinstance(it, dict) else str(it)
-        res["items"].append({"id": idx, "name": name, "type": "Model"})
-        for m in metrics:
-            res["metrics"][m].append(float(np.random.uniform(0, 1)))
-        res["details"].append({"itemId": idx, "itemName": name, "itemType": "Model", "data": {"note": "mock"}})
-
-    for m in metrics:
+    for idx, (mid, options) in enumerate(items):
+        out = results[str(idx)]
+        res["items"].append({"id": idx, "name": names[idx], "type": "Model", "model": mid})
+        for metric in metrics:
+            value = out.get(METRICS[metric])
+            agg = np.sum if metric in ("AIC", "BIC") else np.mean
+            res["metrics"][metric].append(float(agg(value)) if value is not None else None)
+        detail = {k2: (dict(zip(sexes, v)) if isinstance(v, list) else v) for k2, v in out.items()}
+        res["details"].append({"itemId": idx, "itemName": names[idx], "itemType": "Model",
+                               "data": {**detail, "options": options}})
+
+    for metric in metrics:
+        res["visualizations"].append({
+            "title": f"{metric} Comparison",
+            "data": [{"x": [i["name"] for i in res["items"]], "y": res["metrics"][metric], "type": "bar", "name": metric}],
+            "layout": {"title": f"{metric} Values Across Items", "xaxis": {"title": "Items"}, "yaxis": {"title": metric}}
+        })
+    res["summary"] = rank((mid, names[i], results[str(i)]) for i, (mid, _) in enumerate(items))
+    res["data"] = {"datasetId": body.get("datasetId"), "sexes": sexes, "years": [int(years[0]), int(years[-1])],
+                   "ages": [int(ages[0]), int(ages[-1])], "holdout": holdout}
+
+    rid = extensions.results.put(res, "result")
+    source = body.get("datasetId") or f"hmd:{source_hash}"
+    extensions.lineage.record("compare", {source: source_hash}, [rid],
+                              {k: res["data"][k] for k in ("sexes", "years", "ages", "holdout")} | {"items": items})
+    return jsonify({"resultId": rid, "results": res})
+
+
+def _matrix(a):
+    """Nested lists with NaN (horizons past the data) as null."""
+    return [[None if np.isnan(v) else float(v) for v in row] for row in np.asarray(a)]
+
+
+@bp.post("/backtest")
+def backtest():
+    """Rolling-origin backtest (回溯测试矩阵): refits every model up to each origin year and
+    scores its 1..horizon-step drift projections, giving origin x horizon RMSE (ln m) and
+    MAPE matrices per model and sex. Body: items (lee-carter, cbd, apc), sexes,
+    startYear/endYear, startAge/endAge, horizon, origins (count), step, window (rolling
+    window length; omitted = expanding). Blocks of origins run on a process pool.
+    """
+    body = request.get_json() or {}
+    try:
+        items = _items({"items": body.get("items") or BACKTEST_MODELS})
+        if any(mid not in BACKTEST_MODELS for mid, _ in items):
+            raise ValueError(f"backtests support {list(BACKTEST_MODELS)}")
+        horizon = min(max(int(body.get("horizon", BACKTEST_HORIZON)), 1), MAX_BACKTEST_HORIZON)
+        window = int(body["window"]) if body.get("window") else None
+        if window is not None and window < MIN_TRAIN_YEARS:
+            raise ValueError(f"window must be at least {MIN_TRAIN_YEARS} years")
+        n_origins, step = int(body.get("origins", 30)), int(body.get("step", 1))
+        ages_req = request_bounds(body, "startAge", "endAge")
+        years_req = request_bounds(body, "startYear", "endYear")
+        table, source_hash = rate_source(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Dataset not found"}), 404
+
+    ranges = [DEFAULT_AGES[mid] for mid, _ in items if mid in DEFAULT_AGES]
+    default_ages = (max(r[0] for r in ranges), min(r[1] for r in ranges)) if ranges else None
+    ages_req = ages_req or default_ages
+    sexes = [s for s in (body.get("sexes") or ["Total"]) if s in table.column_names]
+    if not sexes:
+        return jsonify({"error": "None of the requested sexes are in the dataset"}), 400
+    years, ages, m = rate_surface(table, sexes, years_req, ages_req)
+    origins = origin_years(years, horizon, n_origins, window, step)
+    if not len(ages) or not len(origins):
+        return jsonify({"error": "not enough years for a backtest"}), 400
+
+    cfg = current_app.config
+    key = "backtest:" + hashlib.sha256(json.dumps(
+        [source_hash, items, sexes, years.tolist(), ages.tolist(), origins.tolist(), horizon, window],
+        sort_keys=True).encode()).hexdigest()
+    results = extensions.cache.get(key)
+    if results is None:
+        raw = run_backtest([mid for mid, _ in items], m, ages, years, origins, horizon, window,
+                           {mid: options for mid, options in items}, cfg["COMPARE_WORKERS"])
+        results = {mid: r if "error" in r else {k: {sex: _matrix(v[s]) for s, sex in enumerate(sexes)}
+                                                 for k, v in r.items()} for mid, r in raw.items()}
+        if not any("error" in r for r in results.values()):
+            extensions.cache.set(key, results)
+
+    horizons = list(range(1, horizon + 1))
+    res = {"origins": origins.tolist(), "horizons": horizons, "models": {}, "visualizations": [],
+           "data": {"datasetId": body.get("datasetId"), "sexes": sexes, "years": [int(years[0]), int(years[-1])],
+                    "ages": [int(ages[0]), int(ages[-1])], "window": window}}
+    for mid, _ in items:
+        out = results[mid]
+        name = find_model(mid)["name"]
+        if "error" in out:
+            res["models"][mid] = {"name": name, "error": out["error"]}
+            continue
+        mape = np.array(out["mape"][sexes[0]], dtype=float)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            by_h = np.nanmean(mape, axis=0)
+        res["models"][mid] = {"name": name, **out, "meanMape": [None if np.isnan(v) else float(v) for v in by_h]}
         res["visualizations"].append({
-            "title": f"{m} Comparison",
-            "data": [{"x": [i["name"] for i in res["items"]], "y": res["metrics"][m], "type": "bar", "name": m}],
-            "layout": {"title": f"{m} Values Across Items", "xaxis": {"title": "Items"}, "yaxis": {"title": m}}
+            "title": f"{name} MAPE (%)",
+            "data": [{"z": out["mape"][sexes[0]], "x": horizons, "y": res["origins"], "type": "heatmap",
+                      "colorscale": "YlOrRd"}],
+            "layout": {"title": f"{name}: {sexes[0]} MAPE by origin and horizon",
+                       "xaxis": {"title": "Horizon (years)"}, "yaxis": {"title": "Origin year"}}
         })
 
-    rid = f"result_{len(_RESULTS)}"
-    _RESULTS[rid] = res
+    rid = extensions.results.put(res, "backtest")
+    source = body.get("datasetId") or f"hmd:{source_hash}"
+    extensions.lineage.record("backtest", {source: source_hash}, [rid],
+                              {"items": items, "origins": len(origins), "horizon": horizon, "window": window})
     return jsonify({"resultId": rid, "results": res})
 
+
+def _forecast_entries(results, spec, ext):
+    """Lazily generated (name, chunks) entries with each forecastable model's fan-chart
+    quantiles and, with spec["paths"], every simulated period-index path."""
+    data = results.get("data") or {}
+    table, _ = rate_source({"datasetId": data.get("datasetId")})
+    sexes = data.get("sexes") or ["Total"]
+    years, ages, m = rate_surface(table, sexes, tuple(data["years"]), tuple(data["ages"]))
+    horizon = min(max(int(spec.get("horizon", 10)), 1), MAX_HORIZON)
+    n_paths = min(max(int(spec.get("n_simulations", 1000)), 10), MAX_SIMULATIONS)
+    levels = sorted({int(l) for l in spec.get("levels") or FAN_LEVELS if 0 < int(l) < 100})
+    seed = int(spec["seed"]) if spec.get("seed") is not None else int(np.random.SeedSequence().entropy % 2 ** 63)
+    future = np.arange(int(years[-1]) + 1, int(years[-1]) + 1 + horizon)
+    cfg = current_app.config
+    manifest = {"seed": seed, "horizon": horizon, "n_simulations": n_paths, "levels": levels,
+                "sexes": sexes, "years": future.tolist(), "ages": ages.tolist(), "files": []}
+    entries = []
+
+    for mid in dict.fromkeys(item.get("model") for item in results["items"]):
+        if mid not in FORECAST_FACTORS:
+            continue
+        for s, (alpha, loadings, k_hist, link) in enumerate(forecast_factors(mid, m, ages)):
+            sex, sim_seed = sexes[s], [seed, s]
+
+            def fan(alpha=alpha, loadings=loadings, k_hist=k_hist, link=link, sim_seed=sim_seed):
+                quantiles = iter_fan_quantiles(alpha, loadings, k_hist, horizon, n_paths, sim_seed, levels, link,
+                                               cfg["SIM_MEMORY_MB"])
+                for year, q in zip(future, quantiles):
+                    cols = {"year": np.full(len(ages), year), "age": ages, "median": q["median"]}
+                    for lvl in levels:
+                        cols[f"lower_{lvl}"] = q["bands"][str(lvl)]["lower"]
+                        cols[f"upper_{lvl}"] = q["bands"][str(lvl)]["upper"]
+                    yield pa.RecordBatch.from_pydict(cols)
+
+            def paths(k_hist=k_hist, sim_seed=sim_seed, names=FORECAST_FACTORS[mid]):
+                k = np.asarray(k_hist, dtype=float).reshape(len(k_hist), -1)
+                drift, cov = rw_drift(k)
+                for lo, block in iter_index_paths(k[-1], drift, cov, horizon, n_paths, sim_seed):
+                    n = len(block)
+                    cols = {"path": np.repeat(np.arange(lo, lo + n), horizon), "year": np.tile(future, n)}
+                    for f, name in enumerate(names):
+                        cols[name] = block[:, :, f].ravel()
+                    yield pa.RecordBatch.from_pydict(cols)
+
+            name = f"forecasts/{mid}_{sex}"
+            entries.append((f"{name}_fan.{ext}", table_chunks(fan(), ext)))
+            if spec.get("paths"):
+                entries.append((f"{name}_paths.{ext}", table_chunks(paths(), ext)))
+    manifest["files"] = [name for name, _ in entries]
+    return [("forecasts/manifest.json", json_chunks(manifest))] + entries
+
+
 @bp.post("/export-comparison")
 def export_comparison():
-    rid = (request.get_json() or {}).get("resultId")
-    if not rid or rid not in _RESULTS:
+    """Streams the comparison as a ZIP: summary.csv, details.json, one offline chart per
+    metric (sharing one plotly.min.js when Plotly is installed) and, if `forecast` is given
+    ({"horizon", "n_simulations", "seed", "levels", "format": "csv" | "parquet",
+    "paths": bool}), per-model forecast tables. Entries are
+    generated while the response is sent, so memory stays flat for large path exports.
+    """
+    body = request.get_json() or {}
+    rid = body.get("resultId")
+    results = extensions.results.get(rid) if rid else None
+    if results is None:
         return jsonify({"error": "Invalid result ID"}), 400
-    results = _RESULTS[rid]
-
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w") as z:
-        summary_df = pd.DataFrame({"Item": [x['name'] for x in results['items']], **{m: v for m, v in results['metrics'].items()}})
-        z.writestr("summary.csv", summary_df.to_csv(index=False))
-        z.writestr("details.json", json.dumps(results['details'], indent=2))
-        for i, viz in enumerate(results['visualizations']):
-            html = f"""
-            <!DOCTYPE html><html><head>
-            <script src='https://cdn.plot.ly/plotly-2.24.1.min.js'></script>
-            </head><body><div id='c' style='width:800px;height:600px;'></div>
-            <script>Plotly.newPlot('c', {json.dumps(viz['data'])}, {json.dumps(viz['layout'])});</script>
-            </body></html>"""
-            z.writestr(f"chart_{i+1}.html", html)
-    buf.seek(0)
-    return send_file(buf, mimetype="application/zip", as_attachment=True, download_name=f"comparison_{rid}.zip")
+    if "metrics" not in results:  # e.g. a backtest matrix
+        return jsonify({"error": "Only model comparison results can be exported"}), 400
+
+    metrics = results["metrics"]
+    names = [x["name"] for x in results["items"]]
+    entries = [
+        ("summary.csv", csv_chunks(["Item", *metrics], ([n, *(metrics[k][i] for k in metrics)]
+                                                       for i, n in enumerate(names)))),
+        ("details.json", json_chunks(results["details"])),
+    ]
+    entries += chart_entries(results["visualizations"])
+
+    spec = body.get("forecast")
+    if spec:
+        ext = spec.get("format", "csv")
+        if ext not in ("csv", "parquet"):
+            return jsonify({"error": "format must be csv or parquet"}), 400
+        try:
+            entries += _forecast_entries(results, spec, ext)
+        except FileNotFoundError:
+            return jsonify({"error": "Dataset not found"}), 404
+        except (KeyError, ValueError) as e:
+            return jsonify({"error": f"Cannot forecast this comparison: {e}"}), 400
+
+    return Response(stream_with_context(stream_zip(entries)), mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename=comparison_{rid}.zip"})
+
 
 @bp.post("/save-comparison")
 def save_comparison():
     payload = (request.get_json() or {}).get("results")
     if not payload:
         return jsonify({"error": "No results provided"}), 400
-    rid = f"saved_{len(_RESULTS)}"
-    _RESULTS[rid] = payload
+    rid = extensions.results.put(payload, "saved")
+    extensions.lineage.record("save_comparison", outputs={rid: fingerprint(payload)})
     return jsonify({"status": "success", "resultId": rid})
@@ -1,10 +1,64 @@
-from flask import Blueprint, jsonify, request
-from ..utils.sas_runner import run_sas_or_mock
+from flask import Blueprint, Response, current_app, jsonify, request
+from .. import extensions
+from ..utils.sas_runner import QueueFull
 from ..utils.audit import audit_log
-import os, csv
+from ..utils.tables import HMD_FILE, load_csv, load_hmd, select
+import os, json
 
 bp = Blueprint("sources", __name__)
 
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 10000
+MAX_STREAM_ROWS = 1000000  # per NDJSON response; continue from X-Next-Cursor
+STREAM_CHUNK_ROWS = 5000
+
+
+def _range(body, lo_key, hi_key):
+    lo, hi = body.get(lo_key), body.get(hi_key)
+    if lo in (None, "") and hi in (None, ""):
+        return None
+    return (None if lo in (None, "") else float(lo), None if hi in (None, "") else float(hi))
+
+
+def _serve_table(table, body, source, table_meta):
+    """Filters/projects the source table, then returns one page as JSON or the selection
+    as NDJSON (`format: "ndjson"`, at most MAX_STREAM_ROWS rows), streamed in record batches.
+    """
+    stream = (body.get("format") or "").lower() == "ndjson"
+    try:
+        years, ages = _range(body, "startYear", "endYear"), _range(body, "startAge", "endAge")
+        offset = max(int(body.get("cursor") or body.get("offset") or 0), 0)
+        limit = int(body.get("limit") or (MAX_STREAM_ROWS if stream else DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "cursor, offset, limit and the year/age bounds must be numbers"}), 400
+    sel = select(table, columns=body.get("columns"), years=years, ages=ages)
+    total = sel.num_rows
+    audit_log(f"{source}_FETCH", {"rows": total, "offset": offset, "stream": stream})
+
+    if stream:
+        page = sel.slice(offset, max(min(limit, MAX_STREAM_ROWS), 0))
+        end = offset + page.num_rows
+        headers = {"X-Total-Count": str(total)}
+        if end < total:
+            headers["X-Next-Cursor"] = str(end)
+
+        def generate():
+            for batch in page.to_batches(max_chunksize=STREAM_CHUNK_ROWS):
+                yield "".join(json.dumps(r) + "\n" for r in batch.to_pylist())
+
+        return Response(generate(), mimetype="application/x-ndjson", headers=headers)
+
+    limit = max(min(limit, MAX_PAGE_SIZE), 0)
+    page = sel.slice(offset, limit)
+    end = offset + page.num_rows
+    return jsonify({
+        "data": page.to_pylist(),
+        "tables": [table_meta],
+        "metadata": {"source": source, "rows": total, "columns": sel.column_names},
+        "page": {"offset": offset, "limit": limit, "total": total,
+                 "nextCursor": str(end) if end < total else None}
+    })
+
 @bp.post("/fetch-data")
 def fetch_data():
     body = request.get_json() or {}
@@ -30,82 +84,50 @@ def fetch_data():
     # 2. MOCK CDC placeholder
     # ------------------------------
     elif source == "CDC":
-        run_sas_or_mock("/* pretend to query CDC */")
+        # runs as a SAS job; poll /sas-jobs/<jobId> for the output datasets
+        try:
+            job = extensions.sas_jobs.submit("/* pretend to query CDC */")
+        except QueueFull as e:
+            return jsonify({"error": str(e)}), 503
         return jsonify({
             "data": [],
             "tables": [],
-            "metadata": {"source": "CDC (mock)"}
+            "metadata": {"source": "CDC (mock)", "jobId": job["id"], "status": job["status"]}
         })
 
     # ------------------------------
     # 3. SOA case (demo → CDC raw)
     # ------------------------------
     elif source == "SOA_CASE":
-        path = os.path.join(os.getcwd(), "data", "CDC_raw_data.csv")
+        path = os.path.join(current_app.config["DATA_DIR"], "CDC_raw_data.csv")
         if not os.path.exists(path):
             return jsonify({"error": "SOA case dataset not found"}), 404
 
-        rows = []
-        with open(path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                rows.append(r)
-
-        audit_log("SOA_CASE_FETCH", {"rows": len(rows)})
-        return jsonify({
-            "data": rows[:500],
-            "tables": [{"value": "soa_case", "label": "SOA Case (CDC raw)"}],
-            "metadata": {"source": "SOA_CASE"}
-        })
+        table = load_csv(path, current_app.config["CACHE_DIR"])
+        return _serve_table(table, body, "SOA_CASE", {"value": "soa_case", "label": "SOA Case (CDC raw)"})
 
     # ------------------------------
     # 4. CDC raw data (official)
     # ------------------------------
     elif source == "CDC_RAW":
-        path = os.path.join(os.getcwd(), "data", "CDC_raw_data.csv")
+        path = os.path.join(current_app.config["DATA_DIR"], "CDC_raw_data.csv")
         if not os.path.exists(path):
             return jsonify({"error": "CDC raw dataset not found"}), 404
 
-        rows = []
-        with open(path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                rows.append(r)
-
-        audit_log("CDC_RAW_FETCH", {"rows": len(rows)})
-        return jsonify({
-            "data": rows[:500],
-            "tables": [{"value": "cdc_raw", "label": "CDC Raw Dataset"}],
-            "metadata": {"source": "CDC_RAW"}
-        })
+        table = load_csv(path, current_app.config["CACHE_DIR"])
+        return _serve_table(table, body, "CDC_RAW", {"value": "cdc_raw", "label": "CDC Raw Dataset"})
 
     # ------------------------------
     # 5. HMD raw data (official)
     # ------------------------------
     elif source == "HMD_RAW":
-        path = os.path.join(os.getcwd(), "data", "HMD_raw_data.txt")
+        path = os.path.join(current_app.config["DATA_DIR"], HMD_FILE)
         if not os.path.exists(path):
             return jsonify({"error": "HMD raw dataset not found"}), 404
 
-        rows = []
-        with open(path, "r", encoding="utf-8") as f:
-            headers = None
-            for line in f:
-                parts = line.strip().split()
-                if not parts:
-                    continue
-                # first non-comment line = headers
-                if headers is None:
-                    headers = parts
-                    continue
-                rows.append(dict(zip(headers, parts)))
-
-        audit_log("HMD_RAW_FETCH", {"rows": len(rows)})
-        return jsonify({
-            "data": rows[:500],
-            "tables": [{"value": "hmd_raw", "label": "HMD Raw Dataset"}],
-            "metadata": {"source": "HMD_RAW"}
-        })
+        # parsed once per file content, then served from a memory-mapped Arrow cache
+        table = load_hmd(path, current_app.config["CACHE_DIR"])
+        return _serve_table(table, body, "HMD_RAW", {"value": "hmd_raw", "label": "HMD Raw Dataset"})
 
     # ------------------------------
     # Unsupported
@@ -1,69 +1,196 @@
-import os, csv, io, json
+import os
+from contextlib import contextmanager
 from uuid import uuid4
 from flask import Blueprint, current_app, jsonify, request
 import pandas as pd
+import pyarrow as pa
+from .. import extensions
 from ..utils.audit import audit_log
+from ..utils.dataset_store import FILE_PREFIX, to_records
+from ..utils.lineage import fingerprint
+from ..utils.query import parse_filters, run_query
+from ..utils.ingest import (CSV_EXTENSIONS, PARQUET_EXTENSIONS, CHUNK_ROWS, chunked_column_stats, concat_frames,
+                            iter_upload, optimize_dtypes, read_upload)
 
 bp = Blueprint("datasets", __name__)
 
-_DATASETS = {}
+
+def resolve_dataset(dsid=None):
+    """Id of the dataset a request targets: `dsid`, or the latest upload (None if there is
+    none) when it is missing or "main". Raises KeyError for unknown ids."""
+    store = extensions.datasets
+    if dsid and dsid != "main":
+        if not store.exists(dsid):
+            raise KeyError(dsid)
+        return dsid
+    items = store.list()
+    return items[-1]["id"] if items else None
+
 
 @bp.get("/datasets")
 def list_datasets():
+    store = extensions.datasets
     items = []
-    for k, v in _DATASETS.items():
-        items.append({"id": k, "name": v.get("name"), "size": f"{len(v['data'])} rows"})
+    for m in store.list():
+        items.append({"id": m["id"], "name": m.get("name"), "size": f"{m['rows']} rows"})
     # also scan folder
-    folder = current_app.config["DATASETS_DIR"]
-    for fname in os.listdir(folder):
-        if fname.lower().endswith((".csv", ".parquet")):
-            items.append({"id": f"file::{fname}", "name": fname, "size": "on disk"})
+    for fname in store.files():
+        items.append({"id": f"{FILE_PREFIX}{fname}", "name": fname, "size": "on disk"})
     return jsonify({"datasets": items})
 
+
+@bp.get("/datasets/<path:dsid>")
+def get_dataset(dsid):
+    store = extensions.datasets
+    try:
+        df = store.get(dsid)
+        meta = store.meta(dsid)
+    except KeyError:
+        return jsonify({"error": "Unknown dataset"}), 404
+    return jsonify({**meta, "rows": int(len(df)), "columns": [str(c) for c in df.columns],
+                    "data": to_records(df, 200)})
+
+
+# parse errors of an upload, and columns Parquet cannot store
+INGEST_ERRORS = (ValueError, TypeError, pd.errors.ParserError, pa.ArrowException, OSError)
+
+
+@contextmanager
+def _saved_upload(f):
+    """Streams an uploaded file to disk and yields its path, removing it afterwards.
+    Raises ValueError for unsupported file types."""
+    ext = os.path.splitext(f.filename or "")[1].lower()
+    if ext not in CSV_EXTENSIONS + PARQUET_EXTENSIONS:
+        raise ValueError(f"Unsupported file type {ext or f.filename}")
+    upload_dir = os.path.join(current_app.config["DATASETS_DIR"], ".uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, f"{uuid4()}{ext}")
+    try:
+        f.save(path)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _read_request_file(f):
+    """Ingests an uploaded file: (DataFrame, None) or (None, error response)."""
+    try:
+        with _saved_upload(f) as path:
+            return read_upload(path, f.filename), None
+    except INGEST_ERRORS as e:
+        return None, (jsonify({"error": f"Could not read {f.filename}: {e}"}), 400)
+
+
 @bp.post("/upload-custom-data")
 def upload_custom():
+    """Stores an uploaded CSV/Parquet file. It is parsed in chunks that go straight into
+    the dataset's Parquet file (DatasetStore.put_chunks); the response statistics are
+    gathered from the stored table chunk by chunk as well."""
     if "file" not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
     f = request.files["file"]
-    df = pd.read_csv(f) if f.filename.lower().endswith(".csv") else pd.DataFrame()
-    dsid = str(uuid4())
-    _DATASETS[dsid] = {"name": f.filename, "data": df.to_dict(orient="records")}
-    audit_log("CUSTOM_DATA_UPLOAD", {"rows": len(_DATASETS[dsid]["data"])})
+    store = extensions.datasets
+    try:
+        with _saved_upload(f) as path:
+            dsid = store.put_chunks(iter_upload(path, f.filename), f.filename)
+    except INGEST_ERRORS as e:
+        return jsonify({"error": f"Could not read {f.filename}: {e}"}), 400
+
+    meta = store.meta(dsid)
+    stats = chunked_column_stats(store.iter_chunks(dsid, CHUNK_ROWS))
+    preview = next(store.iter_chunks(dsid, 200), pd.DataFrame())
+    extensions.lineage.record("upload", outputs={dsid: meta["fingerprint"]},
+                              params={"filename": f.filename, "rows": meta["rows"]})
+    audit_log("CUSTOM_DATA_UPLOAD", {"rows": meta["rows"]})
     return jsonify({
         "id": dsid,
-        "data": _DATASETS[dsid]["data"][:200],
+        "data": to_records(preview, 200),
         "tables": [{"value": "main", "label": "Main Table"}],
-        "metadata": {"source": "custom"}
+        "metadata": {"source": "custom", "rows": meta["rows"], "columns": stats,
+                     "bytes": int(sum(c["bytes"] for c in stats))}
     })
 
+
+@bp.post("/datasets/<path:dsid>/append")
+def append_rows(dsid):
+    """Appends rows (uploaded file or JSON `data`) as a new version of a stored dataset.
+    The new version records its parent and `baseRows`, so derived results such as
+    report statistics only have to fold in the appended rows.
+    """
+    store = extensions.datasets
+    if dsid.startswith(FILE_PREFIX) or not store.exists(dsid):
+        return jsonify({"error": "Unknown dataset"}), 404
+    if "file" in request.files:
+        delta, error = _read_request_file(request.files["file"])
+        if error:
+            return error
+    else:
+        delta = optimize_dtypes(pd.DataFrame((request.get_json(silent=True) or {}).get("data") or []))
+    if delta.empty:
+        return jsonify({"error": "No rows to append"}), 400
+
+    base, meta = store.get(dsid), store.meta(dsid)
+    missing = [c for c in base.columns if c not in delta.columns]
+    if missing or len(delta.columns) != len(base.columns):
+        return jsonify({"error": f"Columns must match {[str(c) for c in base.columns]}"}), 400
+    try:
+        df = concat_frames([base.copy(), delta[base.columns]])
+        new_id = store.put(df, meta.get("name"), parent=dsid, version=int(meta.get("version", 1)) + 1,
+                           baseRows=int(len(base)), appendedRows=int(len(delta)))
+    except (ValueError, TypeError, pa.ArrowException) as e:
+        return jsonify({"error": f"Could not append the rows: {e}"}), 400
+    extensions.lineage.record("append", {dsid: meta.get("fingerprint")}, {new_id: store.meta(new_id)["fingerprint"]},
+                              {"appendedRows": int(len(delta)), "appendedFingerprint": fingerprint(delta)})
+    audit_log("DATASET_APPEND", {"parent": dsid, "id": new_id, "rows": int(len(delta))})
+    return jsonify({"id": new_id, "parent": dsid, "rows": int(len(df)), "appendedRows": int(len(delta))})
+
+
 @bp.post("/apply-filters")
 def apply_filters():
+    """Filters a stored dataset with vectorized predicates.
+    Body: table/datasetId, fields, filters {col: [in-list] | {"min", "max", "in"}},
+    startYear/endYear, optional offset/limit.
+    """
     body = request.get_json() or {}
-    table = body.get("table")
+    table = body.get("datasetId") or body.get("table")
     fields = body.get("fields", [])
-    start_year = int(body.get("startYear", 0) or 0)
-    end_year = int(body.get("endYear", 9999) or 9999)
 
-    # choose first in-memory dataset if table == 'main'
-    ds = next(iter(_DATASETS.values()), None)
-    rows = ds["data"] if ds else []
+    # the named dataset, or the latest upload if table == 'main'
+    try:
+        dsid = resolve_dataset(table)
+    except KeyError:
+        return jsonify({"error": "Unknown dataset"}), 404
+    if not dsid:
+        return jsonify({"filteredData": []})
+
+    try:
+        offset = max(int(body.get("offset") or 0), 0)
+        limit = int(body["limit"]) if body.get("limit") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    store = extensions.datasets
+    df = store.get(dsid)
+    try:
+        rows = run_query(df, parse_filters(body), lambda col: store.index(dsid, col))
+    except KeyError as e:
+        return jsonify({"error": f"Unknown column {e.args[0]}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
 
-    # filter basic year column if present
-    def in_range(r):
-        y = r.get("year") or r.get("Year") or r.get("YEAR")
-        try:
-            y = int(y)
-        except Exception:
-            return True
-        return start_year <= y <= end_year
+    total = len(rows)
+    rows = rows[offset:] if limit is None else rows[offset:offset + max(limit, 0)]
+    cols = [c for c in df.columns if c in fields] if fields else list(df.columns)
+    return jsonify({"filteredData": to_records(df.iloc[rows][cols]), "total": int(total)})
 
-    filtered = [ {k:v for k,v in r.items() if (not fields or k in fields)} for r in rows if in_range(r) ]
-    return jsonify({"filteredData": filtered})
 
 @bp.post("/get-table-fields")
 def get_table_fields():
-    ds = next(iter(_DATASETS.values()), None)
-    if not ds:
+    try:
+        dsid = resolve_dataset((request.get_json(silent=True) or {}).get("table"))
+    except KeyError:
+        return jsonify({"error": "Unknown dataset"}), 404
+    if not dsid:
         return jsonify({"fields": []})
-    headers = list((ds["data"][0] or {}).keys()) if ds["data"] else []
+    headers = [str(c) for c in extensions.datasets.get(dsid).columns]
     return jsonify({"fields": [{"value": h, "label": h} for h in headers]})
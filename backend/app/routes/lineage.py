@@ -0,0 +1,18 @@
+from flask import Blueprint, request, jsonify
+from .. import extensions
+
+bp = Blueprint("lineage", __name__)
+
+
+@bp.get("/lineage/<path:node>")
+def lineage(node):
+    """Ancestry of a dataset id, result id or content hash: the operations that produced
+    it and, recursively, its inputs (nearest first). `?depth=` limits how far to walk."""
+    try:
+        depth = min(max(int(request.args.get("depth", 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "depth must be an integer"}), 400
+    records = extensions.lineage.ancestry(node, depth)
+    if not records:
+        return jsonify({"error": "No lineage recorded"}), 404
+    return jsonify({"node": node, "records": records})
@@ -1,4 +1,14 @@
-from flask import Blueprint, jsonify
+import hashlib, json
+import numpy as np
+from flask import Blueprint, current_app, jsonify, request
+from .. import extensions
+from ..utils.tables import HMD_RATE_COLUMNS, hmd_digest, hmd_table
+from ..utils.mortality import rate_surface, log_rates, log_m_from_logit_q, per_sex, jsonable
+from ..utils.lee_carter import fit_lee_carter
+from ..utils.cbd import fit_cbd
+from ..utils.apc import fit_apc
+from ..utils.gompertz import fit_gompertz
+from ..utils.simulation import FAN_LEVELS, simulate_fan
 
 bp = Blueprint("models", __name__)
 
@@ -35,6 +45,12 @@ _MODELS = [
     }
 ]
 
+def find_model(key):
+    """Model entry by id or (case-insensitive) name, else None."""
+    key = str(key).lower()
+    return next((m for m in _MODELS if m["id"] == key or m["name"].lower() == key), None)
+
+
 @bp.get("/models")
 def models():
     return jsonify({"models": _MODELS})
@@ -88,3 +104,188 @@ def model_detail(mid):
         details["applicability"] = "结果校准 / 合规性检查"
 
     return jsonify(details)
+
+
+# CBD is an old-age model; others default to every age in the table
+DEFAULT_AGES = {"cbd": (50, 100), "gompertz": (40, 90)}
+
+
+def request_bounds(body, lo_key, hi_key):
+    """(lo, hi) integer bounds from the body, either side None when missing, or None when
+    both are. Raises ValueError for values that are not numbers."""
+    lo, hi = (None if body.get(k) in (None, "") else body[k] for k in (lo_key, hi_key))
+    if lo is None and hi is None:
+        return None
+    try:
+        return tuple(None if v is None else int(float(v)) for v in (lo, hi))
+    except (TypeError, ValueError):
+        raise ValueError(f"{lo_key} and {hi_key} must be numbers") from None
+
+
+def fan_levels(levels):
+    """Sorted integer percent levels; fractions such as 0.95 are read as 95. Raises
+    ValueError for values that are not numbers or when no level in (0, 100) is left."""
+    try:
+        levels = [float(l) for l in (levels if isinstance(levels, (list, tuple)) else [levels])]
+    except (TypeError, ValueError):
+        raise ValueError("confidence levels must be numbers") from None
+    levels = sorted({int(round(l * 100 if 0 < l < 1 else l)) for l in levels} & set(range(1, 100)))
+    if not levels:
+        raise ValueError("confidence levels must lie between 0 and 100 (or 0 and 1)")
+    return levels
+
+
+def _surface(body, default_ages=None, default_sexes=HMD_RATE_COLUMNS):
+    """(sexes, years, ages, m) for the HMD slice requested in the body."""
+    sexes = [s for s in (body.get("sexes") or default_sexes) if s in HMD_RATE_COLUMNS]
+    if not sexes:
+        raise ValueError("None of the requested sexes are in the dataset")
+    ages = request_bounds(body, "startAge", "endAge") or default_ages
+    years, age_grid, m = rate_surface(hmd_table(), sexes, request_bounds(body, "startYear", "endYear"), ages)
+    if not len(years) or not len(age_grid):
+        raise ValueError("empty selection")
+    return sexes, years, age_grid, m
+
+
+def _cache_key(kind, *parts):
+    """Cache key over the request parts and the HMD file's content hash."""
+    raw = json.dumps([kind, hmd_digest(), *parts], sort_keys=True, default=str)
+    return f"{kind}:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _cached(kind, parts, compute):
+    """Runs `compute` through the shared cache, mapping data errors to HTTP responses."""
+    try:
+        return jsonify(extensions.cache.get_or_compute(_cache_key(kind, *parts), compute))
+    except FileNotFoundError:
+        return jsonify({"error": "HMD raw dataset not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@bp.post("/model/<mid>/fit")
+def fit_model(mid):
+    body = request.get_json() or {}
+    if not any(m["id"] == mid for m in _MODELS):
+        return jsonify({"error": "not found"}), 404
+    if mid == "gompertz" and body.get("ageRanges"):
+        return _cached("fit", [mid, body], lambda: _gompertz_sweep(body))
+    return _cached("fit", [mid, body], lambda: _fit(mid, body))
+
+
+def _fit(mid, body):
+    sexes, years, ages, m = _surface(body, DEFAULT_AGES.get(mid))
+    if mid == "lee-carter":
+        fit = fit_lee_carter(log_rates(m))
+        params = per_sex(sexes, {k: fit[k] for k in ("a_x", "b_x", "k_t", "explained_variance")})
+    elif mid == "cbd":
+        fit = fit_cbd(log_rates(m), ages)
+        params = per_sex(sexes, {k: fit[k] for k in ("kappa1", "kappa2", "residuals")})
+        for p in params.values():
+            p["x_bar"] = fit["x_bar"]
+    elif mid == "apc":
+        fit = fit_apc(log_rates(m), ages, years, int(body.get("minCohortCells", 3)))
+        params = per_sex(sexes, {k: fit[k] for k in ("alpha_x", "beta_t", "gamma_c")})
+        for p in params.values():
+            p["cohorts"] = fit["cohorts"].tolist()
+    elif mid == "gompertz":
+        fit = fit_gompertz(log_rates(m), ages, makeham=bool(body.get("makeham")))
+        params = per_sex(sexes, {k: fit[k] for k in ("A", "B", "c", "rmse_t") if k in fit})
+    else:
+        raise ValueError(f"fitting not available for {mid}")
+
+    diag = per_sex(sexes, fit["diagnostics"])
+    return {
+        "model": mid,
+        "years": years.tolist(),
+        "ages": ages.tolist(),
+        "fits": {sex: {"parameters": params[sex], "diagnostics": diag[sex]} for sex in sexes}
+    }
+
+
+def _gompertz_sweep(body):
+    """Gompertz/Makeham series for several fitting age ranges from one HMD surface."""
+    ranges = [(int(lo), int(hi)) for lo, hi in body["ageRanges"]]
+    makeham = bool(body.get("makeham"))
+    sexes, years, ages, m = _surface({**body, "startAge": min(r[0] for r in ranges),
+                                      "endAge": max(r[1] for r in ranges)})
+    log_m = log_rates(m)
+    sweeps = []
+    for lo, hi in ranges:
+        sel = (ages >= lo) & (ages <= hi)
+        if sel.sum() < 3:
+            raise ValueError(f"age range {lo}-{hi} has fewer than 3 ages")
+        fit = fit_gompertz(log_m[:, sel], ages[sel], makeham=makeham)
+        params = per_sex(sexes, {k: fit[k] for k in ("A", "B", "c", "rmse_t") if k in fit})
+        diag = per_sex(sexes, fit["diagnostics"])
+        sweeps.append({"ageRange": [lo, hi],
+                       "fits": {sex: {"parameters": params[sex], "diagnostics": diag[sex]} for sex in sexes}})
+    return {"model": "gompertz", "makeham": makeham, "years": years.tolist(), "sweeps": sweeps}
+
+
+MAX_SIMULATIONS = 200000
+MAX_HORIZON = 100
+FORECAST_FACTORS = {"lee-carter": ["k_t"], "cbd": ["kappa1", "kappa2"]}
+
+
+def _cbd_rates(eta):
+    """m_x from the CBD linear predictor logit(q_x)."""
+    return np.exp(log_m_from_logit_q(eta))
+
+
+def forecast_factors(mid, m, ages):
+    """Per sex (alpha, loadings, k_hist, inverse_link) of a factor model eta = alpha + B . k_t,
+    as taken by simulate_fan; k_hist columns are named by FORECAST_FACTORS[mid]."""
+    if mid == "lee-carter":
+        fit = fit_lee_carter(log_rates(m))
+        return [(fit["a_x"][s], fit["b_x"][s], fit["k_t"][s], np.exp) for s in range(len(m))]
+    if mid == "cbd":
+        fit = fit_cbd(log_rates(m), ages)
+        design = np.column_stack([np.ones(len(ages)), ages - fit["x_bar"]])
+        return [(np.zeros(len(ages)), design, np.column_stack([fit["kappa1"][s], fit["kappa2"][s]]), _cbd_rates)
+                for s in range(len(m))]
+    raise ValueError(f"forecast not available for {mid}")
+
+
+@bp.post("/forecast")
+def forecast():
+    """Stochastic forecast: fit the model, project its period indices by Monte Carlo
+    and return fan-chart quantiles of m_x per forecast year and age.
+    Runs with an explicit seed are deterministic and therefore cached.
+    """
+    body = request.get_json() or {}
+    if body.get("seed") is not None:
+        return _cached("forecast", [body], lambda: _forecast(body, int(body["seed"])))
+    try:
+        return jsonify(_forecast(body, np.random.SeedSequence().entropy))
+    except FileNotFoundError:
+        return jsonify({"error": "HMD raw dataset not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def _forecast(body, seed):
+    mid = body.get("model", "lee-carter")
+    horizon = min(max(int(body.get("time_horizon", 5)), 1), MAX_HORIZON)
+    n_sims = min(max(int(body.get("n_simulations", 1000)), 10), MAX_SIMULATIONS)
+    levels = fan_levels(body.get("confidence_levels") or
+                        ([body["confidence_level"]] if body.get("confidence_level") else FAN_LEVELS))
+    sexes, years, ages, m = _surface(body, DEFAULT_AGES.get(mid), default_sexes=["Total"])
+
+    factors = forecast_factors(mid, m, ages)
+
+    cfg = current_app.config
+    out = {}
+    for s, (alpha, loadings, k_hist, inverse_link) in enumerate(factors):
+        out[sexes[s]] = simulate_fan(alpha, loadings, k_hist, horizon, n_sims, seed=[seed, s], levels=levels,
+                                     inverse_link=inverse_link, memory_mb=cfg["SIM_MEMORY_MB"],
+                                     max_workers=cfg["SIM_WORKERS"])
+    return {
+        "model": mid,
+        "seed": seed,
+        "n_simulations": n_sims,
+        "levels": levels,
+        "years": list(range(int(years[-1]) + 1, int(years[-1]) + 1 + horizon)),
+        "ages": ages.tolist(),
+        "forecasts": jsonable(out)
+    }
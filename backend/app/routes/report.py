@@ -1,95 +1,67 @@
 from flask import Blueprint, request, jsonify
-import numpy as np
 import pandas as pd
+from .. import extensions
+from ..utils.dataset_store import FILE_PREFIX
+from ..utils.stats import HIST_BINS, ReportStats, describe_frame, scan_chunks
 
 bp = Blueprint("report", __name__)
 
-@bp.post("/generate-report")
-def generate_report():
-    payload = request.get_json() or {}
-    data = payload.get("data", [])
-    if not data:
-        return jsonify({"report": {"error": "No data provided"}}), 400
+REPORT_CHUNK_ROWS = 500000
+STATE_VERSION = 1  # bump when the ReportStats state layout changes
 
-    df = pd.DataFrame(data)
 
-    report = {}
+def report_state(dsid: str, bins: int = HIST_BINS, chunk_rows: int = REPORT_CHUNK_ROWS) -> dict:
+    """Report statistics state of one dataset version.
+    Stored versions are immutable, so the state is saved next to the table and cached;
+    asking again is a lookup. A version created by appending rows folds only those rows
+    into its parent's state. `file::` tables are keyed by their modification time.
+    """
+    store = extensions.datasets
+    meta = store.meta(dsid)
+    name = f"report-v{STATE_VERSION}-{bins}"
+    on_disk = not dsid.startswith(FILE_PREFIX)
 
-    # ----------------------------
-    # Summary statistics
-    # ----------------------------
-    summary_stats = []
-    for col in df.columns:
-        if pd.api.types.is_numeric_dtype(df[col]):
-            desc = df[col].describe()
-            summary_stats.append({
-                "field": col,
-                "count": int(desc["count"]),
-                "mean": float(desc["mean"]) if not np.isnan(desc["mean"]) else None,
-                "std": float(desc["std"]) if not np.isnan(desc["std"]) else None,
-                "min": float(desc["min"]),
-                "max": float(desc["max"])
-            })
-    report["summaryStats"] = summary_stats
+    def compute():
+        state = store.load_artifact(dsid, name) if on_disk else None
+        if state is not None:
+            return state
+        parent = meta.get("parent")
+        if meta.get("baseRows") is not None and parent and store.exists(parent):
+            stats = ReportStats.from_state(report_state(parent, bins, chunk_rows))
+            for chunk in store.iter_chunks(dsid, chunk_rows, start=int(meta["baseRows"])):
+                stats.update(chunk)
+        else:
+            stats = scan_chunks(lambda: store.iter_chunks(dsid, chunk_rows), bins)
+        state = stats.to_state()
+        if on_disk:
+            store.save_artifact(dsid, name, state)
+        return state
 
-    # ----------------------------
-    # Missing value report
-    # ----------------------------
-    missing_report = []
-    for col in df.columns:
-        n_missing = df[col].isna().sum()
-        if n_missing > 0:
-            missing_report.append({
-                "field": col,
-                "missing": int(n_missing),
-                "percent": round(n_missing / len(df) * 100, 2)
-            })
-    report["missingValueReport"] = missing_report
+    return extensions.cache.get_or_compute(f"report:{dsid}:{meta.get('created')}:{name}", compute)
 
-    # ----------------------------
-    # Outlier detection (Z-score)
-    # ----------------------------
-    outlier_report = []
-    for col in df.columns:
-        if pd.api.types.is_numeric_dtype(df[col]):
-            vals = df[col].dropna().astype(float)
-            if len(vals) > 0:
-                z_scores = (vals - vals.mean()) / (vals.std() if vals.std() != 0 else 1)
-                n_outliers = int((np.abs(z_scores) > 3).sum())
-                if n_outliers > 0:
-                    outlier_report.append({
-                        "field": col,
-                        "outliers": n_outliers,
-                        "percent": round(n_outliers / len(vals) * 100, 2)
-                    })
-    report["outlierReport"] = outlier_report
 
-    # ----------------------------
-    # Distribution (histogram)
-    # ----------------------------
-    dist_report = []
-    for col in df.columns:
-        if pd.api.types.is_numeric_dtype(df[col]):
-            counts, bins = np.histogram(df[col].dropna(), bins=10)
-            dist_report.append({
-                "field": col,
-                "bins": bins.tolist(),
-                "counts": counts.tolist()
-            })
-    report["dataDistribution"] = dist_report
+@bp.post("/generate-report")
+def generate_report():
+    """Summary statistics, missing values, z-score outliers, histograms and rows per year.
+    With `datasetId` the stored table is streamed in `chunkRows` chunks (two passes),
+    so it never has to fit in memory, and the result is kept per dataset version.
+    Inline `data` is still accepted for small tables.
+    """
+    payload = request.get_json() or {}
+    try:
+        bins = max(int(payload.get("bins", HIST_BINS)), 1)
+        rows = max(int(payload.get("chunkRows", REPORT_CHUNK_ROWS)), 1)
+    except (TypeError, ValueError):
+        return jsonify({"report": {"error": "bins and chunkRows must be integers"}}), 400
 
-    # ----------------------------
-    # Time series analysis (by year)
-    # ----------------------------
-    ts_report = []
-    year_col = None
-    for candidate in ["year", "Year", "YEAR"]:
-        if candidate in df.columns:
-            year_col = candidate
-            break
-    if year_col:
-        grouped = df.groupby(year_col).size().reset_index(name="count")
-        ts_report = grouped.to_dict(orient="records")
-    report["timeSeriesAnalysis"] = ts_report
+    dsid = payload.get("datasetId")
+    if dsid:
+        if not extensions.datasets.exists(dsid):
+            return jsonify({"report": {"error": "Unknown dataset"}}), 404
+        report = ReportStats.from_state(report_state(dsid, bins, rows)).report()
+        return jsonify({"report": report, "datasetId": dsid})
 
-    return jsonify({"report": report})
+    data = payload.get("data", [])
+    if not data:
+        return jsonify({"report": {"error": "No data provided"}}), 400
+    return jsonify({"report": describe_frame(pd.DataFrame(data), bins)})
@@ -0,0 +1,43 @@
+from flask import Blueprint, request, jsonify
+from .. import extensions
+from ..utils.sas_runner import QueueFull
+
+bp = Blueprint("sas", __name__)
+
+
+@bp.post("/sas-jobs")
+def submit_job():
+    """Queues a SAS script and returns at once with the job (202).
+    Body: {"script": ..., "inputs": {name: datasetId}, "params": {...}}. Output tables are
+    stored as datasets listed in the finished job's result; identical script and inputs
+    are answered from the cache without running SAS."""
+    body = request.get_json() or {}
+    script = body.get("script")
+    if not isinstance(script, str) or not script.strip():
+        return jsonify({"error": "No script provided"}), 400
+    inputs, params = body.get("inputs") or {}, body.get("params") or {}
+    if not isinstance(inputs, dict) or not isinstance(params, dict):
+        return jsonify({"error": "inputs and params must be objects"}), 400
+    try:
+        job = extensions.sas_jobs.submit(script, inputs, params)
+    except KeyError as e:
+        return jsonify({"error": f"Unknown dataset {e.args[0]}"}), 404
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(job), 202
+
+
+@bp.get("/sas-jobs/<job_id>")
+def job_status(job_id):
+    job = extensions.sas_jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
+@bp.post("/sas-jobs/<job_id>/cancel")
+def cancel_job(job_id):
+    job = extensions.sas_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
@@ -0,0 +1,84 @@
+from functools import lru_cache
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from .mortality import diagnostics
+
+
+def apc_design(ages, years, min_cohort_cells: int = 3):
+    """Sparse age/period/cohort design over the cells of an (age, year) grid.
+    Cohorts seen in fewer than `min_cohort_cells` cells are left out (weight 0), as usual
+    for the poorly identified corner cohorts. Returns (X, mask, cohorts); X has 3 nnz per row.
+    """
+    ages, years = np.asarray(ages), np.asarray(years)
+    n_ages, n_years = len(ages), len(years)
+    cohort_grid = years[None, :] - ages[:, None]
+    all_cohorts, c_idx = np.unique(cohort_grid, return_inverse=True)
+    c_idx = c_idx.reshape(n_ages, n_years)
+    keep = np.bincount(c_idx.ravel(), minlength=len(all_cohorts)) >= min_cohort_cells
+    mask = keep[c_idx]
+
+    a_idx, t_idx = np.nonzero(mask)
+    remap = np.cumsum(keep) - 1
+    cols = np.concatenate([a_idx, n_ages + t_idx, n_ages + n_years + remap[c_idx[a_idx, t_idx]]])
+    rows = np.tile(np.arange(len(a_idx)), 3)
+    n_cols = n_ages + n_years + int(keep.sum())
+    x = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(a_idx), n_cols))
+    return x, mask, all_cohorts[keep]
+
+
+def apc_constraints(n_ages, n_years, cohorts):
+    """sum(beta_t) = 0, sum(gamma_c) = 0, sum((c - c_bar) * gamma_c) = 0 as sparse rows."""
+    n_c = len(cohorts)
+    off = n_ages + n_years
+    c_centred = cohorts - cohorts.mean()
+    rows = np.concatenate([np.zeros(n_years), np.ones(n_c), np.full(n_c, 2)])
+    cols = np.concatenate([n_ages + np.arange(n_years), off + np.arange(n_c), off + np.arange(n_c)])
+    vals = np.concatenate([np.ones(n_years), np.ones(n_c), c_centred])
+    return sp.csr_matrix((vals, (rows, cols)), shape=(3, off + n_c))
+
+
+@lru_cache(maxsize=32)
+def _system(n_ages: int, n_years: int, min_cohort_cells: int):
+    """Design, mask, cohort offsets (year index - age index) and factorised normal matrix of
+    a consecutive age/year grid; they depend only on its shape, so every window of the same
+    size (e.g. rolling backtest origins) reuses one factorisation."""
+    x, mask, offsets = apc_design(np.arange(n_ages), np.arange(n_years), min_cohort_cells)
+    c = apc_constraints(n_ages, n_years, offsets)
+    return x, mask, offsets, splu((x.T @ x + c.T @ c).tocsc())
+
+
+def fit_apc(log_m: np.ndarray, ages, years, min_cohort_cells: int = 3) -> dict:
+    """Fits ln(m_x,t) = alpha_x + beta_t + gamma_(t-x) by sparse least squares.
+    The identifiability constraints enter as extra rows, which leaves the fit unchanged
+    but makes the normal matrix positive definite; it is factorised once and solved for
+    every sex's right-hand side together. Memory grows with the number of cells.
+    """
+    log_m = np.asarray(log_m, dtype=float)
+    if log_m.ndim == 2:
+        log_m = log_m[None]
+    n_sexes, n_ages, n_years = log_m.shape
+    ages, years = np.asarray(ages), np.asarray(years)
+    if np.all(np.diff(ages) == 1) and np.all(np.diff(years) == 1):
+        x, mask, offsets, lu = _system(n_ages, n_years, min_cohort_cells)
+        cohorts = offsets + (years[0] - ages[0])
+    else:
+        x, mask, cohorts = apc_design(ages, years, min_cohort_cells)
+        c = apc_constraints(n_ages, n_years, cohorts)
+        lu = splu((x.T @ x + c.T @ c).tocsc())
+
+    y = log_m[:, mask].T  # (cells, sexes)
+    theta = lu.solve(np.asarray(x.T @ y))  # (params, sexes)
+
+    alpha, beta, gamma = theta[:n_ages].T, theta[n_ages:n_ages + n_years].T, theta[n_ages + n_years:].T
+    fitted = np.full(log_m.shape, np.nan)
+    fitted[:, mask] = (x @ theta).T
+    return {
+        "alpha_x": alpha,
+        "beta_t": beta,
+        "gamma_c": gamma,
+        "cohorts": cohorts,
+        "mask": mask,
+        "fitted": fitted,
+        "diagnostics": diagnostics(log_m, np.where(mask, fitted, log_m), n_ages + n_years + len(cohorts) - 3, mask),
+    }
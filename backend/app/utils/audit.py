@@ -1,17 +1,223 @@
-import json, os, uuid
+import atexit, json, logging, os, queue, threading, time, uuid
 from datetime import datetime
-from flask import request, session
+from flask import has_request_context, request, session
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process writes the log
+    fcntl = None
+
+MAX_BYTES = int(float(os.environ.get("AUDIT_MAX_MB", "50")) * 2 ** 20)  # rotate past this size (0: never)
+ROTATE_SECONDS = float(os.environ.get("AUDIT_ROTATE_HOURS", "24")) * 3600  # and after this age (0: never)
+BACKUPS = int(os.environ.get("AUDIT_BACKUPS", "10"))  # audit.log.1 ... audit.log.N
+FLUSH_SECONDS = float(os.environ.get("AUDIT_FLUSH_SECONDS", "1"))
+FSYNC = os.environ.get("AUDIT_FSYNC", "interval")  # "always" (every batch), "interval" or "never"
+QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+BATCH = 1000
+
+
+class AuditWriter:
+    """Appends JSON lines to `path` from a background thread. write() only enqueues; the
+    thread drains the queue in batches, keeps the file open, rotates it by size or age
+    and fsyncs according to `fsync`. A full queue blocks writers rather than drop entries.
+
+    Every worker process appends to the same file, so each batch is written under an
+    exclusive lock on `<path>.lock`: the writer reopens the file if another process has
+    rotated it, decides on rotation from the file's real size and the lock file's mtime
+    (the time of the last rotation), and no process writes while another renames.
+    """
+
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES, rotate_seconds: float = ROTATE_SECONDS,
+                 backups: int = BACKUPS, flush_seconds: float = FLUSH_SECONDS, fsync: str = FSYNC,
+                 queue_size: int = QUEUE_SIZE):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"unknown fsync policy {fsync!r}")
+        self.path, self.max_bytes, self.rotate_seconds, self.backups = path, max_bytes, rotate_seconds, backups
+        self.flush_seconds, self.fsync, self.queue_size = flush_seconds, fsync, queue_size
+        self.rotations = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._lock_file = None
+
+    def _start(self):
+        # (re)started lazily, so a writer inherited by a forked worker gets its own thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.queue_size)
+            self._file = self._lock_file = None
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def write(self, entry: dict):
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until everything written so far is on disk (fsynced unless policy "never")."""
+        if self._pid != os.getpid():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float | None = 10):
+        if self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._pid = None
+
+    def _open(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _current(self):
+        """Opens the log, or reopens it when another process has rotated it away."""
+        if self._file is None:
+            self._open()
+            return
+        try:
+            moved = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self._file.flush()
+            self._open()
+
+    def _acquire(self):
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._lock_file = open(f"{self.path}.lock", "a")
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+
+    def _release(self):
+        if fcntl is not None and self._lock_file is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _rotate(self):
+        """Renames the log to .1 (shifting older backups) and starts a new one; called with
+        the lock held."""
+        self._sync()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        os.utime(self._lock_file.name)  # shared record of the rotation time
+        self.rotations += 1
+        self._open()
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+        self._synced = time.monotonic()
+
+    def _write_batch(self, lines):
+        self._acquire()
+        try:
+            self._current()
+            size = os.fstat(self._file.fileno()).st_size
+            rotated_at = os.stat(self._lock_file.name).st_mtime
+            if self.rotate_seconds and size and time.time() - rotated_at >= self.rotate_seconds:
+                self._rotate()
+                size = 0
+            start = 0
+            for i, line in enumerate(lines):
+                nbytes = len(line.encode("utf-8"))
+                if self.max_bytes and size and size + nbytes > self.max_bytes:
+                    self._file.write("".join(lines[start:i]))
+                    self._rotate()
+                    start, size = i, 0
+                size += nbytes
+            self._file.write("".join(lines[start:]))
+            self._file.flush()
+            if self.fsync == "always":
+                self._sync()
+        finally:
+            self._release()
+
+    def _run(self):
+        q, self._synced, dirty = self._queue, time.monotonic(), False
+        while True:
+            try:
+                item = q.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                item = ()
+            lines, waiters, stop = [], [], False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item:
+                    lines.append(item)
+                if stop or len(lines) >= BATCH:
+                    break
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if lines:
+                    self._write_batch(lines)
+                    dirty = self.fsync == "interval"
+                if self._file is not None and (waiters or stop or
+                                               (dirty and time.monotonic() - self._synced >= self.flush_seconds)):
+                    self._sync()
+                    dirty = False
+            except OSError:  # keep the thread alive; the entries of this batch are lost
+                logging.getLogger(__name__).exception("audit log write failed")
+            for event in waiters:
+                event.set()
+            if stop:
+                for f in (self._file, self._lock_file):
+                    if f is not None:
+                        f.close()
+                self._file = self._lock_file = None
+                return
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: str | None = None) -> AuditWriter:
+    path = path or os.environ.get("AUDIT_LOG_PATH", os.path.abspath(".logs/audit.log"))
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = AuditWriter(path)
+        return _writers[path]
+
+
+def flush(timeout: float | None = None) -> bool:
+    return all([w.flush(timeout) for w in list(_writers.values())])
+
+
+@atexit.register
+def _close_all():
+    for w in list(_writers.values()):
+        w.close()
+
 
 def audit_log(action: str, details: dict):
+    in_request = has_request_context()
     entry = {
         "timestamp": datetime.utcnow().isoformat(),
         "action": action,
         "details": details,
-        "user": getattr(session, "get", lambda *_: None)("user_id") or "SYSTEM",
-        "ip": getattr(request, "remote_addr", None) or "0.0.0.0",
-        "session_id": getattr(session, "get", lambda *_: str(uuid.uuid4()))("sid") or str(uuid.uuid4()),
+        "user": (session.get("user_id") if in_request else None) or "SYSTEM",
+        "ip": (request.remote_addr if in_request else None) or "0.0.0.0",
+        "session_id": (session.get("sid") if in_request else None) or str(uuid.uuid4()),
     }
-    path = os.environ.get("AUDIT_LOG_PATH", os.path.abspath(".logs/audit.log"))
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry) + "\n")
+    get_writer().write(entry)
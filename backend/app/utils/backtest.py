@@ -0,0 +1,105 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .cbd import fit_cbd
+from .comparison import _errors, _fit, project
+from .mortality import log_rates
+
+BACKTEST_MODELS = ("lee-carter", "cbd", "apc")
+MIN_TRAIN_YEARS = 10
+
+
+def origin_years(years, horizon: int, n_origins: int = 30, window=None, step: int = 1) -> np.ndarray:
+    """The last `n_origins` origin years (every `step`-th) that leave at least one year to
+    score and enough history before them (`window` years when rolling, else MIN_TRAIN_YEARS)."""
+    years = np.asarray(years)
+    first = years[0] + max(int(window or MIN_TRAIN_YEARS), 3) - 1
+    candidates = years[(years >= first) & (years < years[-1])][::-1][::max(int(step), 1)][::-1]
+    return candidates[-max(int(n_origins), 1):]
+
+
+def backtest_model(mid, m, ages, years, origins, horizon: int, window=None, options=None) -> dict:
+    """Refits `mid` on the (sex, age, year) rates up to every origin year (the last `window`
+    years when rolling, all earlier years when expanding) and scores its h-step drift
+    projections. Returns rmse (ln m) and mape (%) shaped (sex, origin, horizon); horizons
+    beyond the data are NaN.
+
+    All three fits are direct solves, so there is no iterative start to carry between
+    origins. What is reused instead: CBD solves every year on its own against a shared age
+    design, so one fit over all years is sliced for each window; APC reuses the factorised
+    normal matrix of same-size (rolling) windows; Lee-Carter refits its SVD per origin."""
+    options = options or {}
+    years = np.asarray(years)
+    rmse = np.full((m.shape[0], len(origins), horizon), np.nan)
+    mape = np.full_like(rmse, np.nan)
+    full = fit_cbd(log_rates(m), ages) if mid == "cbd" else None
+    for o, origin in enumerate(origins):
+        end = int(np.searchsorted(years, origin, side="right"))
+        start = max(end - int(window), 0) if window else 0
+        if full is not None:
+            fit = {"kappa1": full["kappa1"][:, start:end], "kappa2": full["kappa2"][:, start:end],
+                   "x_bar": full["x_bar"]}
+        else:
+            fit, _, _ = _fit(mid, log_rates(m[..., start:end]), ages, years[start:end], options)
+        fit["last_year"] = years[end - 1]
+        steps = min(horizon, len(years) - end)
+        if steps <= 0:
+            continue
+        pred = project(mid, fit, ages, steps)  # (sex, age, h)
+        # one (age, 1) slice per horizon so that every h is scored separately
+        err = _errors(np.moveaxis(pred, 2, 1)[..., None], np.moveaxis(m[..., end:end + steps], 2, 1)[..., None])
+        rmse[:, o, :steps], mape[:, o, :steps] = err
+    return {"rmse": rmse, "mape": mape}
+
+
+def _chunk(args):
+    return args[0], args[1], backtest_model(*args[2:])
+
+
+def run_backtest(models, m, ages, years, origins, horizon: int, window=None, options=None,
+                 max_workers=None) -> dict:
+    """Origin x horizon error matrices for every model: {mid: {"rmse", "mape"}} or
+    {mid: {"error": ...}}. Each model's origins are split into contiguous blocks spread
+    over a process pool, so consecutive windows of the same size in one worker reuse the
+    APC factorisation. With max_workers <= 1 everything runs in-process; either way a model
+    whose fit raises maps to {"error": ...}."""
+    options = options or {}
+    workers = max_workers or os.cpu_count() or 1
+    per_model = max(workers // max(len(models), 1), 1)
+    blocks = [b for b in np.array_split(np.arange(len(origins)), min(per_model, len(origins))) if len(b)]
+    jobs = [(mid, b, mid, m, ages, years, np.asarray(origins)[b], horizon, window, options.get(mid))
+            for mid in models for b in blocks]
+
+    parts, errors = {mid: [] for mid in models}, {}
+    if workers <= 1 or len(jobs) <= 1:
+        done = []
+        for job in jobs:
+            try:
+                done.append(_chunk(job))
+            except Exception as e:  # same as a failure inside a pool worker
+                errors[job[0]] = str(e)
+    else:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            futures = [(job[0], pool.submit(_chunk, job)) for job in jobs]
+            done = []
+            for mid, fut in futures:
+                try:
+                    done.append(fut.result())
+                except Exception as e:  # raised inside the worker
+                    errors[mid] = str(e)
+    for mid, block, res in done:
+        parts[mid].append((block, res))
+
+    out = {}
+    for mid in models:
+        if mid in errors:
+            out[mid] = {"error": errors[mid]}
+            continue
+        merged = {}
+        for key in ("rmse", "mape"):
+            arr = np.full((m.shape[0], len(origins), horizon), np.nan)
+            for block, res in parts[mid]:
+                arr[:, block] = res[key]
+            merged[key] = arr
+        out[mid] = merged
+    return out
@@ -0,0 +1,178 @@
+import json, sys, threading, time, zlib
+from collections import Counter, OrderedDict
+import redis
+
+_RAW, _ZLIB = b"j", b"z"
+
+
+def encode(value, compress_min: int = 4096) -> bytes:
+    data = json.dumps(value, separators=(",", ":"), default=str).encode()
+    if len(data) >= compress_min:
+        return _ZLIB + zlib.compress(data, 3)
+    return _RAW + data
+
+
+def decode(payload: bytes):
+    tag, data = payload[:1], payload[1:]
+    return json.loads(zlib.decompress(data) if tag == _ZLIB else data)
+
+
+def object_size(value) -> int:
+    """Approximate memory held by a decoded JSON-like value (containers, their items and
+    any numpy arrays), which is what the local tier keeps."""
+    total, stack = 0, [value]
+    while stack:
+        obj = stack.pop()
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            if obj and not isinstance(obj[0], (dict, list, tuple)) and not hasattr(obj[0], "nbytes"):
+                total += sum(map(sys.getsizeof, obj))  # row of scalars (JSON arrays are homogeneous)
+            else:
+                stack.extend(obj)
+        elif hasattr(obj, "nbytes"):
+            total += int(obj.nbytes)
+    return total
+
+
+class TwoTierCache:
+    """JSON value cache: an in-process LRU (TTL + byte budget) in front of a pooled Redis.
+    Values over `compress_min` bytes are zlib-compressed on the wire. If Redis errors the
+    cache keeps working locally and retries Redis after `retry_after` seconds.
+    Local hits return the stored object itself, so callers must not mutate it; the local
+    byte budget counts that object's size in memory, not its compressed payload.
+    """
+
+    def __init__(self, redis_url=None, max_bytes: int = 64 * 2 ** 20, default_ttl: int = 3600,
+                 compress_min: int = 4096, namespace: str = "dap:", client=None, pool_size: int = 10,
+                 timeout: float = 0.5, retry_after: float = 30.0):
+        if client is None and redis_url:
+            pool = redis.ConnectionPool.from_url(redis_url, max_connections=pool_size, socket_timeout=timeout,
+                                                 socket_connect_timeout=timeout)
+            client = redis.Redis(connection_pool=pool)
+        self.redis = client
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.compress_min = compress_min
+        self.namespace = namespace
+        self.retry_after = retry_after
+        self.stats = Counter()
+        self._local = OrderedDict()  # key -> (expires_at, value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Event, for coalescing identical misses
+        self._down_until = 0.0
+
+    # ----- local tier -----
+    def _local_get(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                self._drop(key)
+                return None
+            self._local.move_to_end(key)
+            return item
+
+    def _local_set(self, key, value, nbytes, ttl):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._local:
+                self._drop(key)
+            self._local[key] = (time.time() + ttl, value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._local)))
+                self.stats["evictions"] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _drop(self, key):
+        _, _, nbytes = self._local.pop(key)
+        self._bytes -= nbytes
+
+    # ----- remote tier -----
+    def _remote(self, op, *args):
+        if self.redis is None or time.time() < self._down_until:
+            return None
+        try:
+            return op(*args)
+        except (redis.RedisError, OSError):
+            self._count("remote_errors")
+            self._down_until = time.time() + self.retry_after
+            return None
+
+    @property
+    def remote_available(self) -> bool:
+        return self.redis is not None and time.time() >= self._down_until
+
+    # ----- public API -----
+    def get(self, key: str, default=None):
+        item = self._local_get(key)
+        if item is not None:
+            self._count("hits_local")
+            return item[1]
+        payload = self._remote(self.redis.get, self.namespace + key) if self.redis is not None else None
+        if payload is not None:
+            value = decode(payload)
+            ttl = self._remote(self.redis.ttl, self.namespace + key)
+            self._local_set(key, value, object_size(value), ttl if ttl and ttl > 0 else self.default_ttl)
+            self._count("hits_remote")
+            return value
+        self._count("misses")
+        return default
+
+    def set(self, key: str, value, ttl: int | None = None):
+        ttl = int(ttl or self.default_ttl)
+        payload = encode(value, self.compress_min)
+        self._local_set(key, value, object_size(value), ttl)
+        if self.redis is not None:
+            self._remote(self.redis.set, self.namespace + key, payload, ttl)
+        self._count("sets")
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._local:
+                self._drop(key)
+        if self.redis is not None:
+            self._remote(self.redis.delete, self.namespace + key)
+
+    def get_or_compute(self, key: str, compute, ttl: int | None = None):
+        """Returns the cached value or computes it once, even under concurrent misses:
+        callers that miss while another thread computes the same key wait for its result."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            self._count("coalesced")
+            event.wait()
+            value = self.get(key, sentinel)
+            if value is not sentinel:
+                return value
+            return compute()  # leader failed; compute for ourselves
+        try:
+            value = compute()
+            self.set(key, value, ttl)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def info(self) -> dict:
+        with self._lock:
+            entries, nbytes, stats = len(self._local), self._bytes, dict(self.stats)
+        return {**stats, "local_entries": entries, "local_bytes": nbytes, "max_bytes": self.max_bytes,
+                "remote": "disabled" if self.redis is None else ("up" if self.remote_available else "down")}
@@ -0,0 +1,32 @@
+import numpy as np
+from .mortality import diagnostics, logit_q_from_log_m, log_m_from_logit_q
+
+
+def fit_cbd(log_m: np.ndarray, ages: np.ndarray) -> dict:
+    """Fits logit(q_x,t) = k1_t + (x - x̄) k2_t for every sex and year in one least-squares solve.
+    The age design is shared, so all (sex, year) columns go through a single lstsq call.
+    Diagnostics are reported on the ln(m) scale so they compare with the other models.
+    """
+    log_m = np.asarray(log_m, dtype=float)
+    if log_m.ndim == 2:
+        log_m = log_m[None]
+    n_sexes, n_ages, n_years = log_m.shape
+    ages = np.asarray(ages, dtype=float)
+    x_bar = ages.mean()
+
+    y = logit_q_from_log_m(log_m)
+    design = np.column_stack([np.ones(n_ages), ages - x_bar])
+    coef, *_ = np.linalg.lstsq(design, y.transpose(1, 0, 2).reshape(n_ages, -1), rcond=None)
+    kappa = coef.reshape(2, n_sexes, n_years)
+
+    fitted = np.einsum("af,fst->sat", design, kappa)
+    fitted_log_m = log_m_from_logit_q(fitted)
+    return {
+        "kappa1": kappa[0],
+        "kappa2": kappa[1],
+        "x_bar": x_bar,
+        "fitted": fitted,
+        "residuals": y - fitted,
+        "fitted_log_m": fitted_log_m,
+        "diagnostics": diagnostics(log_m, fitted_log_m, 2 * n_years),
+    }
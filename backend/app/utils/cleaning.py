@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+from .query import find_column
+
+NULL_TOKENS = ("", "NA", "N/A", "NaN", "nan", "null", "NULL", ".")
+
+
+def _columns(df, step, numeric=False) -> list:
+    """Columns a step applies to: step["columns"] (or "column"), else every (numeric) column."""
+    names = step.get("columns") or ([step["column"]] if step.get("column") else None)
+    if names is None:
+        return [c for c in df.columns if not numeric or pd.api.types.is_numeric_dtype(df[c])]
+    cols = []
+    for name in names:
+        col = find_column(df, name)
+        if col is None:
+            raise ValueError(f"Unknown column {name}")
+        cols.append(col)
+    return cols
+
+
+def _null_mask(df: pd.DataFrame) -> pd.DataFrame:
+    mask = df.isna()
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            mask[col] |= df[col].isin(NULL_TOKENS)
+    return mask
+
+
+def drop_null_rows(df, step):
+    """Drops rows where all (how="all") or any (how="any") of the columns are null."""
+    cols = _columns(df, step)
+    nulls = _null_mask(df[cols])
+    drop = nulls.any(axis=1) if step.get("how") == "any" else nulls.all(axis=1)
+    return df[~drop.to_numpy()]
+
+
+def dedupe(df, step):
+    subset = _columns(df, step) if step.get("columns") or step.get("column") else None
+    return df.drop_duplicates(subset=subset, keep=step.get("keep", "first"))
+
+
+_COERCE = {
+    "int": lambda s: pd.to_numeric(s, errors="coerce").round().astype("Int64"),
+    "float": lambda s: pd.to_numeric(s, errors="coerce").astype("float64"),
+    "str": lambda s: s.astype("string"),
+    "category": lambda s: s.astype("category"),
+    "datetime": lambda s: pd.to_datetime(s, errors="coerce"),
+}
+
+
+def coerce(df, step):
+    """step["types"]: {column: int|float|str|category|datetime}; bad values become null."""
+    df = df.copy()
+    for name, kind in (step.get("types") or {}).items():
+        col = find_column(df, name)
+        if col is None:
+            raise ValueError(f"Unknown column {name}")
+        if kind not in _COERCE:
+            raise ValueError(f"Unknown type {kind}")
+        df[col] = _COERCE[kind](df[col])
+    return df
+
+
+def clip(df, step):
+    cols = _columns(df, step, numeric=True)
+    df = df.copy()
+    df[cols] = df[cols].clip(lower=step.get("min"), upper=step.get("max"), axis=1)
+    return df
+
+
+def winsorize(df, step):
+    """Clips each column to its own [lower, upper] quantiles (default, or null: 1%/99%)."""
+    cols = _columns(df, step, numeric=True)
+    lower, upper = (default if step.get(k) is None else step[k] for k, default in (("lower", 0.01), ("upper", 0.99)))
+    bounds = df[cols].quantile([float(lower), float(upper)])
+    df = df.copy()
+    df[cols] = df[cols].clip(lower=bounds.iloc[0], upper=bounds.iloc[1], axis=1)
+    return df
+
+
+def interpolate_rows(m: np.ndarray, x: np.ndarray, extrapolate: bool = False) -> np.ndarray:
+    """Linear interpolation of NaNs along the last axis of a (groups, grid) array."""
+    n = m.shape[1]
+    pos = np.arange(n)
+    valid = ~np.isnan(m)
+    prev = np.maximum.accumulate(np.where(valid, pos, -1), axis=1)
+    nxt = np.minimum.accumulate(np.where(valid, pos, n)[:, ::-1], axis=1)[:, ::-1]
+    p, q = prev.clip(0, n - 1), nxt.clip(0, n - 1)
+    y0, y1 = np.take_along_axis(m, p, axis=1), np.take_along_axis(m, q, axis=1)
+    span = x[q] - x[p]
+    w = np.divide(x[None, :] - x[p], span, out=np.zeros_like(m), where=span != 0)
+    out = np.where((prev >= 0) & (nxt < n) & ~valid, y0 + w * (y1 - y0), m)
+    if extrapolate:  # carry the nearest observed value outwards
+        out = np.where((prev < 0) & (nxt < n), y1, out)
+        out = np.where((nxt >= n) & (prev >= 0), y0, out)
+    return out
+
+
+def interpolate(df, step):
+    """Fills missing values over the age grid within each group (e.g. year x sex).
+    step: columns, age (default "age"), by (default: year/sex columns present),
+    scale "log" to interpolate rates log-linearly, extrapolate to carry edge values.
+    """
+    age_col = find_column(df, step.get("age", "age"))
+    if age_col is None:
+        raise ValueError("interpolate needs an age column")
+    by = [find_column(df, b) for b in (step.get("by") or ["year", "sex"])]
+    by = [b for b in by if b is not None and b != age_col]
+    cols = [c for c in _columns(df, step, numeric=True) if c != age_col and c not in by]
+
+    ages = pd.to_numeric(df[age_col], errors="coerce").to_numpy(dtype=float)
+    grid, a_idx = np.unique(ages, return_inverse=True)
+    g_idx = df.groupby(by, sort=False, observed=True, dropna=False).ngroup().to_numpy() if by else np.zeros(len(df), int)
+    n_groups = int(g_idx.max()) + 1 if len(df) else 0
+    log = step.get("scale") == "log"
+
+    df = df.copy()
+    for col in cols:
+        vals = df[col].to_numpy(dtype=float, na_value=np.nan)
+        if log:
+            vals = np.log(np.where(vals > 0, vals, np.nan))
+        m = np.full((n_groups, len(grid)), np.nan)
+        m[g_idx, a_idx] = vals
+        filled = interpolate_rows(m, grid, bool(step.get("extrapolate")))[g_idx, a_idx]
+        filled = np.exp(filled) if log else filled
+        df[col] = np.where(np.isnan(df[col].to_numpy(dtype=float, na_value=np.nan)), filled, df[col])
+    return df
+
+
+STEPS = {
+    "drop_null_rows": drop_null_rows,
+    "dedupe": dedupe,
+    "coerce": coerce,
+    "clip": clip,
+    "winsorize": winsorize,
+    "interpolate": interpolate,
+}
+
+
+_BOUNDS = {"clip": ("min", "max"), "winsorize": ("lower", "upper")}
+
+
+def validate_steps(steps):
+    """Raises ValueError unless `steps` is a list of {"op": <known step>, ...} objects whose
+    numeric bounds (clip min/max, winsorize lower/upper) are numbers."""
+    if not isinstance(steps, list):
+        raise ValueError("steps must be a list of step objects")
+    for step in steps:
+        if not isinstance(step, dict):
+            raise ValueError(f"Cleaning steps must be objects like {{\"op\": ...}}, got {step!r}")
+        op = step.get("op")
+        if op not in STEPS:
+            raise ValueError(f"Unknown cleaning step {op}")
+        for key in _BOUNDS.get(op, ()):
+            value = step.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"{op} {key} must be a number")
+
+
+def run_pipeline(df: pd.DataFrame, steps: list):
+    """Applies the cleaning steps in order; returns (cleaned, per-step row report).
+    Raises ValueError for malformed steps (see validate_steps) before touching the data."""
+    validate_steps(steps)
+    report = []
+    for step in steps:
+        op = step["op"]
+        before = len(df)
+        df = STEPS[op](df, step)
+        report.append({"op": op, "rowsBefore": before, "rowsAfter": int(len(df))})
+    return df.reset_index(drop=True), report
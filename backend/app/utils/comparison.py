@@ -0,0 +1,193 @@
+import multiprocessing, os, time
+from multiprocessing import connection
+import numpy as np
+from .mortality import diagnostics, log_rates, log_m_from_logit_q
+from .lee_carter import fit_lee_carter
+from .cbd import fit_cbd
+from .apc import apc_design, fit_apc
+from .gompertz import fit_gompertz
+from .simulation import rw_drift
+
+COMPARABLE_MODELS = ("lee-carter", "cbd", "apc", "gompertz")
+METRICS = {"AIC": "aic", "BIC": "bic", "Residual": "residual_autocorr", "RMSE": "rmse", "MAPE": "mape",
+           "OOS_RMSE": "oos_rmse", "OOS_MAPE": "oos_mape"}
+AUTOCORR_PENALTY = 100.0
+
+
+def _fit(mid, log_m, ages, years, options):
+    """Fits one model; returns (fit, fitted ln m, cells used)."""
+    if mid == "lee-carter":
+        fit = fit_lee_carter(log_m)
+        return fit, fit["fitted"], None
+    if mid == "cbd":
+        fit = fit_cbd(log_m, ages)
+        return fit, fit["fitted_log_m"], None
+    if mid == "apc":
+        fit = fit_apc(log_m, ages, years, int(options.get("minCohortCells", 3)))
+        return fit, fit["fitted"], fit["mask"]
+    if mid == "gompertz":
+        fit = fit_gompertz(log_m, ages, makeham=bool(options.get("makeham")))
+        return fit, fit["fitted"], None
+    raise ValueError(f"{mid} cannot be compared")
+
+
+def _drift(series):
+    """Per-sex random-walk drift of a (sex, year) series."""
+    return np.array([rw_drift(s[:, None])[0][0] for s in np.asarray(series)])
+
+
+def project(mid, fit, ages, horizon: int) -> np.ndarray:
+    """Central (drift-only) projection of ln m for the next `horizon` years, (sex, age, h)."""
+    h = np.arange(1, horizon + 1)[None, None, :]
+    x = np.asarray(ages, dtype=float)[None, :, None]
+    if mid == "lee-carter":
+        k = fit["k_t"][:, -1, None, None] + _drift(fit["k_t"])[:, None, None] * h
+        return fit["a_x"][:, :, None] + fit["b_x"][:, :, None] * k
+    if mid == "cbd":
+        k1 = fit["kappa1"][:, -1, None, None] + _drift(fit["kappa1"])[:, None, None] * h
+        k2 = fit["kappa2"][:, -1, None, None] + _drift(fit["kappa2"])[:, None, None] * h
+        return log_m_from_logit_q(k1 + (x - fit["x_bar"]) * k2)
+    if mid == "apc":
+        beta = fit["beta_t"][:, -1, None, None] + _drift(fit["beta_t"])[:, None, None] * h
+        last_year = fit["last_year"]
+        cohorts = last_year + h - x  # (1, age, h); unseen cohorts take the nearest fitted effect
+        gamma = np.stack([np.interp(cohorts[0], fit["cohorts"], g) for g in fit["gamma_c"]])
+        return fit["alpha_x"][:, :, None] + beta + gamma
+    if mid == "gompertz":
+        log_b = np.log(fit["B"])
+        log_c = np.log(fit["c"])
+        lb = log_b[:, -1, None, None] + _drift(log_b)[:, None, None] * h
+        lc = log_c[:, -1, None, None] + _drift(log_c)[:, None, None] * h
+        gompertz = np.exp(lb + lc * x)
+        if "A" in fit:
+            a = np.maximum(fit["A"][:, -1, None, None] + _drift(fit["A"])[:, None, None] * h, 0.0)
+            return np.log(a + gompertz)
+        return np.log(gompertz)
+    raise ValueError(f"{mid} cannot be projected")
+
+
+def _errors(log_pred, m, mask=None):
+    """RMSE of ln m and MAPE of m per sex over the observed (positive) cells."""
+    ok = (m > 0) & np.isfinite(m)
+    if mask is not None:
+        ok &= mask
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_err = np.where(ok, log_pred - np.log(np.where(ok, m, 1.0)), 0.0)
+        pct = np.where(ok, np.abs(np.expm1(log_pred - np.log(np.where(ok, m, 1.0)))), 0.0)
+    n = np.maximum(ok.sum(axis=(-2, -1)), 1)
+    return np.sqrt((log_err ** 2).sum(axis=(-2, -1)) / n), 100 * pct.sum(axis=(-2, -1)) / n
+
+
+def common_mask(items, ages, years):
+    """(age, year) cells every model in [(mid, options)] is fitted on, or None when all of
+    them use every cell. APC leaves out its sparse corner cohorts."""
+    masks = [apc_design(ages, years, int(options.get("minCohortCells", 3)))[1]
+             for mid, options in items if mid == "apc"]
+    return np.logical_and.reduce(masks) if masks else None
+
+
+def evaluate_model(mid, m, ages, years, holdout: int = 0, options=None, mask=None) -> dict:
+    """Fits `mid` to the (sex, age, year) rates `m` and returns per-sex AIC, BIC, residual
+    autocorrelation, RMSE and MAPE, computed over the (age, year) cells in `mask` when
+    given (see common_mask) so that models fitted on different cells are comparable.
+    With `holdout` > 0 the model is refitted without the last `holdout` years and its
+    drift projection is scored on them (oos_rmse/oos_mape)."""
+    options = options or {}
+    start = time.perf_counter()
+    log_m = log_rates(m)
+    fit, fitted, own_mask = _fit(mid, log_m, ages, years, options)
+    d = fit["diagnostics"]
+    if mask is not None:
+        d = diagnostics(log_m, np.where(mask, fitted, log_m), d["n_params"], mask)
+    _, mape = _errors(fitted, m, own_mask if mask is None else mask)
+    out = {"aic": d["aic"], "bic": d["bic"], "residual_autocorr": d["residual_autocorr"], "rmse": d["rmse"],
+           "mape": mape, "n_params": d["n_params"], "n_obs": d["n_obs"]}
+
+    if 0 < holdout < len(years) - 2:
+        train = m[..., :-holdout]
+        fit_t, _, _ = _fit(mid, log_rates(train), ages, years[:-holdout], options)
+        fit_t["last_year"] = years[-holdout - 1]
+        out["oos_rmse"], out["oos_mape"] = _errors(project(mid, fit_t, ages, holdout), m[..., -holdout:])
+    out["seconds"] = time.perf_counter() - start
+    return out
+
+
+def _evaluate_to(conn, args):
+    """Process target: sends ("ok", result) or ("error", message) back over `conn`."""
+    try:
+        conn.send(("ok", evaluate_model(*args)))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+def run_parallel(jobs: dict, timeout: float, max_workers=None) -> dict:
+    """Runs evaluate_model for every {key: (mid, m, ages, years, holdout, options[, mask])} job,
+    each in its own process and at most `max_workers` at a time. A job's `timeout` budget
+    starts when its process starts, so queued jobs are not charged for the wait; a job over
+    budget has its process terminated. Late or failing jobs map to {"error": ...}.
+    With max_workers <= 1 jobs run in-process without a time limit."""
+    workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    if workers <= 1:
+        out = {}
+        for key, args in jobs.items():
+            try:
+                out[key] = evaluate_model(*args)
+            except Exception as e:  # same as a failure inside a worker process
+                out[key] = {"error": str(e)}
+        return out
+
+    pending, running, out = list(jobs.items()), {}, {}
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                key, args = pending.pop(0)
+                recv, send = multiprocessing.Pipe(duplex=False)
+                proc = multiprocessing.Process(target=_evaluate_to, args=(send, args), daemon=True)
+                proc.start()
+                send.close()
+                running[key] = (proc, recv, time.monotonic() + timeout)
+            wait = min(deadline for _, _, deadline in running.values()) - time.monotonic()
+            ready = connection.wait([recv for _, recv, _ in running.values()], timeout=max(wait, 0))
+            for key, (proc, recv, deadline) in list(running.items()):
+                if recv in ready:
+                    try:
+                        status, value = recv.recv()
+                    except EOFError:  # the worker died without answering
+                        status, value = "error", f"worker exited with code {proc.exitcode}"
+                    out[key] = value if status == "ok" else {"error": value}
+                elif time.monotonic() >= deadline:
+                    proc.terminate()
+                    out[key] = {"error": f"timed out after {timeout:g}s"}
+                else:
+                    continue
+                recv.close()
+                proc.join()
+                del running[key]
+    finally:
+        for proc, recv, _ in running.values():  # only left over when interrupted
+            proc.terminate()
+            recv.close()
+    return {key: out[key] for key in jobs}
+
+
+def rank(entries) -> dict:
+    """Ranking of (model id, name, result) entries by AIC + 100 * |residual autocorrelation|
+    (lower is better), with AIC summed and the autocorrelation averaged over sexes.
+    The results must be evaluated on the same cells (evaluate_model's `mask`) for the
+    AICs to be comparable. Failed models are left out."""
+    scores = []
+    for mid, name, res in entries:
+        if "error" in res:
+            continue
+        aic = float(np.sum(res["aic"]))
+        rho = float(np.mean(res["residual_autocorr"]))
+        scores.append({"model_id": mid, "model_name": name, "score": aic + AUTOCORR_PENALTY * abs(rho),
+                       "aic": aic, "residual_autocorr": rho})
+    scores.sort(key=lambda s: s["score"])
+    return {
+        "model_ranking": scores,
+        "best_model": scores[0]["model_id"] if scores else None,
+        "worst_model": scores[-1]["model_id"] if scores else None,
+    }
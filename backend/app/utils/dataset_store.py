@@ -0,0 +1,287 @@
+import json, os, re, shutil, tempfile, threading, time
+from collections import OrderedDict
+from uuid import uuid4
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .ingest import chunk_kinds, conform, target_dtypes
+from .lineage import chunked_column_fingerprints, column_fingerprints, combine_fingerprints
+from .query import INDEXED_COLUMNS, SortedIndex
+
+FILE_PREFIX = "file::"
+# uploads get a uuid4; derived tables use a fixed prefix and a hash-like body
+DATASET_ID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|(?:clean|sas)-[A-Za-z0-9-]+")
+
+
+def to_records(df: pd.DataFrame, limit: int | None = None) -> list:
+    """DataFrame rows as JSON-safe dicts (NaN -> None)."""
+    part = df if limit is None else df.head(limit)
+    return part.astype(object).where(part.notna(), None).to_dict(orient="records")
+
+
+class DatasetStore:
+    """Registry of columnar tables held in memory under a byte budget.
+    Tables are written to Parquet under `<root>/.store` when registered, so the least
+    recently used ones can be dropped from memory and reloaded lazily, and every worker
+    sharing `root` can open them by id. `file::<name>` ids read files placed in `root`.
+    """
+
+    def __init__(self, root: str, budget_bytes: int):
+        self.root = root
+        self.store_dir = os.path.join(root, ".store")
+        self.budget = budget_bytes
+        self._mem = OrderedDict()  # _mem_key(id) -> (DataFrame, nbytes)
+        self._indexes = {}  # _mem_key(id) -> {column: SortedIndex}, dropped with the table
+        self._lock = threading.RLock()
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    # ----- paths -----
+    def _inside(self, folder, path, dsid):
+        """`path` if it resolves inside `folder`, else KeyError (unknown dataset)."""
+        base = os.path.realpath(folder)
+        if os.path.commonpath([base, os.path.realpath(path)]) != base:
+            raise KeyError(dsid)
+        return path
+
+    def _store_path(self, dsid, ext):
+        if not isinstance(dsid, str) or not DATASET_ID.fullmatch(dsid):
+            raise KeyError(dsid)
+        return self._inside(self.store_dir, os.path.join(self.store_dir, f"{dsid}.{ext}"), dsid)
+
+    def _parquet(self, dsid):
+        return self._store_path(dsid, "parquet")
+
+    def _meta_path(self, dsid):
+        return self._store_path(dsid, "json")
+
+    def _artifact_path(self, dsid, name):
+        self._meta_path(dsid)  # validates the id
+        folder = os.path.join(self.store_dir, "artifacts")
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f"{dsid}.{name}.json")
+
+    def _file_path(self, dsid):
+        return self._inside(self.root, os.path.join(self.root, os.path.basename(dsid[len(FILE_PREFIX):])), dsid)
+
+    def _mem_key(self, dsid):
+        """Memory cache key: the id, plus mtime and size for file:: ids so that a file
+        changed on disk is read again. Raises KeyError for ids that are not strings."""
+        if not isinstance(dsid, str):
+            raise KeyError(dsid)
+        if not dsid.startswith(FILE_PREFIX):
+            return dsid
+        try:
+            st = os.stat(self._file_path(dsid))
+        except FileNotFoundError:
+            raise KeyError(dsid) from None
+        return dsid, st.st_mtime_ns, st.st_size
+
+    # ----- public API -----
+    def put(self, df: pd.DataFrame, name: str, **meta) -> str:
+        dsid = meta.pop("id", None) or str(uuid4())
+        df = df.reset_index(drop=True)
+        try:
+            df.to_parquet(self._parquet(dsid), index=False)
+        except Exception:
+            if os.path.exists(self._parquet(dsid)):
+                os.remove(self._parquet(dsid))
+            raise
+        self._write_meta(dsid, name, len(df), df.columns, column_fingerprints(df), meta)
+        self._remember(dsid, df)
+        return dsid
+
+    def put_chunks(self, frames, name: str, **meta) -> str:
+        """Registers a table given as an iterable of DataFrame chunks without ever holding it
+        whole: each chunk is spilled to a Parquet part as it arrives, then the parts are
+        cast to one dtype per column (ingest.target_dtypes) and streamed into the dataset's
+        Parquet file. The table is loaded on the first get()."""
+        dsid = meta.pop("id", None) or str(uuid4())
+        path = self._parquet(dsid)
+        parts_dir = tempfile.mkdtemp(prefix=".parts-", dir=self.store_dir)
+        tmp = os.path.join(parts_dir, "table.parquet")
+        try:
+            parts, kinds, columns = [], [], None
+            for frame in frames:
+                part = os.path.join(parts_dir, f"{len(parts)}.parquet")
+                frame.reset_index(drop=True).to_parquet(part, index=False)
+                parts.append((part, len(frame)))
+                kinds.append(chunk_kinds(frame))
+                columns = frame.columns if columns is None else columns
+            if not parts:
+                return self.put(pd.DataFrame(), name, id=dsid, **meta)
+            targets = target_dtypes(kinds)
+            rows = sum(n for _, n in parts)
+            writer, schema = None, None
+
+            def conformed():
+                nonlocal writer, schema
+                for part, _ in parts:
+                    chunk = conform(pd.read_parquet(part), targets)
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        # per-chunk categoricals may get narrower dictionary indices
+                        schema = pa.schema([f.with_type(pa.dictionary(pa.int32(), f.type.value_type))
+                                            if pa.types.is_dictionary(f.type) else f for f in table.schema],
+                                           metadata=table.schema.metadata)
+                        writer = pq.ParquetWriter(tmp, schema)
+                    writer.write_table(table.cast(schema))
+                    yield chunk
+
+            hashes = chunked_column_fingerprints(conformed(), rows)
+            writer.close()
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+        self._write_meta(dsid, name, rows, columns, hashes, meta)
+        return dsid
+
+    def _write_meta(self, dsid, name, rows, columns, hashes, meta):
+        info = {"id": dsid, "name": name, "rows": int(rows), "columns": [str(c) for c in columns],
+                "created": time.time(), "fingerprint": combine_fingerprints(rows, hashes), "columnFingerprints": hashes,
+                **meta}
+        tmp = self._meta_path(dsid) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        os.replace(tmp, self._meta_path(dsid))
+
+    def get(self, dsid: str) -> pd.DataFrame:
+        """Returns the table for `dsid`, loading it from disk if it was evicted.
+        Raises KeyError for unknown ids."""
+        key = self._mem_key(dsid)
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                return self._mem[key][0]
+        df = self._load(dsid)
+        self._remember(key, df)
+        return df
+
+    def iter_chunks(self, dsid: str, rows: int, start: int = 0):
+        """Yields the table from row `start` on in frames of at most `rows` rows without
+        loading it whole: slices when it is already in memory, else Parquet record batches
+        (skipping row groups before `start`) or CSV chunks. Raises KeyError for unknown ids."""
+        key = self._mem_key(dsid)
+        with self._lock:
+            cached = self._mem.get(key)
+        if cached is not None:
+            df = cached[0]
+            for lo in range(start, len(df), rows):
+                yield df.iloc[lo:lo + rows]
+            return
+        path = self._file_path(dsid) if dsid.startswith(FILE_PREFIX) else self._parquet(dsid)
+        if not os.path.exists(path):
+            raise KeyError(dsid)
+        if path.lower().endswith(".parquet"):
+            pf = pq.ParquetFile(path)
+            skipped, first = 0, 0
+            while skipped < pf.num_row_groups and first + pf.metadata.row_group(skipped).num_rows <= start:
+                first += pf.metadata.row_group(skipped).num_rows
+                skipped += 1
+            if skipped == pf.num_row_groups:
+                return
+            groups = range(skipped, pf.num_row_groups)
+            chunks = (b.to_pandas() for b in pf.iter_batches(batch_size=rows, row_groups=groups))
+        else:
+            chunks, first = pd.read_csv(path, chunksize=rows), 0
+        for chunk in chunks:
+            skip = max(start - first, 0)
+            first += len(chunk)
+            if skip < len(chunk):
+                yield chunk.iloc[skip:]
+
+    def save_artifact(self, dsid: str, name: str, value):
+        """Stores a JSON-serializable result derived from the (immutable) dataset `dsid`,
+        e.g. report statistics, so every worker can reuse it."""
+        path = self._artifact_path(dsid, name)
+        tmp = f"{path}.{uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def load_artifact(self, dsid: str, name: str):
+        """The artifact saved under `name` for `dsid`, or None."""
+        try:
+            with open(self._artifact_path(dsid, name), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def index(self, dsid: str, column: str):
+        """Lazily built SortedIndex for an indexable column (year/age/sex), else None."""
+        if str(column).lower() not in INDEXED_COLUMNS:
+            return None
+        df = self.get(dsid)
+        with self._lock:
+            cached = self._indexes.setdefault(self._mem_key(dsid), {})
+            if column not in cached:
+                cached[column] = SortedIndex(df[column])
+            return cached[column]
+
+    def meta(self, dsid: str) -> dict:
+        if not isinstance(dsid, str):
+            raise KeyError(dsid)
+        if dsid.startswith(FILE_PREFIX):
+            path = self._file_path(dsid)
+            if not os.path.exists(path):
+                raise KeyError(dsid)
+            return {"id": dsid, "name": os.path.basename(path), "created": os.path.getmtime(path)}
+        try:
+            with open(self._meta_path(dsid), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(dsid) from None
+
+    def exists(self, dsid: str) -> bool:
+        try:
+            self.meta(dsid)
+            return True
+        except KeyError:
+            return False
+
+    def list(self) -> list:
+        items = []
+        for fname in os.listdir(self.store_dir):
+            if fname.endswith(".json"):
+                try:
+                    items.append(self.meta(fname[:-5]))
+                except (KeyError, ValueError):
+                    continue  # written concurrently by another worker
+        return sorted(items, key=lambda m: m.get("created", 0))
+
+    def files(self) -> list:
+        return sorted(f for f in os.listdir(self.root) if f.lower().endswith((".csv", ".parquet")))
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(n for _, n in self._mem.values())
+
+    # ----- internals -----
+    def _load(self, dsid):
+        if dsid.startswith(FILE_PREFIX):
+            path = self._file_path(dsid)
+            if not os.path.exists(path):
+                raise KeyError(dsid)
+            return pd.read_parquet(path) if path.lower().endswith(".parquet") else pd.read_csv(path)
+        if not os.path.exists(self._parquet(dsid)):
+            raise KeyError(dsid)
+        return pd.read_parquet(self._parquet(dsid))
+
+    def _remember(self, key, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if isinstance(key, tuple):  # drop earlier versions of the same file
+                for old in [k for k in self._mem if isinstance(k, tuple) and k[0] == key[0] and k != key]:
+                    del self._mem[old]
+                    self._indexes.pop(old, None)
+            self._mem[key] = (df, nbytes)
+            self._mem.move_to_end(key)
+            total = sum(n for _, n in self._mem.values())
+            # evict LRU tables (already on disk) but always keep the one just used
+            while total > self.budget and len(self._mem) > 1:
+                old, (_, freed) = self._mem.popitem(last=False)
+                self._indexes.pop(old, None)
+                total -= freed
@@ -0,0 +1,114 @@
+import numpy as np
+from .life_table import RADIX
+
+ASSUMPTIONS = ("udd", "constant_force")
+
+
+def _stack(rates) -> np.ndarray:
+    """(J, ...) array from a (J, ...) array or a sequence of J broadcastable arrays."""
+    if isinstance(rates, np.ndarray):
+        return rates.astype(float)
+    return np.stack(np.broadcast_arrays(*[np.asarray(r, dtype=float) for r in rates]))
+
+
+def _survival_poly(q, skip):
+    """Coefficients (lowest order first) of Π_{k∉skip} (1 - t q_k), as arrays over cells."""
+    coeffs = [np.ones_like(q[0])]
+    for k in range(len(q)):
+        if k not in skip:
+            coeffs = [c - q[k] * p for c, p in zip(coeffs + [0.0], [0.0] + coeffs)]
+    return coeffs
+
+
+def _udd_factor(q):
+    """∫₀¹ Π_{k≠j} (1 - t q_k) dt for every decrement j of the (J, ...) rates `q`: the share
+    of q'_j that survives the other decrements when each is uniform in its own table."""
+    return np.stack([sum(c / (r + 1) for r, c in enumerate(_survival_poly(q, {j}))) for j in range(len(q))])
+
+
+def to_dependent(independent, assumption: str = "udd") -> np.ndarray:
+    """Dependent (multiple-decrement) probabilities q^(j) from the associated single-decrement
+    rates q'^(j), stacked on the first axis (J, ...); any trailing axes (age, cohort,
+    scenario, ...) are carried through.
+
+    "udd": each decrement is uniform over the year in its own single-decrement table;
+    "constant_force": each force of decrement is constant over the year (the same relation
+    holds under UDD in the multiple-decrement table).
+    """
+    q = np.clip(_stack(independent), 0.0, 1.0)
+    if assumption == "udd":
+        return q * _udd_factor(q)
+    if assumption == "constant_force":
+        # an infinite force (q' = 1, e.g. death at the open age) takes the whole year
+        certain = q >= 1.0
+        n_certain = certain.sum(axis=0)
+        log_p = np.log1p(-np.where(certain, 0.0, q))
+        total_log_p = log_p.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(total_log_p < 0, log_p / total_log_p, 0.0)
+        return np.where(n_certain > 0, certain / np.maximum(n_certain, 1), share * -np.expm1(total_log_p))
+    raise ValueError(f"unknown assumption {assumption!r}; use {list(ASSUMPTIONS)}")
+
+
+def to_independent(dependent, assumption: str = "udd", tol: float = 1e-12, max_iter: int = 100) -> np.ndarray:
+    """Associated single-decrement rates q'^(j) from dependent probabilities (J, ...),
+    inverting to_dependent. Under "udd" there is no closed form beyond two decrements, so
+    q'_j ∫₀¹ Π_{k≠j} (1 - t q'_k) dt = q_j is solved by Newton's method for all cells at
+    once, starting from the constant-force solution."""
+    q = _stack(dependent)
+    total = q.sum(axis=0)
+    if np.any(total > 1 + 1e-9) or np.any(q < 0):
+        raise ValueError("dependent rates must be non-negative and sum to at most 1")
+    if assumption not in ASSUMPTIONS:
+        raise ValueError(f"unknown assumption {assumption!r}; use {list(ASSUMPTIONS)}")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(total > 0, q / total, 0.0)
+        indep = np.where(share > 0, -np.expm1(share * np.log1p(-np.minimum(total, 1.0))), 0.0)
+    if assumption == "constant_force" or len(q) == 1:
+        return indep
+    shape, n = q.shape, len(q)
+    q, indep = q.reshape(n, -1), np.minimum(indep, 1.0 - 1e-6).reshape(n, -1)  # singular where several q' = 1
+    active = np.arange(q.shape[1])
+    for _ in range(max_iter):
+        x, target = indep[:, active], q[:, active]
+        factor = _udd_factor(x)
+        resid = x * factor - target
+        left = np.max(np.abs(resid), axis=0) >= tol
+        active, x, factor, resid = active[left], x[:, left], factor[:, left], resid[:, left]
+        if not len(active):
+            break
+        jac = np.zeros((len(active), n, n))
+        for j in range(n):
+            jac[:, j, j] = factor[j]
+            for k in range(j + 1, n):  # d/dq'_k of ∫ Π_{m≠j} (1 - t q'_m) dt = -∫ t Π_{m≠j,k} ...
+                d = -sum(c / (r + 2) for r, c in enumerate(_survival_poly(x, {j, k})))
+                jac[:, j, k], jac[:, k, j] = x[j] * d, x[k] * d
+        singular = np.abs(np.linalg.det(jac)) < 1e-12
+        if singular.any():  # fall back to a diagonal (fixed-point like) step there
+            jac[singular] = np.eye(n) * jac[singular]
+        step = np.linalg.solve(jac, resid.T[..., None])[..., 0]
+        indep[:, active] = np.clip(x - step.T, 0.0, 1.0)
+    return indep.reshape(shape)
+
+
+def multiple_decrement_table(dependent, radix: float = RADIX, entry=None) -> dict:
+    """Multiple-decrement table from dependent probabilities (J, ..., age), ages on the last
+    axis. Returns q_total, p_total and lx (..., age) and dx (J, ..., age), where
+    dx[j] = lx * q^(j). With `entry` (integer age positions broadcastable to the leading
+    axes, e.g. one per member cohort) every table starts at its own entry age with l = radix
+    and is 0 before it.
+    """
+    q = _stack(dependent)
+    q_total = np.minimum(q.sum(axis=0), 1.0)
+    p_total = 1.0 - q_total
+    lx = np.empty_like(q_total)
+    lx[..., 0] = 1.0
+    np.cumprod(p_total[..., :-1], axis=-1, out=lx[..., 1:])
+    if entry is not None:
+        entry = np.broadcast_to(np.asarray(entry, dtype=int), lx.shape[:-1])
+        at_entry = np.take_along_axis(lx, entry[..., None], axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lx = np.where(np.arange(lx.shape[-1]) >= entry[..., None],
+                          np.where(at_entry > 0, lx / at_entry, 0.0), 0.0)
+    lx *= radix
+    return {"q_total": q_total, "p_total": p_total, "lx": lx, "dx": lx * q}
@@ -0,0 +1,160 @@
+import csv, html, io, json, zipfile
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+try:  # optional: inline Plotly charts when the package is installed, SVG otherwise
+    import plotly.offline as plotly_offline
+except ImportError:
+    plotly_offline = None
+
+CHUNK_BYTES = 1 << 16
+CSV_ROWS = 2000
+PLOTLY_JS = "plotly.min.js"
+
+
+class _Sink:
+    """Write-only file object that buffers output until drained. It has tell() but no
+    seek(), so zipfile and Parquet write sequentially (ZIP data descriptors)."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts, self._pos = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def stream_zip(entries):
+    """Yields a ZIP archive piece by piece from (name, chunks) entries, where `chunks`
+    is an iterable of bytes/str produced lazily; only the current chunk is held."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, chunks in entries:
+            with zf.open(name, "w", force_zip64=True) as f:
+                for chunk in chunks:
+                    f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
+
+def csv_chunks(header, rows, batch: int = CSV_ROWS):
+    """CSV text in blocks of `batch` rows from an iterable of row sequences."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    if header is not None:
+        writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def json_chunks(obj):
+    """Compact JSON of `obj` in blocks of about CHUNK_BYTES, without building the string."""
+    parts, size = [], 0
+    for piece in json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).iterencode(obj):
+        parts.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts)
+            parts, size = [], 0
+    yield "".join(parts)
+
+
+def table_chunks(batches, fmt: str = "csv"):
+    """Serialises an iterable of pyarrow RecordBatches as CSV or Parquet (one row group
+    per batch), yielding the bytes written for each batch."""
+    sink, writer = _Sink(), None
+    for batch in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(sink, batch.schema) if fmt == "parquet" else pa_csv.CSVWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+
+def _svg_bars(labels, values, y_title):
+    width, height, pad = 760, 420, 60
+    nums = [v for v in values if v is not None]
+    lo, hi = min(nums + [0.0]), max(nums + [0.0])
+    span = (hi - lo) or 1.0
+
+    def scale(v):
+        return pad + (hi - v) / span * (height - 2 * pad)
+
+    step = (width - 2 * pad) / max(len(labels), 1)
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" font-size="12">',
+           f'<line x1="{pad}" y1="{scale(0):.1f}" x2="{width - pad}" y2="{scale(0):.1f}" stroke="#333"/>',
+           f'<text x="14" y="{height / 2}" transform="rotate(-90 14 {height / 2})" text-anchor="middle">{html.escape(y_title)}</text>']
+    for i, (label, v) in enumerate(zip(labels, values)):
+        x = pad + i * step + step * 0.15
+        if v is not None:
+            top, bottom = sorted((scale(v), scale(0)))
+            out.append(f'<rect x="{x:.1f}" y="{top:.1f}" width="{step * 0.7:.1f}" height="{max(bottom - top, 1):.1f}" '
+                       f'fill="#1f77b4"><title>{html.escape(str(label))}: {v:.6g}</title></rect>')
+            out.append(f'<text x="{x + step * 0.35:.1f}" y="{top - 4:.1f}" text-anchor="middle">{v:.4g}</text>')
+        out.append(f'<text x="{x + step * 0.35:.1f}" y="{height - pad + 16}" text-anchor="middle">{html.escape(str(label))}</text>')
+    out.append("</svg>")
+    return "".join(out)
+
+
+def chart_html(viz: dict) -> str:
+    """Standalone HTML for one comparison chart; never loads anything from the network.
+    Plotly charts load PLOTLY_JS from the same folder (see chart_entries)."""
+    title = html.escape(viz.get("title", ""))
+    if plotly_offline is not None:
+        return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title>"
+                f"<script src='{PLOTLY_JS}'></script></head><body>"
+                "<div id='c' style='width:800px;height:600px;'></div>"
+                f"<script>Plotly.newPlot('c', {json.dumps(viz['data'])}, {json.dumps(viz['layout'])});</script>"
+                "</body></html>")
+    trace = viz["data"][0]
+    y_title = viz.get("layout", {}).get("yaxis", {}).get("title", "")
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title></head><body>"
+            f"<h3>{title}</h3>{_svg_bars(trace['x'], trace['y'], y_title)}</body></html>")
+
+
+def _chart_chunks(viz):
+    yield chart_html(viz)
+
+
+def _plotly_js_chunks():
+    js = plotly_offline.get_plotlyjs()
+    for i in range(0, len(js), CHUNK_BYTES):
+        yield js[i:i + CHUNK_BYTES]
+
+
+def chart_entries(visualizations) -> list:
+    """(name, chunks) entries chart_1.html ... with each page rendered only when its entry
+    is written, plus one shared PLOTLY_JS when Plotly is installed."""
+    entries = [(f"chart_{i + 1}.html", _chart_chunks(viz)) for i, viz in enumerate(visualizations)]
+    if plotly_offline is not None and entries:
+        entries.append((PLOTLY_JS, _plotly_js_chunks()))
+    return entries
@@ -0,0 +1,65 @@
+import numpy as np
+from .mortality import diagnostics
+
+
+def _makeham_lm(y: np.ndarray, x: np.ndarray, theta: np.ndarray, iterations: int):
+    """Levenberg-Marquardt on ln(mu) = ln(A + exp(b + g*x)) for N curves at once.
+    `y` is (N, ages), `theta` is (N, 3) = (A, b, g); each curve keeps its own damping.
+    """
+    def evaluate(th):
+        gomp = np.exp(th[:, 1:2] + th[:, 2:3] * x)
+        mu = th[:, 0:1] + gomp
+        r = y - np.log(mu)
+        return r, gomp, mu, (r ** 2).sum(axis=1)
+
+    r, gomp, mu, sse = evaluate(theta)
+    lam = np.full(len(theta), 1e-3)
+    for _ in range(iterations):
+        jac = np.stack([1 / mu, gomp / mu, x * gomp / mu], axis=2)  # (N, ages, 3)
+        jtj = np.einsum("nai,naj->nij", jac, jac)
+        jtr = np.einsum("nai,na->ni", jac, r)
+        damp = lam[:, None, None] * (jtj * np.eye(3) + 1e-12 * np.eye(3))
+        step = np.linalg.solve(jtj + damp, jtr[..., None])[..., 0]
+        cand = theta + step
+        cand[:, 0] = np.maximum(cand[:, 0], 0.0)
+        r2, gomp2, mu2, sse2 = evaluate(cand)
+        better = sse2 < sse
+        theta = np.where(better[:, None], cand, theta)
+        r, gomp, mu = (np.where(better[:, None], new, old) for new, old in ((r2, r), (gomp2, gomp), (mu2, mu)))
+        sse = np.where(better, sse2, sse)
+        lam = np.where(better, lam / 3, lam * 4)
+    return theta
+
+
+def fit_gompertz(log_m: np.ndarray, ages, makeham: bool = False, iterations: int = 40) -> dict:
+    """Fits mu_x = B*c^x (or A + B*c^x with `makeham`) to every (sex, year) column at once.
+    Gompertz is one log-linear lstsq over all columns; Makeham starts from it and runs a
+    batched Levenberg-Marquardt. Returns (sex, year) parameter series.
+    """
+    log_m = np.asarray(log_m, dtype=float)
+    if log_m.ndim == 2:
+        log_m = log_m[None]
+    n_sexes, n_ages, n_years = log_m.shape
+    x = np.asarray(ages, dtype=float)
+    x_c = x - x.mean()  # centred ages keep the normal equations well conditioned
+
+    y = log_m.transpose(1, 0, 2).reshape(n_ages, -1)
+    design = np.column_stack([np.ones(n_ages), x_c])
+    (b, g), *_ = np.linalg.lstsq(design, y, rcond=None)
+    a = np.zeros_like(b)
+    if makeham:
+        a, b, g = _makeham_lm(y.T, x_c, np.column_stack([a, b, g]), iterations).T
+
+    fitted = np.log(a[None, :] + np.exp(b[None, :] + g[None, :] * x_c[:, None]))
+    fitted = fitted.reshape(n_ages, n_sexes, n_years).transpose(1, 0, 2)
+    shape = (n_sexes, n_years)
+    out = {
+        "B": np.exp(b - g * x.mean()).reshape(shape),
+        "c": np.exp(g).reshape(shape),
+        "fitted": fitted,
+        "rmse_t": np.sqrt(((log_m - fitted) ** 2).mean(axis=1)),
+        "diagnostics": diagnostics(log_m, fitted, (3 if makeham else 2) * n_years),
+    }
+    if makeham:
+        out["A"] = a.reshape(shape)
+    return out
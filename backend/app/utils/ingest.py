@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+CHUNK_ROWS = 200000
+CATEGORICAL_COLUMNS = ("sex", "gender", "country", "region", "state")
+CSV_EXTENSIONS = (".csv", ".txt")
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcasts integer columns to the smallest int type and turns sex/country-like
+    text columns into categoricals. Floats stay float64 to keep rate precision."""
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_integer_dtype(s):
+            df[col] = pd.to_numeric(s, downcast="integer")
+        elif str(col).lower() in CATEGORICAL_COLUMNS and not isinstance(s.dtype, pd.CategoricalDtype):
+            df[col] = s.astype("category")
+    return df
+
+
+def _as_text(s: pd.Series) -> pd.Series:
+    """Values as strings, keeping missing values missing."""
+    return s.astype(object).where(s.isna(), s.astype(str))
+
+
+def _numeric(dtype) -> bool:
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def chunk_kinds(frame: pd.DataFrame) -> dict:
+    """{column: (dtype, has values)} of one chunk, the input of target_dtypes."""
+    return {col: (frame[col].dtype, bool(frame[col].notna().any())) for col in frame.columns}
+
+
+def target_dtypes(kinds: list) -> dict:
+    """One dtype per column from the chunk_kinds of every chunk: "text" where chunks
+    disagree (e.g. numbers first, text later), "text-category" for categoricals whose
+    categories differ in type, ("category", empty categories) for all-missing chunks of
+    a categorical, else the common numeric dtype (int + float -> float, int + an
+    all-missing chunk -> float) or the one dtype seen. Columns left out keep their dtype."""
+    targets = {}
+    for col in kinds[0]:
+        entries = [k[col] for k in kinds]
+        seen = [d for d, has in entries if has]
+        missing = len(seen) < len(entries)
+        if all(isinstance(d, pd.CategoricalDtype) for d, _ in entries):
+            if len({str(d.categories.dtype) for d in seen}) > 1:
+                targets[col] = "text-category"
+            elif seen and missing:
+                targets[col] = ("category", seen[0].categories[:0])
+        elif not seen:
+            continue
+        elif all(_numeric(d) for d in seen):
+            targets[col] = np.result_type(*seen, *([np.float64] if missing else []))
+        elif len(set(seen)) == 1 and not isinstance(seen[0], pd.CategoricalDtype):
+            targets[col] = object if missing else seen[0]
+        else:
+            targets[col] = "text"
+    return targets
+
+
+def conform(frame: pd.DataFrame, targets: dict) -> pd.DataFrame:
+    """Casts the chunk's columns to their target_dtypes (in place)."""
+    for col, target in targets.items():
+        s = frame[col]
+        if isinstance(target, str) and target == "text-category":
+            frame[col] = _as_text(s).astype("category")
+        elif isinstance(target, str) and target == "text":
+            frame[col] = _as_text(s.astype(object) if isinstance(s.dtype, pd.CategoricalDtype) else s)
+        elif isinstance(target, tuple):
+            if not s.notna().any():
+                frame[col] = pd.Categorical(np.full(len(frame), np.nan), categories=target[1])
+        elif s.dtype != target:
+            frame[col] = s.astype(target)
+    return frame
+
+
+def unify_dtypes(frames: list) -> list:
+    """Gives every column one dtype across chunk frames (in place), see target_dtypes."""
+    targets = target_dtypes([chunk_kinds(f) for f in frames])
+    for f in frames:
+        conform(f, targets)
+    return frames
+
+
+def concat_frames(frames: list) -> pd.DataFrame:
+    """Concatenates chunk frames after unify_dtypes, unioning categoricals whose categories
+    differ per chunk."""
+    if len(frames) == 1:
+        return frames[0]
+    frames = unify_dtypes(frames)
+    cats = [c for c in frames[0].columns if all(isinstance(f[c].dtype, pd.CategoricalDtype) for f in frames)]
+    out = pd.concat([f.drop(columns=cats) for f in frames], ignore_index=True)
+    for col in cats:
+        out[col] = union_categoricals([f[col] for f in frames], ignore_order=True)
+    return out[frames[0].columns]
+
+
+def iter_upload(path: str, filename: str, chunk_rows: int = CHUNK_ROWS):
+    """Yields an uploaded file from disk as DataFrame chunks of at most `chunk_rows` rows.
+    CSV chunks are downcast as they are parsed; Parquet batches are read as-is.
+    Raises ValueError for other formats."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in PARQUET_EXTENSIONS:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif ext in CSV_EXTENSIONS:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            yield optimize_dtypes(chunk)
+    else:
+        raise ValueError(f"Unsupported file type {ext or filename}")
+
+
+def read_upload(path: str, filename: str, chunk_rows: int = CHUNK_ROWS) -> pd.DataFrame:
+    """Reads an uploaded file into one compact DataFrame (see iter_upload). Files that are
+    stored go through DatasetStore.put_chunks instead, which never holds them whole."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in PARQUET_EXTENSIONS:
+        return pd.read_parquet(path)
+    frames = list(iter_upload(path, filename, chunk_rows))
+    return concat_frames(frames) if frames else pd.DataFrame()
+
+
+def column_stats(df: pd.DataFrame) -> list:
+    """Per-column dtype, null count, memory and numeric min/max for upload responses."""
+    nulls = df.isna().sum()
+    mem = df.memory_usage(deep=True, index=False)
+    stats = []
+    for col in df.columns:
+        s = df[col]
+        item = {"field": str(col), "dtype": str(s.dtype), "missing": int(nulls[col]), "bytes": int(mem[col])}
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s) and s.notna().any():
+            vals = s.to_numpy(dtype=float, na_value=np.nan)
+            item["min"], item["max"] = float(np.nanmin(vals)), float(np.nanmax(vals))
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            item["categories"] = int(len(s.cat.categories))
+        stats.append(item)
+    return stats
+
+
+def chunked_column_stats(chunks) -> list:
+    """column_stats of a table given as DataFrame chunks, one chunk in memory at a time."""
+    out, cats = None, {}
+    for chunk in chunks:
+        stats = column_stats(chunk)
+        for col, item in zip(chunk.columns, stats):
+            if "categories" in item:
+                cats.setdefault(item["field"], set()).update(chunk[col].cat.categories)
+        if out is None:
+            out = stats
+            continue
+        for acc, item in zip(out, stats):
+            if acc["dtype"] != item["dtype"]:  # e.g. an int column with nulls in some batches only
+                try:
+                    acc["dtype"] = str(np.result_type(acc["dtype"], item["dtype"]))
+                except TypeError:
+                    acc["dtype"] = "object"
+            acc["missing"] += item["missing"]
+            acc["bytes"] += item["bytes"]
+            if "min" in item:
+                acc["min"] = min(acc.get("min", item["min"]), item["min"])
+                acc["max"] = max(acc.get("max", item["max"]), item["max"])
+    for item in out or []:
+        if item["field"] in cats:
+            item["categories"] = len(cats[item["field"]])
+    return out or []
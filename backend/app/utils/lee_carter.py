@@ -0,0 +1,31 @@
+import numpy as np
+from .mortality import diagnostics
+
+
+def fit_lee_carter(log_m: np.ndarray) -> dict:
+    """Fits ln(m_x,t) = a_x + b_x*k_t for a stack of (sex, age, year) surfaces at once.
+    One batched SVD over the centred matrices; constraints sum(b_x)=1, sum(k_t)=0.
+    """
+    log_m = np.asarray(log_m, dtype=float)
+    if log_m.ndim == 2:
+        log_m = log_m[None]
+    n_ages, n_years = log_m.shape[1:]
+
+    a = log_m.mean(axis=2)
+    z = log_m - a[..., None]
+    u, s, vt = np.linalg.svd(z, full_matrices=False)
+    b = u[:, :, 0]
+    k = s[:, :1] * vt[:, 0, :]  # rows of z are centred, so sum(k) is already 0
+
+    scale = b.sum(axis=1, keepdims=True)
+    b, k = b / scale, k * scale
+    fitted = a[..., None] + b[..., None] * k[:, None, :]
+
+    return {
+        "a_x": a,
+        "b_x": b,
+        "k_t": k,
+        "explained_variance": s[:, 0] ** 2 / np.maximum((s ** 2).sum(axis=1), 1e-300),
+        "fitted": fitted,
+        "diagnostics": diagnostics(log_m, fitted, 2 * n_ages + n_years - 2),
+    }
@@ -0,0 +1,75 @@
+import numpy as np
+
+COLUMNS = ("mx", "qx", "ax", "lx", "dx", "Lx", "Tx", "ex")
+RADIX = 100000.0
+
+# Andreev-Kingkade (2015) a0 as used by the HMD: (m0 breakpoints, intercepts, slopes)
+_A0 = {
+    "Male": ((0.02300, 0.08307), (0.14929, 0.02832, 0.29915), (-1.99545, 3.26201, 0.0)),
+    "Female": ((0.01724, 0.06891), (0.14903, 0.04667, 0.31411), (-2.05527, 3.88089, 0.0)),
+}
+
+
+def infant_a0(m0, sex: str = "Total"):
+    """Average fraction of the first year lived by infants who die, from m0.
+    "Total" (or any other label) takes the mean of the male and female formulas."""
+    m0 = np.asarray(m0, dtype=float)
+    if sex not in _A0:
+        return 0.5 * (infant_a0(m0, "Male") + infant_a0(m0, "Female"))
+    breaks, a, b = _A0[sex]
+    seg = np.searchsorted(np.asarray(breaks), m0, side="right")
+    return np.asarray(a)[seg] + np.asarray(b)[seg] * m0
+
+
+def _fill_forward(m, ok):
+    """Replaces cells where `ok` is False by the nearest earlier ok cell along the last axis."""
+    idx = np.where(ok, np.arange(m.shape[-1]), 0)
+    np.maximum.accumulate(idx, axis=-1, out=idx)
+    return np.take_along_axis(m, idx, axis=-1)
+
+
+def life_table(m, ages, sexes=None, radix: float = RADIX) -> dict:
+    """Period life tables from central death rates `m` with ages on the last axis (any
+    leading axes, e.g. (sex, year, age)); the last age is the open interval (e.g. 110+).
+    Returns {"mx", "qx", "ax", "lx", "dx", "Lx", "Tx", "ex"}, each shaped like `m`.
+
+    a_x = 1/2 except a_0 (Andreev-Kingkade, by sex when the first axis is `sexes`) and the
+    open interval, where a = 1/m and L = l/m. Missing interior rates take the previous
+    age's rate; a missing or zero open-interval rate takes the last positive one.
+    """
+    m = np.asarray(m, dtype=float)
+    ages = np.asarray(ages)
+    if len(ages) != m.shape[-1] or (len(ages) > 1 and np.any(np.diff(ages) != 1)):
+        raise ValueError("life tables need consecutive single-year ages along the last axis")
+    m = _fill_forward(m, np.isfinite(m) & (m >= 0))
+    m[..., -1] = _fill_forward(m, m > 0)[..., -1]
+
+    ax = np.full_like(m, 0.5)
+    if ages[0] == 0:
+        if sexes is None:
+            ax[..., 0] = infant_a0(m[..., 0])
+        else:
+            for s, sex in enumerate(sexes):
+                ax[s, ..., 0] = infant_a0(m[s, ..., 0], sex)
+
+    qx = np.minimum(m / (1.0 + (1.0 - ax) * m), 1.0)
+    qx[..., -1] = 1.0
+    lx = lx_from_qx(qx, radix)
+    dx = lx * qx
+    Lx = lx - (1.0 - ax) * dx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ax[..., -1] = 1.0 / m[..., -1]
+        Lx[..., -1] = lx[..., -1] * ax[..., -1]
+        Tx = np.cumsum(Lx[..., ::-1], axis=-1)[..., ::-1]
+        ex = np.where(lx > 0, Tx / np.where(lx > 0, lx, 1.0), 0.0)
+    return {"mx": m, "qx": qx, "ax": ax, "lx": lx, "dx": dx, "Lx": Lx, "Tx": Tx, "ex": ex}
+
+
+def lx_from_qx(qx, radix: float = RADIX):
+    """Survivors l_x from death probabilities (..., age); the last age is closed (q = 1)."""
+    qx = np.minimum(np.asarray(qx, dtype=float), 1.0)
+    lx = np.empty_like(qx)
+    lx[..., 0] = radix
+    np.cumprod(1.0 - qx[..., :-1], axis=-1, out=lx[..., 1:])
+    lx[..., 1:] *= radix
+    return lx
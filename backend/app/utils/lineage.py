@@ -1,17 +1,173 @@
-import json, os, uuid, hashlib
-from datetime import datetime
-
-def track_lineage(input_data, operation, params, output_data):
-    rec = {
-        "id": str(uuid.uuid4()),
-        "timestamp": datetime.utcnow().isoformat(),
-        "operation": operation,
-        "parameters": params,
-        "input_hash": hashlib.sha256(json.dumps(input_data, default=str).encode()).hexdigest(),
-        "output_hash": hashlib.sha256(json.dumps(output_data, default=str).encode()).hexdigest(),
-    }
-    path = os.path.abspath(".logs/lineage")
-    os.makedirs(path, exist_ok=True)
-    with open(os.path.join(path, f"{rec['id']}.json"), "w", encoding="utf-8") as f:
-        json.dump(rec, f, ensure_ascii=False, indent=2)
-    return rec["id"]
+import hashlib, json, os, sqlite3, threading, time, uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    ts REAL,
+    operation TEXT,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS edges (
+    record TEXT,
+    node TEXT,
+    hash TEXT,
+    role TEXT  -- "in" or "out"
+);
+CREATE INDEX IF NOT EXISTS edges_node ON edges (node, role);
+CREATE INDEX IF NOT EXISTS edges_record ON edges (record, role);
+"""
+
+
+def _digest(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        h.update(p if isinstance(p, (bytes, memoryview)) else str(p).encode())
+        h.update(b"\x00")
+    return h
+
+
+def _column_bytes(s: pd.Series) -> memoryview:
+    arr = s.to_numpy() if s.dtype.kind in "biufcmM" and not isinstance(s.dtype, pd.api.extensions.ExtensionDtype) \
+        else None
+    if arr is None:
+        arr = pd.util.hash_pandas_object(s, index=False).to_numpy()
+    return memoryview(np.ascontiguousarray(arr)).cast("B")
+
+
+def _column_hash(values) -> str:
+    """Hash of one column from its buffer: numeric/bool/datetime data is hashed as raw
+    bytes, object and extension dtypes through pandas' vectorized row hashes."""
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    return _digest(str(s.dtype), len(s), _column_bytes(s)).hexdigest()
+
+
+def column_fingerprints(df: pd.DataFrame) -> dict:
+    """{column: hash} of a DataFrame; unchanged columns keep their hash across versions."""
+    return {str(c): _column_hash(df[c]) for c in df.columns}
+
+
+def chunked_column_fingerprints(chunks, rows: int) -> dict:
+    """column_fingerprints of the concatenation of `chunks` (DataFrames with the same
+    dtypes, `rows` rows in total), hashed one chunk at a time."""
+    hashers = None
+    for chunk in chunks:
+        if hashers is None:
+            hashers = {str(c): _digest(str(chunk[c].dtype), rows) for c in chunk.columns}
+        for c in chunk.columns:
+            hashers[str(c)].update(_column_bytes(chunk[c]))
+    for h in (hashers or {}).values():
+        h.update(b"\x00")
+    return {c: h.hexdigest() for c, h in (hashers or {}).items()}
+
+
+def combine_fingerprints(rows: int, columns: dict) -> str:
+    """Table fingerprint from its row count and per-column hashes (column order matters)."""
+    return _digest("frame", rows, *(f"{c}={h}" for c, h in columns.items())).hexdigest()
+
+
+def fingerprint(obj) -> str:
+    """Content hash of a DataFrame, Arrow table, array or JSON-like value, usable as a cache
+    key. Tables combine their per-column hashes (in column order), so the cost is one pass
+    over the buffers rather than serialising the data."""
+    if isinstance(obj, pa.Table):
+        obj = obj.to_pandas()
+    if isinstance(obj, pd.DataFrame):
+        return combine_fingerprints(len(obj), column_fingerprints(obj))
+    if isinstance(obj, pd.Series):
+        return _digest("series", obj.name, _column_hash(obj)).hexdigest()
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in "biufcmM":
+        return _digest("array", obj.dtype, obj.shape, memoryview(np.ascontiguousarray(obj)).cast("B")).hexdigest()
+    if isinstance(obj, (bytes, memoryview)):
+        return _digest("bytes", obj).hexdigest()
+    return _digest("json", json.dumps(obj, sort_keys=True, default=str)).hexdigest()
+
+
+class LineageStore:
+    """Lineage records in one indexed SQLite file shared by all workers. A record links the
+    nodes (dataset ids, result ids or content hashes) an operation read to the ones it
+    produced, so the ancestry of any node is one recursive query.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(_SCHEMA)
+
+    def _db(self):
+        # one connection per thread (and per process after a fork), kept open so that
+        # recording an operation costs a single small transaction
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def record(self, operation: str, inputs=None, outputs=None, params=None) -> str:
+        """Stores one operation; `inputs`/`outputs` map node id -> content hash (or None),
+        or are plain lists of ids. Returns the record id."""
+        rid = uuid.uuid4().hex
+        edges = [(rid, str(node), h, role)
+                 for role, nodes in (("in", inputs), ("out", outputs))
+                 for node, h in (nodes.items() if isinstance(nodes, dict) else ((n, None) for n in nodes or ()))]
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            db.execute("INSERT INTO records VALUES (?, ?, ?, ?)",
+                       (rid, time.time(), operation, json.dumps(params or {}, default=str)))
+            db.executemany("INSERT INTO edges VALUES (?, ?, ?, ?)", edges)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return rid
+
+    def ancestry(self, node: str, max_depth: int = 50) -> list:
+        """Records that produced `node`, then those that produced their inputs, and so on
+        (each record once, at its nearest depth):
+        [{"id", "operation", "timestamp", "parameters", "depth", "inputs", "outputs"}]."""
+        db = self._db()
+        out, seen, frontier = [], set(), {str(node)}
+        for depth in range(1, max_depth + 1):
+            if not frontier:
+                break
+            marks = ",".join("?" * len(frontier))
+            rows = db.execute(f"""
+                SELECT DISTINCT r.id, r.operation, r.ts, r.params FROM edges e JOIN records r ON r.id = e.record
+                WHERE e.role = 'out' AND e.node IN ({marks}) ORDER BY r.ts DESC""", list(frontier)).fetchall()
+            rows = [row for row in rows if row[0] not in seen]
+            seen.update(row[0] for row in rows)
+            frontier = set()
+            for row in rows:
+                rec = self._expand(db, (*row, depth))
+                frontier.update(rec["inputs"])
+                out.append(rec)
+        return out
+
+    def get(self, record_id: str):
+        db = self._db()
+        row = db.execute("SELECT id, operation, ts, params, 0 FROM records WHERE id = ?", (record_id,)).fetchone()
+        return self._expand(db, row) if row else None
+
+    def _expand(self, db, row):
+        rid, operation, ts, params, depth = row
+        rec = {"id": rid, "operation": operation, "timestamp": ts, "parameters": json.loads(params),
+               "depth": depth, "inputs": {}, "outputs": {}}
+        for node, h, role in db.execute("SELECT node, hash, role FROM edges WHERE record = ?", (rid,)):
+            rec["inputs" if role == "in" else "outputs"][node] = h
+        return rec
+
+
+def track_lineage(input_data, operation, params, output_data, store: LineageStore | None = None):
+    """Records an operation on in-memory data, using content fingerprints as node ids."""
+    if store is None:
+        from .. import extensions
+        store = extensions.lineage
+    fp_in, fp_out = fingerprint(input_data), fingerprint(output_data)
+    return store.record(operation, {fp_in: fp_in}, {fp_out: fp_out}, params)
@@ -0,0 +1,91 @@
+import warnings
+import numpy as np
+import pyarrow as pa
+from .tables import HMD_RATE_COLUMNS, select
+
+
+def rate_surface(table: pa.Table, sexes=None, years=None, ages=None):
+    """Pivots the long HMD table into a dense (sex, age, year) array of m_x.
+    Returns (years, ages, m); cells absent from the table are NaN.
+    """
+    sexes = list(sexes or HMD_RATE_COLUMNS)
+    sel = select(table, years=years, ages=ages)
+    year_col = sel.column("Year").to_numpy()
+    age_col = sel.column("Age").to_numpy()
+    yrs, t_idx = np.unique(year_col, return_inverse=True)
+    ags, a_idx = np.unique(age_col, return_inverse=True)
+    m = np.full((len(sexes), len(ags), len(yrs)), np.nan)
+    for s, sex in enumerate(sexes):
+        m[s, a_idx, t_idx] = sel.column(sex).to_numpy(zero_copy_only=False)
+    return yrs, ags, m
+
+
+def log_rates(m: np.ndarray) -> np.ndarray:
+    """ln(m) with zero/missing cells filled by the age's mean log rate over the period."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_m = np.log(np.where(m > 0, m, np.nan))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        fill = np.nanmean(log_m, axis=-1, keepdims=True)
+    if np.isnan(fill).any():
+        raise ValueError("surface has ages without any positive rate")
+    return np.where(np.isnan(log_m), fill, log_m)
+
+
+def logit_q_from_log_m(log_m: np.ndarray) -> np.ndarray:
+    """logit(q) under a constant force within the year, q = 1 - exp(-m)."""
+    q = -np.expm1(-np.exp(log_m))
+    return np.log(q) - np.log1p(-q)
+
+
+def log_m_from_logit_q(eta: np.ndarray) -> np.ndarray:
+    """Inverse of logit_q_from_log_m: m = -ln(1 - q) = ln(1 + e^eta)."""
+    return np.log(np.logaddexp(0.0, eta))
+
+
+def residual_autocorr(resid: np.ndarray) -> np.ndarray:
+    """Lag-1 autocorrelation of residuals along the year axis, pooled over ages."""
+    r = resid - resid.mean(axis=-1, keepdims=True)
+    num = (r[..., 1:] * r[..., :-1]).sum(axis=(-2, -1))
+    den = (r * r).sum(axis=(-2, -1))
+    return num / np.where(den > 0, den, 1.0)
+
+
+def diagnostics(observed: np.ndarray, fitted: np.ndarray, n_params: int, mask=None) -> dict:
+    """Gaussian log-likelihood based AIC/BIC per sex, on the (sex, age, year) log scale.
+    `mask` (age, year) restricts the statistics to the cells a model was fitted on.
+    """
+    resid = observed - fitted
+    if mask is not None:
+        resid = np.where(mask, resid, 0.0)
+    n = int(mask.sum()) if mask is not None else resid.shape[-2] * resid.shape[-1]
+    rss = (resid ** 2).sum(axis=(-2, -1))
+    loglik = -0.5 * n * (np.log(2 * np.pi * np.maximum(rss, 1e-300) / n) + 1)
+    return {
+        "loglik": loglik,
+        "aic": -2 * loglik + 2 * n_params,
+        "bic": -2 * loglik + n_params * np.log(n),
+        "rmse": np.sqrt(rss / n),
+        "residual_autocorr": residual_autocorr(resid),
+        "n_params": n_params,
+        "n_obs": n,
+    }
+
+
+def per_sex(sexes, arrays: dict) -> dict:
+    """Splits {name: array with leading sex axis} into {sex: {name: list}} for JSON."""
+    return {
+        sex: {k: (v[s].tolist() if isinstance(v, np.ndarray) and v.ndim else v) for k, v in arrays.items()}
+        for s, sex in enumerate(sexes)
+    }
+
+
+def jsonable(obj):
+    """Recursively converts numpy arrays/scalars inside dicts and lists to plain Python."""
+    if isinstance(obj, dict):
+        return {str(k): jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [jsonable(v) for v in obj]
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    return obj
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+INDEXED_COLUMNS = ("year", "age", "sex")
+
+
+def find_column(df: pd.DataFrame, name: str):
+    """Case-insensitive column lookup ("year" matches Year/YEAR)."""
+    return next((c for c in df.columns if str(c).lower() == str(name).lower()), None)
+
+
+def _index_values(col: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(col):
+        return col.to_numpy(dtype=float, na_value=np.nan)
+    return col.astype(str).to_numpy()
+
+
+class SortedIndex:
+    """Row positions ordered by one column, so ranges and IN lists are binary searches."""
+
+    def __init__(self, col: pd.Series):
+        values = _index_values(col)
+        self.numeric = values.dtype.kind == "f"
+        self.order = np.argsort(values, kind="stable")
+        self.sorted = values[self.order]
+
+    def _key(self, v):
+        return float(v) if self.numeric else str(v)
+
+    def spans(self, pred: dict) -> list:
+        """(start, stop) slices of `order` matching the predicate."""
+        if "in" in pred:
+            keys = sorted({self._key(v) for v in pred["in"]})
+            lo = np.searchsorted(self.sorted, keys, side="left")
+            hi = np.searchsorted(self.sorted, keys, side="right")
+            return [(a, b) for a, b in zip(lo, hi) if b > a]
+        lo = 0 if pred.get("min") is None else np.searchsorted(self.sorted, self._key(pred["min"]), side="left")
+        hi = len(self.sorted) if pred.get("max") is None else np.searchsorted(self.sorted, self._key(pred["max"]), side="right")
+        nan = np.searchsorted(self.sorted, np.inf, side="right") if self.numeric else len(self.sorted)
+        if pred.get("max") is None:
+            hi = nan  # NaNs sort last; they only match with keep_missing
+        spans = [(lo, hi)] if hi > lo else []
+        if pred.get("keep_missing") and nan < len(self.sorted):
+            spans.append((nan, len(self.sorted)))
+        return spans
+
+    def count(self, pred: dict) -> int:
+        return sum(b - a for a, b in self.spans(pred))
+
+    def positions(self, pred: dict) -> np.ndarray:
+        spans = self.spans(pred)
+        if not spans:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate([self.order[a:b] for a, b in spans])
+
+
+def predicate_mask(col: pd.Series, pred: dict) -> np.ndarray:
+    """Vectorized boolean mask for one predicate over (a subset of) a column."""
+    if "in" in pred:
+        if pd.api.types.is_numeric_dtype(col):
+            return col.isin([float(v) for v in pred["in"]]).to_numpy()
+        return col.astype(str).isin([str(v) for v in pred["in"]]).to_numpy()
+    vals = pd.to_numeric(col, errors="coerce")
+    mask = np.array(vals.notna(), dtype=bool)
+    if pred.get("min") is not None:
+        mask &= np.asarray(vals >= float(pred["min"]))
+    if pred.get("max") is not None:
+        mask &= np.asarray(vals <= float(pred["max"]))
+    if pred.get("keep_missing"):
+        mask |= np.asarray(vals.isna())
+    return mask
+
+
+def parse_filters(body: dict) -> dict:
+    """Normalises the request's filters to {column: {"in": [...]} | {"min": x, "max": y}}.
+    Accepts `filters` as {col: [values]} / {col: {"min", "max", "in"}} / {col: scalar},
+    plus the legacy startYear/endYear pair.
+    """
+    out = {}
+    for col, spec in (body.get("filters") or {}).items():
+        if isinstance(spec, dict):
+            out[col] = {k: v for k, v in spec.items() if k in ("in", "min", "max") and v is not None}
+        elif isinstance(spec, (list, tuple)):
+            out[col] = {"in": list(spec)}
+        elif spec is not None:
+            out[col] = {"in": [spec]}
+    if body.get("startYear") not in (None, "") or body.get("endYear") not in (None, ""):
+        # legacy pair: silently ignored when the table has no year column, and keeps rows
+        # whose year is missing or not a number
+        year = out.setdefault("year", {"optional": True, "keep_missing": True})
+        if body.get("startYear") not in (None, ""):
+            year["min"] = body["startYear"]
+        if body.get("endYear") not in (None, ""):
+            year["max"] = body["endYear"]
+    return {c: p for c, p in out.items() if p}
+
+
+def run_query(df: pd.DataFrame, filters: dict, index_for=None) -> np.ndarray:
+    """Row positions (in table order) matching every predicate.
+    `index_for(column)` returns a SortedIndex or None. The most selective indexed predicate
+    is answered by binary search; the others are evaluated only on its candidate rows,
+    so the cost follows the result size rather than the table size.
+    """
+    resolved = []
+    for name, pred in filters.items():
+        col = find_column(df, name)
+        if col is None:
+            if pred.get("optional"):
+                continue
+            raise KeyError(name)
+        resolved.append((col, pred, index_for(col) if index_for else None))
+
+    # text indexes sort lexicographically, so they only answer IN lists
+    indexed = [(idx.count(pred), i) for i, (_, pred, idx) in enumerate(resolved)
+               if idx is not None and (idx.numeric or "in" in pred)]
+    if indexed:
+        _, driver = min(indexed)
+        _, pred, idx = resolved[driver]
+        rows = np.sort(idx.positions(pred))
+        rest = [(c, p) for i, (c, p, _) in enumerate(resolved) if i != driver]
+    else:
+        rows = np.arange(len(df))
+        rest = [(c, p) for c, p, _ in resolved]
+
+    for col, pred in rest:
+        if not len(rows):
+            break
+        rows = rows[predicate_mask(df[col].iloc[rows], pred)]
+    return rows
@@ -0,0 +1,136 @@
+import io, json, os, sqlite3, time, zlib
+from contextlib import closing, contextmanager
+from uuid import uuid4
+import numpy as np
+
+ARRAY_MIN = 64  # numeric lists at least this long are stored as packed arrays
+_REF = "__array__"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY,
+    kind TEXT,
+    created REAL,
+    accessed REAL,
+    expires REAL,
+    nbytes INTEGER,
+    doc BLOB,
+    arrays BLOB
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+def _numeric_list(v) -> bool:
+    return (isinstance(v, list) and len(v) >= ARRAY_MIN
+            and all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in v))
+
+
+def pack(obj):
+    """(JSON bytes, npz bytes or None): long numeric lists are lifted out of `obj` into
+    arrays of a compressed npz archive and replaced by {"__array__": n} references."""
+    arrays = []
+
+    def walk(v):
+        if isinstance(v, dict):
+            return {k: walk(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple)):
+            if _numeric_list(list(v)):
+                arrays.append(np.asarray(v, dtype=np.int64 if all(isinstance(x, int) for x in v) else float))
+                return {_REF: len(arrays) - 1}
+            return [walk(x) for x in v]
+        return v
+
+    doc = zlib.compress(json.dumps(walk(obj), separators=(",", ":"), default=str).encode(), 3)
+    if not arrays:
+        return doc, None
+    buf = io.BytesIO()
+    np.savez_compressed(buf, *arrays)
+    return doc, buf.getvalue()
+
+
+def unpack(doc: bytes, blob):
+    obj = json.loads(zlib.decompress(doc))
+    if blob is None:
+        return obj
+    with np.load(io.BytesIO(blob)) as npz:
+        arrays = [npz[f"arr_{i}"] for i in range(len(npz.files))]
+
+    def walk(v):
+        if isinstance(v, dict):
+            if len(v) == 1 and _REF in v:
+                return arrays[v[_REF]].tolist()
+            return {k: walk(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [walk(x) for x in v]
+        return v
+
+    return walk(obj)
+
+
+class ResultStore:
+    """Comparison results in one SQLite file that every worker opens, so an id created by
+    one worker can be read by any other. Entries expire after `ttl` seconds and the least
+    recently read ones are evicted once the stored bytes exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 2 ** 20, ttl: float = 7 * 86400):
+        self.path, self.max_bytes, self.ttl = path, max_bytes, ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as db:
+            yield db
+
+    def put(self, value, kind: str = "result", ttl: float | None = None) -> str:
+        """Stores `value` (JSON-like) and returns its new unique id, e.g. "result_3f2a..."."""
+        rid = f"{kind}_{uuid4().hex}"
+        doc, blob = pack(value)
+        now = time.time()
+        nbytes = len(doc) + len(blob or b"")
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (rid, kind, now, now, now + (ttl or self.ttl), nbytes, doc, blob))
+                self._evict(db, now)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return rid
+
+    def get(self, rid: str):
+        """The stored value, or None if the id is unknown or expired."""
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT doc, arrays FROM results WHERE id = ? AND expires > ?", (rid, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE results SET accessed = ? WHERE id = ?", (now, rid))
+        return unpack(*row)
+
+    def delete(self, rid: str):
+        with self._connect() as db:
+            db.execute("DELETE FROM results WHERE id = ?", (rid,))
+
+    def usage(self) -> dict:
+        with self._connect() as db:
+            count, nbytes = db.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results").fetchone()
+        return {"entries": count, "bytes": nbytes, "max_bytes": self.max_bytes}
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM results WHERE expires <= ?", (now,))
+        total = db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # drop least recently read entries, always keeping the newest one
+        for rid, nbytes in db.execute("SELECT id, nbytes FROM results ORDER BY accessed, created").fetchall()[:-1]:
+            db.execute("DELETE FROM results WHERE id = ?", (rid,))
+            total -= nbytes
+            if total <= self.max_bytes:
+                break
@@ -1,29 +1,349 @@
-import json, tempfile, subprocess, time
-from flask import current_app
+import hashlib, json, logging, os, re, shutil, socket, sqlite3, subprocess, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from uuid import uuid4
+import numpy as np
+import pandas as pd
 from .audit import audit_log
+from .ingest import CSV_EXTENSIONS, PARQUET_EXTENSIONS, iter_upload
+
+POLL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 5.0  # how often a worker marks the jobs it owns as alive
+STALE_SECONDS = 30.0  # active jobs whose owner has not been heard from for this long are failed
+LOG_TAIL = 4000  # characters of the SAS log kept with a job
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT,
+    status TEXT,  -- queued, running, cancelling, done, failed, cancelled
+    submitted REAL,
+    started REAL,
+    finished REAL,
+    cached INTEGER DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    owner TEXT,  -- host:pid:instance of the worker process running the job
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, heartbeat);
+"""
+ACTIVE = ("queued", "running", "cancelling")
+_MARKS = ", ".join("?" * len(ACTIVE))
+
 
 class DataProcessingError(Exception):
     pass
 
 
-def run_sas_or_mock(script: str, input_json: dict | None = None) -> dict:
-    """Runs SAS code if MOCK_MODE is False, otherwise returns a mock result.
-    Keeps interface simple for routes to use in CI/Pages.
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class DockerExecutor:
+    """Runs `<workdir>/script.sas` in the SAS container with `workdir` mounted at /work.
+    Inputs are in /work/in, anything the script writes to /work/out is collected."""
+
+    def __init__(self, image: str = "sas-grid", timeout: float = 600):
+        self.image, self.timeout = image, timeout
+
+    def run(self, workdir: str, should_stop) -> str:
+        log_path = os.path.join(workdir, "sas.log")
+        with open(log_path, "wb") as log:
+            proc = subprocess.Popen(["docker", "run", "--rm", "-v", f"{workdir}:/work", self.image,
+                                     "sas", "/work/script.sas", "-log", "/work/script.log"],
+                                    stdout=log, stderr=subprocess.STDOUT)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    code = proc.wait(POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    if should_stop() or time.monotonic() > deadline:
+                        proc.terminate()
+                        try:
+                            proc.wait(10)
+                        except subprocess.TimeoutExpired:
+                            proc.kill()
+                        if should_stop():
+                            raise JobCancelled()
+                        raise DataProcessingError(f"SAS job timed out after {self.timeout:g}s")
+        text = ""
+        for name in ("script.log", "sas.log"):
+            path = os.path.join(workdir, name)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    text += f.read()
+        if code != 0:
+            raise DataProcessingError(f"SAS exited with {code}: {text[-LOG_TAIL:]}")
+        return text
+
+
+class MockExecutor:
+    """Stand-in for the SAS container (MOCK_MODE and tests): writes `rows` deterministic
+    rows per script to out/result.csv after `delay` seconds, honouring cancellation."""
+
+    def __init__(self, rows: int = 100, delay: float = 0.0):
+        self.rows, self.delay = rows, delay
+
+    def run(self, workdir: str, should_stop) -> str:
+        deadline = time.monotonic() + self.delay
+        while time.monotonic() < deadline:
+            if should_stop():
+                raise JobCancelled()
+            time.sleep(min(0.05, self.delay))
+        with open(os.path.join(workdir, "script.sas"), "rb") as f:
+            seed = int.from_bytes(hashlib.sha256(f.read()).digest()[:8], "little")
+        rng = np.random.default_rng(seed)
+        ages = np.arange(self.rows) % 101
+        pd.DataFrame({"year": 2000 + np.arange(self.rows) // 101, "age": ages,
+                      "rate": np.exp(-9 + 0.085 * ages + rng.normal(0, 0.05, self.rows))}) \
+            .to_csv(os.path.join(workdir, "out", "result.csv"), index=False)
+        inputs = sorted(os.listdir(os.path.join(workdir, "in")))
+        return f"NOTE: mock execution, inputs {inputs}, wrote {self.rows} rows to result.csv\n"
+
+
+class SasJobQueue:
+    """SAS jobs run off the request thread on a bounded pool. Job state lives in a SQLite
+    file shared by all workers, so any worker can report or cancel a job. Each job runs in
+    its own temporary directory (removed afterwards); its output tables are stored as
+    datasets, and the result is cached under a hash of the script and its inputs so a
+    repeated query is answered without running SAS again.
+
+    The process that queues a job owns it and refreshes its heartbeat while it is active.
+    Jobs whose owner died or restarted stop beating and are failed after `stale_seconds`,
+    so they no longer absorb duplicate submissions or count against `max_queued`.
     """
-    if current_app.config.get("MOCK_MODE", True):
-        audit_log("SAS_MOCK_EXEC", {"length": len(script)})
-        # Return minimal mock so downstream can proceed
-        return {"status": "MOCKED", "rows": 100}
-
-    # Real execution example (omitted heavy details)
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".sas", delete=False) as sf:
-            sf.write(script.encode("utf-8"))
-            path = sf.name
-        # Example: call a containerized SAS
-        subprocess.run(["docker","run","--rm","-v",f"{path}:/script.sas","sas-grid","sas","/script.sas"], check=True, timeout=600)
-        # Collect outputs…
-        audit_log("SAS_EXEC", {"script": script[:200]})
-        return {"status": "OK"}
-    except subprocess.CalledProcessError as e:
-        raise DataProcessingError(str(e))
+
+    def __init__(self, db_path: str, executor, datasets, cache=None, max_workers: int = 2,
+                 max_queued: int = 50, work_dir: str | None = None, stale_seconds: float = STALE_SECONDS):
+        self.db_path, self.executor, self.datasets, self.cache = db_path, executor, datasets, cache
+        self.max_workers, self.max_queued, self.work_dir = max_workers, max_queued, work_dir
+        self.stale_seconds = stale_seconds
+        self._pool = None
+        self._pid = None
+        self._owner = None
+        self._stop = threading.Event()
+        self._events = {}  # job id -> threading.Event for jobs running in this process
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        if work_dir:
+            os.makedirs(work_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            if columns and "owner" not in columns:  # database from before heartbeats
+                db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+                db.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+            db.executescript(_SCHEMA)
+            self._reap(db)
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.db_path, timeout=30, isolation_level=None)) as db:
+            yield db
+
+    def _executor_pool(self):
+        with self._lock:
+            if self._pid != os.getpid():  # pools and threads do not survive a fork
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="sas-job")
+                self._pid = os.getpid()
+                self._owner = f"{socket.gethostname()}:{self._pid}:{uuid4().hex[:8]}"
+                self._events = {}
+                self._stop = threading.Event()
+                threading.Thread(target=self._beat, args=(self._owner, self._stop), name="sas-heartbeat",
+                                 daemon=True).start()
+            return self._pool
+
+    def _beat(self, owner, stop):
+        while not stop.wait(min(HEARTBEAT_SECONDS, self.stale_seconds / 3)):
+            try:
+                with self._connect() as db:
+                    db.execute(f"UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN ({_MARKS})",
+                               (time.time(), owner, *ACTIVE))
+            except sqlite3.Error:
+                logging.getLogger(__name__).exception("SAS job heartbeat failed")
+
+    def _reap(self, db) -> int:
+        """Fails active jobs whose owner stopped beating (cancelling ones end cancelled)."""
+        now = time.time()
+        return db.execute(f"""
+            UPDATE jobs SET finished = ?,
+                status = CASE status WHEN 'cancelling' THEN 'cancelled' ELSE 'failed' END,
+                error = CASE status WHEN 'cancelling' THEN error ELSE 'worker lost before the job finished' END
+            WHERE status IN ({_MARKS}) AND COALESCE(heartbeat, submitted) < ?""",
+                          (now, *ACTIVE, now - self.stale_seconds)).rowcount
+
+    # ----- public API -----
+    @staticmethod
+    def job_key(script: str, inputs: dict) -> str:
+        """Cache key of a job: the script plus each input's name and content fingerprint."""
+        return hashlib.sha256(json.dumps([script, inputs], sort_keys=True, default=str).encode()).hexdigest()
+
+    def submit(self, script: str, inputs: dict | None = None, params: dict | None = None) -> dict:
+        """Queues `script` with the stored datasets `inputs` ({name: dataset id}), exported as
+        in/<name>.csv, and JSON `params` (in/params.json). Returns the job; an identical job
+        that is queued or running is shared, a finished one is answered from the cache.
+        Raises KeyError for unknown datasets and QueueFull when too many jobs are waiting."""
+        inputs = inputs or {}
+        hashes = {name: self.datasets.meta(dsid).get("fingerprint") or dsid for name, dsid in inputs.items()}
+        key = self.job_key(script, {"inputs": hashes, "params": params or {}})
+
+        cached = self._cached(key)
+        pool = self._executor_pool() if cached is None else None
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._reap(db)
+            if cached is None:
+                row = db.execute("SELECT id FROM jobs WHERE key = ? AND status IN (?, ?, ?)", (key, *ACTIVE)).fetchone()
+                if row:
+                    db.execute("COMMIT")
+                    return self.status(row[0])
+                queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= self.max_queued:
+                    db.execute("ROLLBACK")
+                    raise QueueFull(f"{queued} SAS jobs are already waiting")
+            job_id = f"sas_{uuid4().hex}"
+            now = time.time()
+            if cached is None:
+                db.execute("INSERT INTO jobs (id, key, status, submitted, owner, heartbeat) "
+                           "VALUES (?, ?, 'queued', ?, ?, ?)", (job_id, key, now, self._owner, now))
+            else:
+                db.execute("INSERT INTO jobs (id, key, status, submitted, started, finished, cached, result) "
+                           "VALUES (?, ?, 'done', ?, ?, ?, 1, ?)", (job_id, key, now, now, now, json.dumps(cached)))
+            db.execute("COMMIT")
+        if cached is None:
+            self._events[job_id] = threading.Event()
+            pool.submit(self._run, job_id, key, script, dict(inputs), params or {})
+        audit_log("SAS_JOB_SUBMIT", {"job": job_id, "cached": cached is not None, "script": script[:200]})
+        return self.status(job_id)
+
+    def status(self, job_id: str):
+        query = "SELECT id, status, submitted, started, finished, cached, error, result, heartbeat FROM jobs WHERE id = ?"
+        with self._connect() as db:
+            row = db.execute(query, (job_id,)).fetchone()
+            if row and row[1] in ACTIVE and (row[8] or row[2]) < time.time() - self.stale_seconds:
+                self._reap(db)
+                row = db.execute(query, (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "status", "submitted", "started", "finished", "cached", "error", "result")
+        job = dict(zip(keys, row[:8]))
+        job["cached"] = bool(job["cached"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def wait(self, job_id: str, timeout: float | None = None):
+        """Polls until the job has finished (or `timeout` passed) and returns its status."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.status(job_id)
+            if job is None or job["status"] not in ACTIVE or (deadline and time.monotonic() > deadline):
+                return job
+            time.sleep(0.02)
+
+    def cancel(self, job_id: str):
+        """Cancels a queued job at once; a running one is stopped by the worker that runs it
+        at its next poll. Returns the job status, or None for unknown ids."""
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._reap(db)  # an orphaned job has no worker left to stop it
+            db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                       (time.time(), job_id))
+            db.execute("UPDATE jobs SET status = 'cancelling' WHERE id = ? AND status = 'running'", (job_id,))
+            db.execute("COMMIT")
+        event = self._events.get(job_id)
+        if event is not None:
+            event.set()
+        return self.status(job_id)
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._stop.set()
+            self._pid = None
+
+    # ----- internals -----
+    def _cached(self, key):
+        if self.cache is None:
+            return None
+        result = self.cache.get(f"sas:{key}")
+        if result and all(self.datasets.exists(o["id"]) for o in result["outputs"]):
+            return result
+        return None
+
+    def _set(self, job_id, **fields):
+        """Final state of a job, unless it was already reaped as lost."""
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {cols} WHERE id = ? AND status IN ({_MARKS})",
+                       (*fields.values(), job_id, *ACTIVE))
+
+    def _run(self, job_id, key, script, inputs, params):
+        event = self._events.get(job_id) or threading.Event()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            started = db.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued'",
+                                 (time.time(), job_id)).rowcount
+            db.execute("COMMIT")
+        if not started:  # cancelled while queued
+            self._events.pop(job_id, None)
+            return
+
+        last_check = [0.0]
+
+        def should_stop():
+            if not event.is_set() and time.monotonic() - last_check[0] >= POLL_SECONDS:
+                last_check[0] = time.monotonic()
+                job = self.status(job_id)
+                if job and job["status"] == "cancelling":  # cancelled through another worker
+                    event.set()
+            return event.is_set()
+
+        workdir = tempfile.mkdtemp(prefix=f"{job_id}_", dir=self.work_dir)
+        try:
+            os.makedirs(os.path.join(workdir, "in"))
+            os.makedirs(os.path.join(workdir, "out"))
+            with open(os.path.join(workdir, "script.sas"), "w", encoding="utf-8") as f:
+                f.write(script)
+            with open(os.path.join(workdir, "in", "params.json"), "w", encoding="utf-8") as f:
+                json.dump(params, f)
+            for name, dsid in inputs.items():
+                self.datasets.get(dsid).to_csv(os.path.join(workdir, "in", f"{os.path.basename(name)}.csv"),
+                                               index=False)
+            log = self.executor.run(workdir, should_stop)
+            if should_stop():
+                raise JobCancelled()
+            result = {"outputs": self._collect(workdir, key, job_id), "log": log[-LOG_TAIL:]}
+            if self.cache is not None:
+                self.cache.set(f"sas:{key}", result)
+            self._set(job_id, status="done", finished=time.time(), result=json.dumps(result))
+            audit_log("SAS_EXEC", {"job": job_id, "script": script[:200], "outputs": len(result["outputs"])})
+        except JobCancelled:
+            self._set(job_id, status="cancelled", finished=time.time())
+            audit_log("SAS_JOB_CANCELLED", {"job": job_id})
+        except Exception as e:  # reported through the job status
+            self._set(job_id, status="failed", finished=time.time(), error=str(e))
+            audit_log("SAS_JOB_FAILED", {"job": job_id, "error": str(e)[:500]})
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            self._events.pop(job_id, None)
+
+    def _collect(self, workdir, key, job_id):
+        """Stores every CSV/Parquet file the job wrote to out/ as a dataset whose id derives
+        from the job key, so cached results point at the same datasets."""
+        outputs = []
+        out_dir = os.path.join(workdir, "out")
+        for fname in sorted(os.listdir(out_dir)):
+            if not fname.lower().endswith(CSV_EXTENSIONS + PARQUET_EXTENSIONS):
+                continue
+            stem = re.sub(r"[^A-Za-z0-9-]+", "-", os.path.splitext(fname)[0]).strip("-") or "out"
+            dsid = f"sas-{key[:24]}-{stem}"
+            self.datasets.put_chunks(iter_upload(os.path.join(out_dir, fname), fname), fname, id=dsid, sasJob=job_id)
+            outputs.append({"id": dsid, "name": fname, "rows": self.datasets.meta(dsid)["rows"]})
+        return outputs
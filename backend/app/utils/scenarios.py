@@ -0,0 +1,148 @@
+import itertools, os, re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+SCENARIOS = ("基准", "疫情延续", "二次爆发")
+TAILS = {"轻尾": 0.3, "中尾": 0.6, "重尾": 0.85}  # yearly decay of the excess after its peak
+INTENSITIES = (0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5)
+PERSIST_YEARS = 3  # 疫情延续: full shock for the first years
+SECOND_WAVE = (2, 0.8)  # 二次爆发: (start year, relative size) of the second wave
+
+
+def shock_profile(scenario: str, tail: str, horizon: int) -> np.ndarray:
+    """Share of the full shock applied in each projection year 0..horizon-1.
+    基准 is a one-off shock in year 0, 疫情延续 holds it for PERSIST_YEARS, 二次爆发 adds a
+    second wave; the excess then decays by the tail factor per year."""
+    if scenario not in SCENARIOS:
+        raise ValueError(f"unknown scenario {scenario!r}; use {list(SCENARIOS)}")
+    if tail not in TAILS:
+        raise ValueError(f"unknown tail type {tail!r}; use {list(TAILS)}")
+    decay, t = TAILS[tail], np.arange(horizon)
+    if scenario == "疫情延续":
+        return np.where(t < PERSIST_YEARS, 1.0, decay ** (t - PERSIST_YEARS + 1.0))
+    profile = decay ** t
+    if scenario == "二次爆发":
+        start, size = SECOND_WAVE
+        profile = profile + size * np.where(t >= start, decay ** np.maximum(t - start, 0.0), 0.0)
+    return profile
+
+
+def age_coefficients(ages, groups) -> np.ndarray:
+    """Shock coefficient per age from {"0-39": 0.5, "40-64": 1, "65+": 1.5}; ages outside
+    every group keep 1."""
+    ages = np.asarray(ages)
+    coef = np.ones(len(ages))
+    for band, value in (groups or {}).items():
+        match = re.fullmatch(r"\s*(\d+)\s*(?:-\s*(\d+)|(\+))\s*", str(band))
+        if not match:
+            raise ValueError(f"age group {band!r} must look like '20-64' or '65+'")
+        lo = int(match.group(1))
+        hi = int(match.group(2)) if match.group(2) else ages.max()
+        coef[(ages >= lo) & (ages <= hi)] = float(value)
+    return coef
+
+
+def grid(intensities=INTENSITIES, tails=tuple(TAILS), scenarios=SCENARIOS, age_groups=({},)) -> list:
+    """Cartesian product of the parameters as [{"intensity", "tail", "scenario", "ageGroup"}],
+    ageGroup being an index into `age_groups`."""
+    return [{"intensity": float(i), "tail": t, "scenario": s, "ageGroup": g}
+            for i, t, s, g in itertools.product(intensities, tails, scenarios, range(len(age_groups)))]
+
+
+def multipliers(points, ages, age_groups, horizon: int) -> np.ndarray:
+    """(point, year, age) factors on q_x: 1 + (intensity - 1) * age coefficient * profile."""
+    coefs = np.stack([age_coefficients(ages, g) for g in age_groups])
+    profiles = {}
+    excess = np.empty((len(points), horizon))
+    for n, p in enumerate(points):
+        key = (p["scenario"], p["tail"])
+        if key not in profiles:
+            profiles[key] = shock_profile(*key, horizon)
+        excess[n] = (p["intensity"] - 1.0) * profiles[key]
+    group = np.array([p["ageGroup"] for p in points])
+    return np.maximum(1.0 + excess[:, :, None] * coefs[group][:, None, :], 0.0)
+
+
+def cohort_survival(q) -> np.ndarray:
+    """k-year survival of a life aged x in year 0 from q (..., year, age) with the last age
+    closed: (..., age, k) for k = 0..n_ages, following each cohort along the diagonal."""
+    n_ages = q.shape[-1]
+    years, ages = np.indices((n_ages, n_ages))  # [x, j]: year j, attained age x + j
+    diag = q[..., years.T, np.minimum(ages.T + years.T, n_ages - 1)]  # (..., x, j)
+    surv = np.ones(q.shape[:-2] + (n_ages, n_ages + 1))
+    np.cumprod(1.0 - np.minimum(diag, 1.0), axis=-1, out=surv[..., 1:])
+    return surv
+
+
+def _values(surv, interest):
+    """Annuity-due and insurance sums over the first k years, (..., age, k) for k = 0..n_ages."""
+    disc = (1.0 + interest) ** -np.arange(surv.shape[-1])
+    pad = np.zeros(surv.shape[:-1] + (1,))
+    annuity = np.concatenate([pad, np.cumsum(surv[..., :-1] * disc[:-1], axis=-1)], axis=-1)
+    deaths = (surv[..., :-1] - surv[..., 1:]) * disc[1:]
+    return annuity, np.concatenate([pad, np.cumsum(deaths, axis=-1)], axis=-1)
+
+
+def evaluate_points(q_base, ages, points, age_groups, interest: float = 0.03, policies=None) -> list:
+    """Metrics of every grid point on the baseline q (sex, age), the shock running over as
+    many projection years as there are ages: cohort e0 / e65 and the whole-life annuity-due
+    at 65 by sex, and with `policies` (attained age index, sex row, remaining cover and
+    premium years, benefit, locked-in premium, sum assured) their prospective reserve."""
+    ages = np.asarray(ages)
+    n_ages = len(ages)
+    mult = multipliers(points, ages, age_groups, n_ages)  # (point, year, age)
+    q = np.minimum(q_base[None, :, None, :] * mult[:, None], 1.0)  # (point, sex, year, age)
+    q[..., -1] = 1.0
+    surv = cohort_survival(q)  # (point, sex, x, k)
+    ex = surv[..., 1:].sum(axis=-1) + 0.5
+    annuity, insurance = _values(surv, interest)
+    i0, i65 = (int(np.clip(age - ages[0], 0, n_ages - 1)) for age in (0, 65))
+    out = [{**p, "e0": ex[n, :, i0].tolist(), "e65": ex[n, :, i65].tolist(),
+            "annuity65": annuity[n, :, i65, -1].tolist()} for n, p in enumerate(points)]
+    if policies is not None:
+        for n, value in enumerate(portfolio_reserve(annuity, insurance, surv, interest, policies)):
+            out[n]["reserve"] = float(value)
+    return out
+
+
+def portfolio_reserve(annuity, insurance, surv, interest, policies) -> np.ndarray:
+    """Total reserve per point: A (remaining cover) - P * ä (remaining premiums), each a
+    lookup into the cumulative sums at (sex, attained age, years left)."""
+    p = policies
+    row, x = p["sex"], p["attained"]
+    n_max = surv.shape[-1] - 1
+    cover, pay = np.minimum(p["left"], n_max), np.minimum(p["pay_left"], n_max)
+    ins = insurance[:, row, x, cover]
+    endow = np.where(p["benefit"] == "endowment", surv[:, row, x, cover] * (1.0 + interest) ** -cover, 0.0)
+    value = ins + endow - p["premium"] * annuity[:, row, x, pay]
+    value = np.where(p["left"] > 0, value, 0.0)
+    return value @ p["sum_assured"]
+
+
+def _shard(args):
+    return evaluate_points(*args)
+
+
+def run_grid(q_base, ages, points, age_groups, interest=0.03, policies=None, shard_size: int = 50,
+             max_workers=None):
+    """Evaluates the grid in shards of `shard_size` points and yields (done, results) as
+    each shard finishes, on a process pool when there is more than one shard and worker
+    (max_workers <= 1 runs in-process). Closing the generator cancels pending shards."""
+    shards = [points[i:i + shard_size] for i in range(0, len(points), max(shard_size, 1))]
+    jobs = [(q_base, ages, s, age_groups, interest, policies) for s in shards]
+    workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    done = 0
+    if workers <= 1:
+        for job in jobs:
+            res = _shard(job)
+            done += len(res)
+            yield done, res
+        return
+    pool = ProcessPoolExecutor(workers)
+    try:
+        for fut in as_completed([pool.submit(_shard, job) for job in jobs]):
+            res = fut.result()
+            done += len(res)
+            yield done, res
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
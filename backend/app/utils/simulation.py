@@ -0,0 +1,142 @@
+import math, os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+FAN_LEVELS = (90, 95, 99)
+CHUNK_PATHS = 10000  # paths per seeded stream; fixed so results don't depend on worker count
+
+_WORKER_K = None
+
+
+def rw_drift(k_hist: np.ndarray):
+    """Drift and innovation covariance of a (multivariate) random walk fitted to k_t.
+    `k_hist` is (years, factors).
+    """
+    dk = np.diff(np.asarray(k_hist, dtype=float), axis=0)
+    drift = dk.mean(axis=0)
+    cov = np.atleast_2d(np.cov(dk, rowvar=False)) if len(dk) > 1 else np.zeros((dk.shape[1],) * 2)
+    return drift, cov
+
+
+def iter_index_paths(k_last, drift, cov, horizon: int, n_paths: int, seed=None):
+    """Yields (first path, block) random walk with drift blocks of shape (paths, horizon,
+    factors), CHUNK_PATHS paths at a time, each from its own SeedSequence child stream."""
+    k_last, drift = np.atleast_1d(k_last), np.atleast_1d(drift)
+    n_factors = len(k_last)
+    chol = np.linalg.cholesky(np.atleast_2d(cov) + 1e-12 * np.eye(n_factors))
+    streams = np.random.SeedSequence(seed).spawn(max(math.ceil(n_paths / CHUNK_PATHS), 1))
+    for i, ss in enumerate(streams):
+        lo, hi = i * CHUNK_PATHS, min((i + 1) * CHUNK_PATHS, n_paths)
+        eps = np.random.default_rng(ss).standard_normal((hi - lo, horizon, n_factors)) @ chol.T
+        yield lo, k_last + np.cumsum(drift + eps, axis=1)
+
+
+def simulate_indices(k_last, drift, cov, horizon: int, n_paths: int, seed=None) -> np.ndarray:
+    """Random walk with drift paths, shape (paths, horizon, factors); see iter_index_paths."""
+    out = np.empty((n_paths, horizon, len(np.atleast_1d(k_last))))
+    for lo, block in iter_index_paths(k_last, drift, cov, horizon, n_paths, seed):
+        out[lo:lo + len(block)] = block
+    return out
+
+
+def fan_probs(levels=FAN_LEVELS):
+    probs = {0.5}
+    for lvl in levels:
+        tail = (1 - lvl / 100) / 2
+        probs.update((tail, 1 - tail))
+    return np.array(sorted(probs))
+
+
+def _init_worker(k_t):
+    global _WORKER_K
+    _WORKER_K = k_t
+
+
+def _block_quantiles(alpha, loadings, probs, k_t=None):
+    """Quantiles over paths of eta = alpha_x + sum_f B_xf * k_f for one age block.
+    `k_t` is laid out (horizon, factors, paths) so the reduction runs over contiguous memory.
+    """
+    k = _WORKER_K if k_t is None else k_t
+    eta = alpha[None, :, None] + np.einsum("af,hfp->hap", loadings, k)
+    return np.quantile(eta, probs, axis=-1)
+
+
+def project_quantiles(alpha, loadings, k_paths, probs, memory_mb: float = 256, max_workers=None):
+    """Quantiles of the (paths, horizon, ages) linear predictor, shape (probs, horizon, ages).
+    When the full array exceeds `memory_mb` it is computed in age blocks, spread over a
+    process pool when more than one core is available.
+    """
+    alpha, loadings = np.asarray(alpha, dtype=float), np.asarray(loadings, dtype=float)
+    n_paths, horizon, _ = k_paths.shape
+    n_ages = len(alpha)
+    k_t = np.ascontiguousarray(np.transpose(k_paths, (1, 2, 0)))
+    bytes_per_age = n_paths * horizon * 8 * 2  # eta plus quantile workspace
+    block = max(int(memory_mb * 2 ** 20 // bytes_per_age), 1)
+    slices = [slice(i, min(i + block, n_ages)) for i in range(0, n_ages, block)]
+    workers = min(max_workers or os.cpu_count() or 1, len(slices))
+    if workers <= 1:
+        return np.concatenate([_block_quantiles(alpha[s], loadings[s], probs, k_t) for s in slices], axis=2)
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(k_t,)) as pool:
+        parts = pool.map(_block_quantiles, [alpha[s] for s in slices], [loadings[s] for s in slices],
+                         [probs] * len(slices))
+        return np.concatenate(list(parts), axis=2)
+
+
+def _bands(q, levels, pos):
+    out = {}
+    for lvl in levels:
+        tail = (1 - lvl / 100) / 2
+        out[str(lvl)] = {"lower": q[pos[tail]], "upper": q[pos[1 - tail]]}
+    return out
+
+
+def iter_fan_quantiles(alpha, loadings, k_hist, horizon: int, n_paths: int, seed=None, levels=FAN_LEVELS,
+                       inverse_link=np.exp, memory_mb: float = 256):
+    """Yields simulate_fan's rate quantiles one projection year at a time, as
+    {"median", "bands"} arrays over ages. Index paths are drawn block by block with
+    iter_index_paths into a (horizon, factors, paths) array; the linear predictor is only
+    formed for one year, in age blocks of about `memory_mb`."""
+    alpha = np.asarray(alpha, dtype=float)
+    k_hist = np.asarray(k_hist, dtype=float)
+    if k_hist.ndim == 1:
+        k_hist = k_hist[:, None]
+    loadings = np.asarray(loadings, dtype=float).reshape(len(alpha), -1)
+    drift, cov = rw_drift(k_hist)
+    k_t = np.empty((horizon, k_hist.shape[1], n_paths))
+    for lo, block in iter_index_paths(k_hist[-1], drift, cov, horizon, n_paths, seed):
+        k_t[:, :, lo:lo + len(block)] = np.transpose(block, (1, 2, 0))
+
+    probs = fan_probs(levels)
+    pos = {p: i for i, p in enumerate(probs)}
+    block = max(int(memory_mb * 2 ** 20 // (n_paths * 8 * 2)), 1)
+    for h in range(horizon):
+        q = np.concatenate([_block_quantiles(alpha[i:i + block], loadings[i:i + block], probs, k_t[h:h + 1])
+                            for i in range(0, len(alpha), block)], axis=2)[:, 0]
+        q = inverse_link(q)
+        yield {"median": q[pos[0.5]], "bands": _bands(q, levels, pos)}
+
+
+def simulate_fan(alpha, loadings, k_hist, horizon: int, n_paths: int, seed=None, levels=FAN_LEVELS,
+                 inverse_link=np.exp, memory_mb: float = 256, max_workers=None) -> dict:
+    """Monte Carlo fan chart for a factor mortality model eta_x,t = alpha_x + B_x . k_t.
+    k_t is projected as a random walk with drift (multivariate for more than one factor).
+    Quantiles are taken on eta and mapped through the monotone `inverse_link`.
+    """
+    k_hist = np.asarray(k_hist, dtype=float)
+    if k_hist.ndim == 1:
+        k_hist = k_hist[:, None]
+    loadings = np.asarray(loadings, dtype=float).reshape(len(alpha), -1)
+    drift, cov = rw_drift(k_hist)
+    k_paths = simulate_indices(k_hist[-1], drift, cov, horizon, n_paths, seed)
+
+    probs = fan_probs(levels)
+    q_rate = inverse_link(project_quantiles(alpha, loadings, k_paths, probs, memory_mb, max_workers))
+    q_index = np.quantile(k_paths, probs, axis=0)
+    pos = {p: i for i, p in enumerate(probs)}
+    return {
+        "drift": drift,
+        "cov": cov,
+        "rates": {"median": q_rate[pos[0.5]], "bands": _bands(q_rate, levels, pos)},
+        "index": {"median": q_index[pos[0.5]], "bands": _bands(q_index, levels, pos)},
+    }
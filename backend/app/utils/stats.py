@@ -0,0 +1,269 @@
+import numpy as np
+import pandas as pd
+from .query import find_column
+
+HIST_BINS = 10
+Z_OUTLIER = 3.0
+SKETCH_BINS = 1024
+
+
+def numeric_columns(df: pd.DataFrame) -> list:
+    return [c for c in df.columns
+            if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+
+
+def _block(df: pd.DataFrame, cols: list) -> np.ndarray:
+    """(columns, rows) float array of the numeric columns, NaN for missing; one
+    contiguous row per column so every reduction below runs along memory."""
+    x = np.empty((len(cols), len(df)))
+    for j, col in enumerate(cols):
+        x[j] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return x
+
+
+def _num(x):
+    return float(x) if np.isfinite(x) else None
+
+
+class HistSketch:
+    """Mergeable histogram of one column: `counts[i]` covers [(offset + i) * 2**exp,
+    (offset + i + 1) * 2**exp). Bins are aligned to powers of two, so widening the range
+    only sums neighbouring bins and never re-reads data. Edge error is one bin width,
+    i.e. about range / SKETCH_BINS."""
+
+    def __init__(self, exp=None, offset=0, counts=None):
+        self.exp, self.offset = exp, offset
+        self.counts = np.zeros(SKETCH_BINS, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    def _fits(self, exp, lo, hi):
+        return np.floor(np.ldexp(hi, -exp)) - np.floor(np.ldexp(lo, -exp)) < SKETCH_BINS
+
+    def add(self, values: np.ndarray):
+        """Adds the finite `values`."""
+        if not len(values):
+            return
+        lo, hi = float(values.min()), float(values.max())
+        if self.exp is None:
+            exp = int(np.ceil(np.log2((hi - lo) / (SKETCH_BINS - 2)))) if hi > lo else np.frexp(abs(lo) or 1.0)[1] - 20
+        else:
+            exp = self.exp
+            lo = min(lo, np.ldexp(float(self.offset), exp))
+            hi = max(hi, np.ldexp(float(self.offset + SKETCH_BINS - 1), exp))
+        while not self._fits(exp, lo, hi):
+            exp += 1
+        offset = int(np.floor(np.ldexp(lo, -exp)))
+        if self.exp is not None and (exp, offset) != (self.exp, self.offset):
+            old = np.nonzero(self.counts)[0]
+            idx = ((self.offset + old) >> (exp - self.exp)) - offset  # floor division by 2**shift
+            self.counts = np.bincount(idx, weights=self.counts[old], minlength=SKETCH_BINS).astype(np.int64)
+        self.exp, self.offset = exp, offset
+        idx = np.floor(np.ldexp(values, -exp)).astype(np.int64) - offset
+        self.counts += np.bincount(np.clip(idx, 0, SKETCH_BINS - 1), minlength=SKETCH_BINS)
+
+    def cdf(self, points: np.ndarray) -> np.ndarray:
+        """Count of values below each point, spreading each bin's count evenly over its width."""
+        if self.exp is None:
+            return np.zeros(len(points))
+        edges = np.ldexp(self.offset + np.arange(SKETCH_BINS + 1, dtype=float), self.exp)
+        return np.interp(points, edges, np.concatenate([[0], np.cumsum(self.counts)]))
+
+    def histogram(self, edges: np.ndarray) -> np.ndarray:
+        """Counts per bin for edges spanning the data's min..max (last bin closed, as np.histogram)."""
+        cum = np.rint(self.cdf(edges)).astype(np.int64)
+        cum[0], cum[-1] = 0, self.counts.sum()
+        return np.diff(cum)
+
+    def beyond(self, lo: float, hi: float) -> int:
+        """Approximate count of values outside [lo, hi]."""
+        below, upto = self.cdf(np.array([lo, hi]))
+        return int(round(below + self.counts.sum() - upto))
+
+    def to_dict(self) -> dict:
+        nz = np.nonzero(self.counts)[0]
+        return {"exp": self.exp, "offset": self.offset, "bins": nz.tolist(), "counts": self.counts[nz].tolist()}
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        counts = np.zeros(SKETCH_BINS, dtype=np.int64)
+        counts[d["bins"]] = d["counts"]
+        return cls(d["exp"], d["offset"], counts)
+
+
+class ReportStats:
+    """Column statistics for /generate-report, accumulated over chunks of one table.
+    Pass 1 (`update`) merges counts, means and centred sums of squares (Chan et al.),
+    min/max, missing counts and per-year row counts. Pass 2 (`update_tails`) needs the
+    merged mean/std/range and adds z-score outliers and fixed-bin histograms. For an
+    in-memory frame both passes run once over the whole table, see `describe_frame`.
+
+    Pass 1 also feeds a HistSketch per column, and the whole state round-trips through
+    `to_state`/`from_state`, so rows appended later are folded in with `update` alone.
+    Once rows were added after pass 2, outliers and histograms come from the sketches
+    and the report lists them under "approximate".
+    """
+
+    def __init__(self, bins: int = HIST_BINS, z: float = Z_OUTLIER):
+        self.bins, self.z = bins, z
+        self.columns = self.numeric = self.year_col = None
+        self.rows = 0
+        self.chunks = 0
+        self.tails_rows = 0  # rows covered by pass 2
+
+    def _init(self, df):
+        self.columns = [str(c) for c in df.columns]
+        self.numeric = [str(c) for c in numeric_columns(df)]
+        self.year_col = find_column(df, "year")
+        k = len(self.numeric)
+        self.missing = np.zeros(len(self.columns), dtype=np.int64)
+        self.n = np.zeros(k, dtype=np.int64)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.years = pd.Series(dtype=np.int64)
+        self.outliers = np.zeros(k, dtype=np.int64)
+        self.hist = np.zeros((k, self.bins), dtype=np.int64)
+        self.sketches = [HistSketch() for _ in range(k)]
+
+    def update(self, df: pd.DataFrame, x: np.ndarray = None):
+        """Pass 1 over one chunk; `x` is its numeric block if the caller already has it."""
+        if self.columns is None:
+            self._init(df)
+        df = df.rename(columns=str)
+        self.rows += len(df)
+        self.chunks += 1
+        self.missing += df[self.columns].isna().sum().to_numpy(dtype=np.int64)
+        if self.year_col is not None:
+            self.years = self.years.add(df[str(self.year_col)].value_counts(), fill_value=0)
+
+        x = _block(df, self.numeric) if x is None else x
+        valid = ~np.isnan(x)
+        n_b = valid.sum(axis=1)
+        mean_b = np.divide(np.where(valid, x, 0).sum(axis=1), n_b, out=np.zeros(len(n_b)), where=n_b > 0)
+        m2_b = np.nansum((x - mean_b[:, None]) ** 2, axis=1)
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        w = np.divide(n_b, n, out=np.zeros(len(n)), where=n > 0)
+        self.mean = self.mean + delta * w
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.n * w
+        self.n = n
+        self.min = np.fmin(self.min, np.fmin.reduce(x, axis=1, initial=np.inf))
+        self.max = np.fmax(self.max, np.fmax.reduce(x, axis=1, initial=-np.inf))
+        for sketch, row in zip(self.sketches, x):
+            sketch.add(row[np.isfinite(row)])
+
+    @property
+    def std(self) -> np.ndarray:
+        """Sample standard deviation (ddof=1), NaN below two values."""
+        return np.sqrt(np.divide(self.m2, self.n - 1, out=np.full(len(self.n), np.nan), where=self.n > 1))
+
+    def edges(self) -> np.ndarray:
+        """(columns, bins + 1) histogram edges over the merged range, as np.histogram picks them."""
+        lo = np.where(self.n > 0, self.min, 0.0)
+        hi = np.where(self.n > 0, self.max, 1.0)
+        same = lo == hi
+        lo, hi = np.where(same, lo - 0.5, lo), np.where(same, hi + 0.5, hi)
+        return lo[:, None] + (hi - lo)[:, None] * np.linspace(0, 1, self.bins + 1)[None, :]
+
+    def update_tails(self, df: pd.DataFrame, x: np.ndarray = None):
+        """Pass 2 over one chunk: outlier counts and histogram bins."""
+        x = _block(df.rename(columns=str), self.numeric) if x is None else x
+        self.tails_rows += x.shape[1]
+        std = self.std
+        limit = self.z * np.where(std == 0, 1.0, std)
+        edges = self.edges()
+        lo, width = edges[:, 0], edges[:, -1] - edges[:, 0]
+        for j, row in enumerate(x):
+            row = row[~np.isnan(row)]
+            self.outliers[j] += np.count_nonzero(np.abs(row - self.mean[j]) > limit[j])
+            pos = ((row - lo[j]) * (self.bins / width[j])).astype(np.int64)
+            self.hist[j] += np.bincount(np.clip(pos, 0, self.bins - 1), minlength=self.bins)
+
+    def report(self) -> dict:
+        if self.columns is None:
+            return {"summaryStats": [], "missingValueReport": [], "outlierReport": [],
+                    "dataDistribution": [], "timeSeriesAnalysis": [], "rows": 0}
+        std, edges = self.std, self.edges()
+        exact = self.tails_rows == self.rows or not self.numeric
+        n_out, hist = self.outliers, self.hist
+        if not exact:
+            limit = self.z * np.where(std == 0, 1.0, std)
+            n_out = np.array([sk.beyond(m - d, m + d) if d == d else 0
+                              for sk, m, d in zip(self.sketches, self.mean, limit)], dtype=np.int64)
+            hist = np.array([sk.histogram(e) for sk, e in zip(self.sketches, edges)],
+                            dtype=np.int64).reshape(len(self.numeric), self.bins)
+        summary, outliers, dist = [], [], []
+        for j, col in enumerate(self.numeric):
+            summary.append({"field": col, "count": int(self.n[j]), "mean": _num(self.mean[j]) if self.n[j] else None,
+                            "std": _num(std[j]), "min": _num(self.min[j]), "max": _num(self.max[j])})
+            if n_out[j]:
+                outliers.append({"field": col, "outliers": int(n_out[j]),
+                                 "percent": round(float(n_out[j] / self.n[j] * 100), 2)})
+            dist.append({"field": col, "bins": edges[j].tolist(), "counts": hist[j].tolist()})
+        missing = [{"field": col, "missing": int(m), "percent": round(float(m / self.rows * 100), 2)}
+                   for col, m in zip(self.columns, self.missing) if m]
+        ts = []
+        if self.year_col is not None:
+            years = self.years.astype(np.int64).sort_index()
+            ts = years.rename_axis(str(self.year_col)).reset_index(name="count").to_dict(orient="records")
+        out = {"summaryStats": summary, "missingValueReport": missing, "outlierReport": outliers,
+               "dataDistribution": dist, "timeSeriesAnalysis": ts, "rows": int(self.rows)}
+        if not exact:
+            out["approximate"] = ["outlierReport", "dataDistribution"]
+        return out
+
+    def to_state(self) -> dict:
+        """JSON-safe snapshot of everything merged so far."""
+        if self.columns is None:
+            return {"bins": self.bins, "z": self.z}
+        years = [[k.item() if hasattr(k, "item") else k, int(v)] for k, v in self.years.items()]
+        return {
+            "bins": self.bins, "z": self.z, "columns": self.columns, "numeric": self.numeric,
+            "year_col": None if self.year_col is None else str(self.year_col),
+            "rows": int(self.rows), "chunks": self.chunks, "tails_rows": int(self.tails_rows),
+            "missing": self.missing.tolist(), "n": self.n.tolist(), "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(), "min": self.min.tolist(), "max": self.max.tolist(), "years": years,
+            "outliers": self.outliers.tolist(), "hist": self.hist.tolist(),
+            "sketches": [sk.to_dict() for sk in self.sketches],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict):
+        stats = cls(state["bins"], state["z"])
+        if "columns" not in state:
+            return stats
+        stats.columns, stats.numeric, stats.year_col = state["columns"], state["numeric"], state["year_col"]
+        stats.rows, stats.chunks, stats.tails_rows = state["rows"], state["chunks"], state["tails_rows"]
+        for name in ("missing", "n", "outliers"):
+            setattr(stats, name, np.array(state[name], dtype=np.int64))
+        for name in ("mean", "m2", "min", "max"):
+            setattr(stats, name, np.array(state[name], dtype=float))
+        stats.hist = np.array(state["hist"], dtype=np.int64).reshape(len(stats.numeric), stats.bins)
+        stats.years = pd.Series({k: v for k, v in state["years"]}, dtype=np.int64)
+        stats.sketches = [HistSketch.from_dict(d) for d in state["sketches"]]
+        return stats
+
+
+def describe_frame(df: pd.DataFrame, bins: int = HIST_BINS) -> dict:
+    """Report for an in-memory frame; the numeric block is built once for both passes."""
+    stats = ReportStats(bins)
+    x = _block(df.rename(columns=str), [str(c) for c in numeric_columns(df)])
+    stats.update(df, x)
+    stats.update_tails(df, x)
+    return stats.report()
+
+
+def scan_chunks(chunks, bins: int = HIST_BINS) -> ReportStats:
+    """Two-pass scan over `chunks()`, a callable returning a fresh iterator of frames,
+    so only one chunk is held in memory at a time."""
+    stats = ReportStats(bins)
+    for chunk in chunks():
+        stats.update(chunk)
+    if stats.numeric:
+        for chunk in chunks():
+            stats.update_tails(chunk)
+    return stats
+
+
+def describe_chunks(chunks, bins: int = HIST_BINS) -> dict:
+    return scan_chunks(chunks, bins).report()
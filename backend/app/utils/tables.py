@@ -0,0 +1,155 @@
+import hashlib, os, threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from flask import current_app
+
+HMD_FILE = "HMD_raw_data.txt"
+HMD_RATE_COLUMNS = ["Female", "Male", "Total"]
+
+# path -> ((mtime_ns, size), digest, table); avoids re-hashing unchanged files
+_TABLES = {}
+_LOCK = threading.Lock()
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def parse_hmd(path: str) -> pd.DataFrame:
+    """Parses an HMD period file (title line, blank line, whitespace-separated columns).
+    The open age group "110+" becomes 110 and "." marks a missing rate.
+    """
+    df = pd.read_csv(path, sep=r"\s+", skiprows=1, dtype={"Age": str}, na_values=["."])
+    df["Year"] = df["Year"].astype("int32")
+    df["Age"] = df["Age"].str.rstrip("+").astype("int32")
+    for col in HMD_RATE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("float64")
+    return df
+
+
+def _write_arrow(table: pa.Table, path: str):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    # uncompressed IPC file so later reads can be memory-mapped without decoding
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _read_arrow(path: str) -> pa.Table:
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def load_cached(path: str, cache_dir: str, parser) -> pa.Table:
+    """Returns the parsed file as an Arrow table, parsing at most once per content hash.
+    The hash is only recomputed when the file's mtime or size changes.
+    """
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _LOCK:
+        hit = _TABLES.get(path)
+    if hit and hit[0] == stamp:
+        return hit[2]
+
+    digest = file_digest(path)
+    if hit and hit[1] == digest:
+        table = hit[2]
+    else:
+        cached = os.path.join(cache_dir, f"{os.path.basename(path)}.{digest[:16]}.arrow")
+        if not os.path.exists(cached):
+            os.makedirs(cache_dir, exist_ok=True)
+            _write_arrow(pa.Table.from_pandas(parser(path), preserve_index=False), cached)
+        table = _read_arrow(cached)
+    with _LOCK:
+        _TABLES[path] = (stamp, digest, table)
+    return table
+
+
+def load_hmd(path: str, cache_dir: str) -> pa.Table:
+    return load_cached(path, cache_dir, parse_hmd)
+
+
+def hmd_path() -> str:
+    return os.path.join(current_app.config["DATA_DIR"], HMD_FILE)
+
+
+def hmd_table() -> pa.Table:
+    """The app's HMD death-rate table (DATA_DIR/HMD_raw_data.txt), via the Arrow cache."""
+    return load_hmd(hmd_path(), current_app.config["CACHE_DIR"])
+
+
+def hmd_digest() -> str:
+    """Content hash of the HMD file, usable in cache keys (re-hashed only when it changes)."""
+    path = hmd_path()
+    hmd_table()
+    with _LOCK:
+        return _TABLES[path][1]
+
+
+def frame_rate_table(df: pd.DataFrame) -> pa.Table:
+    """HMD-shaped Arrow table (Year, Age and the rate columns present) from a stored
+    long-format frame; column names match case-insensitively and "110+" ages become 110."""
+    names = {}
+    for name in ("Year", "Age", *HMD_RATE_COLUMNS):
+        col = next((c for c in df.columns if str(c).lower() == name.lower()), None)
+        if col is not None:
+            names[name] = col
+    if "Year" not in names or "Age" not in names or len(names) == 2:
+        raise ValueError("dataset needs Year, Age and at least one of " + "/".join(HMD_RATE_COLUMNS))
+    out = {}
+    for name, col in names.items():
+        s = df[col]
+        if name == "Age" and not pd.api.types.is_numeric_dtype(s):
+            s = s.astype(str).str.rstrip("+")
+        out[name] = pd.to_numeric(s, errors="coerce").astype("float64")
+    out = pd.DataFrame(out).dropna(subset=["Year", "Age"]).astype({"Year": "int32", "Age": "int32"})
+    return pa.Table.from_pandas(out, preserve_index=False)
+
+
+def parse_csv(path: str) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+def load_csv(path: str, cache_dir: str) -> pa.Table:
+    return load_cached(path, cache_dir, parse_csv)
+
+
+def find_column(table: pa.Table, name: str):
+    """Case-insensitive column lookup ("year" matches Year/YEAR)."""
+    return next((c for c in table.column_names if c.lower() == name.lower()), None)
+
+
+def select(table: pa.Table, columns=None, years=None, ages=None) -> pa.Table:
+    """Applies year/age range filters and column projection on the Arrow table itself,
+    so only the selected page ever becomes Python rows.
+    `years` / `ages` are (low, high) tuples, either bound may be None.
+    """
+    mask = None
+    for name, bounds in (("year", years), ("age", ages)):
+        col = find_column(table, name)
+        if col is None or not bounds:
+            continue
+        arr = table.column(col)
+        if not pa.types.is_integer(arr.type) and not pa.types.is_floating(arr.type):
+            try:
+                arr = pc.cast(arr, pa.float64())
+            except pa.ArrowInvalid:
+                continue
+        lo, hi = bounds
+        conds = []
+        if lo is not None:
+            conds.append(pc.greater_equal(arr, lo))
+        if hi is not None:
+            conds.append(pc.less_equal(arr, hi))
+        for cond in conds:
+            mask = cond if mask is None else pc.and_(mask, cond)
+    if mask is not None:
+        table = table.filter(pc.fill_null(mask, False))
+    if columns:
+        table = table.select([c for c in columns if c in table.column_names])
+    return table
@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+BENEFITS = ("whole", "term", "endowment")
+CACHE_SIZE = 64
+
+_TABLES = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _append_zero(col):
+    """`col` with a zero appended on the last axis (the column past the final age)."""
+    return np.concatenate([col, np.zeros(col.shape[:-1] + (1,))], axis=-1)
+
+
+class CommutationTable:
+    """Commutation columns D, N, C, M of life tables `lx` (..., age) at interest `i`, with
+    annual payments in advance and death benefits at the end of the year of death.
+    Each column has a zero slot appended after the last age, so any age or term reaching
+    past the table looks up to 0. Every valuation method takes arrays of ages/terms
+    (and optional `row` indexes into the leading axes, e.g. sex) and works by index lookup.
+    """
+
+    def __init__(self, ages, lx, interest: float):
+        self.ages = np.asarray(ages)
+        if np.any(np.diff(self.ages) != 1):
+            raise ValueError("commutation columns need consecutive single-year ages")
+        self.interest = float(interest)
+        lx = np.asarray(lx, dtype=float)
+        v = 1.0 / (1.0 + self.interest)
+        k = np.arange(lx.shape[-1])
+        dx = lx - _append_zero(lx[..., 1:])
+        self.D = _append_zero(v ** k * lx)
+        self.C = _append_zero(v ** (k + 1) * dx)
+        self.N = np.cumsum(self.D[..., ::-1], axis=-1)[..., ::-1]
+        self.M = np.cumsum(self.C[..., ::-1], axis=-1)[..., ::-1]
+
+    def _index(self, age):
+        idx = np.asarray(age, dtype=int) - int(self.ages[0])
+        if np.any(idx < 0):
+            raise ValueError(f"ages below {int(self.ages[0])} are not in the table")
+        return np.minimum(idx, len(self.ages))
+
+    def _at(self, col, age, row=None):
+        idx = self._index(age)
+        return col[..., idx] if row is None else col[np.asarray(row), idx]
+
+    def _ratio(self, num, age, row):
+        den = self._at(self.D, age, row)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(den > 0, num / np.where(den > 0, den, 1.0), 0.0)
+
+    def annuity_due(self, age, term=None, defer=0, row=None):
+        """ä for an m-year deferred (defer), n-year (term; None = whole life) annuity-due."""
+        start = np.asarray(age) + np.asarray(defer)
+        end = self._at(self.N, start + np.asarray(term), row) if term is not None else 0.0
+        return self._ratio(self._at(self.N, start, row) - end, age, row)
+
+    def pure_endowment(self, age, term, row=None):
+        """nEx = D_{x+n} / D_x."""
+        return self._ratio(self._at(self.D, np.asarray(age) + np.asarray(term), row), age, row)
+
+    def insurance(self, age, term=None, benefit="whole", defer=0, row=None):
+        """A for whole life, n-year term or n-year endowment insurance (benefit may be an
+        array of those names, one per policy), optionally deferred."""
+        start = np.asarray(age) + np.asarray(defer)
+        m_start = self._at(self.M, start, row)
+        m_end = self._at(self.M, start + np.asarray(term), row) if term is not None else 0.0
+        whole = self._ratio(m_start, age, row)
+        term_cover = self._ratio(m_start - m_end, age, row)
+        benefit = np.asarray(benefit)
+        if np.any(benefit != "whole") and term is None:
+            raise ValueError("term and endowment insurance need a term")
+        out = np.where(benefit == "whole", whole, term_cover)
+        if np.any(benefit == "endowment"):
+            out = out + np.where(benefit == "endowment",
+                                 self._ratio(self._at(self.D, start + np.asarray(term), row), age, row), 0.0)
+        return out
+
+    def net_premium(self, age, term=None, benefit="whole", premium_term=None, row=None):
+        """Level annual net premium per unit sum assured, payable for `premium_term` years
+        (default: the benefit term, or for life)."""
+        premium_term = term if premium_term is None else premium_term
+        ann = self.annuity_due(age, premium_term, row=row)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(ann > 0, self.insurance(age, term, benefit, row=row) / np.where(ann > 0, ann, 1.0), 0.0)
+
+    def reserve(self, age, duration, term=None, benefit="whole", premium_term=None, row=None):
+        """Prospective net premium reserve per unit sum assured at integer `duration` t:
+        A_{x+t} for the remaining cover minus P * ä_{x+t} for the remaining premiums; 0
+        once the cover has run off."""
+        age, duration = np.asarray(age), np.asarray(duration)
+        premium_term = term if premium_term is None else premium_term
+        premium = self.net_premium(age, term, benefit, premium_term, row)
+        now = age + duration
+        left = None if term is None else np.maximum(np.asarray(term) - duration, 0)
+        pay_left = None if premium_term is None else np.maximum(np.asarray(premium_term) - duration, 0)
+        cover = self.insurance(now, left, benefit, row=row)
+        value = cover - premium * self.annuity_due(now, pay_left, row=row)
+        return value if left is None else np.where(left > 0, value, 0.0)
+
+
+def commutation_table(key, interest: float, build) -> CommutationTable:
+    """CommutationTable for (key, interest) from a per-process LRU; `build()` returns
+    (ages, lx) and runs only on a miss. `key` must identify the life tables (e.g. dataset
+    fingerprint, sexes, year, radix)."""
+    cache_key = (key, float(interest))
+    with _LOCK:
+        if cache_key in _TABLES:
+            _TABLES.move_to_end(cache_key)
+            return _TABLES[cache_key]
+    ages, lx = build()
+    table = CommutationTable(ages, lx, interest)
+    with _LOCK:
+        _TABLES[cache_key] = table
+        while len(_TABLES) > CACHE_SIZE:
+            _TABLES.popitem(last=False)
+    return table
@@ -0,0 +1,968 @@
+import json
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app import create_app  # noqa: E402
+from app.config import Config  # noqa: E402
+from app.utils import tables  # noqa: E402
+from app.utils.lee_carter import fit_lee_carter  # noqa: E402
+from app.utils import simulation  # noqa: E402
+from app.utils.cbd import fit_cbd  # noqa: E402
+from app.utils.apc import fit_apc  # noqa: E402
+from app.utils.gompertz import fit_gompertz  # noqa: E402
+from app.utils.dataset_store import DatasetStore, to_records  # noqa: E402
+from app.utils.query import SortedIndex, run_query  # noqa: E402
+from app.utils.ingest import iter_upload, read_upload  # noqa: E402
+from app import extensions  # noqa: E402
+from app.utils.mortality import log_m_from_logit_q  # noqa: E402
+from app.utils.cache import TwoTierCache  # noqa: E402
+from app.utils import cache as cache_module  # noqa: E402
+from app.utils.stats import describe_frame  # noqa: E402
+from app.utils import comparison  # noqa: E402
+from app.utils.result_store import ResultStore  # noqa: E402
+from app.utils import audit  # noqa: E402
+from app.utils import lineage  # noqa: E402
+from app.utils import life_table  # noqa: E402
+from app.utils import decrements  # noqa: E402
+from app.utils import valuation  # noqa: E402
+from app.utils import scenarios  # noqa: E402
+from app.utils import backtest  # noqa: E402
+from app.utils.sas_runner import MockExecutor, QueueFull, SasJobQueue  # noqa: E402
+
+HMD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "HMD_raw_data.txt")
+
+
+class BackendTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        os.environ["AUDIT_LOG_PATH"] = os.path.join(cls.tmp, "audit.log")
+
+        class TestConfig(Config):
+            TESTING = True
+            REDIS_URL = ""
+            DATA_DIR = os.path.dirname(HMD_PATH)
+            DATASETS_DIR = os.path.join(cls.tmp, "datasets")
+            MODELS_DIR = os.path.join(cls.tmp, "models")
+            CACHE_DIR = os.path.join(cls.tmp, "cache")
+
+        cls.app = create_app(TestConfig)
+        cls.client = cls.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def test_hmd_parse_and_cache(self):
+        """测试HMD解析（标题行、110+、缺失值）与Arrow缓存"""
+        path = os.path.join(self.tmp, "hmd_small.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("Country, Death rates (period 1x1)\n\n")
+            f.write("  Year   Age   Female   Male   Total\n")
+            f.write("  2000   0     0.005    0.006  0.0055\n")
+            f.write("  2000   110+  .        0.5    0.5\n")
+        cache_dir = os.path.join(self.tmp, "cache_small")
+        table = tables.load_hmd(path, cache_dir)
+        self.assertEqual(table.column_names, ["Year", "Age", "Female", "Male", "Total"])
+        self.assertEqual(table.column("Age").to_pylist(), [0, 110])
+        self.assertIsNone(table.column("Female").to_pylist()[1])
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        self.assertIs(tables.load_hmd(path, cache_dir), table)
+        print("✅ HMD解析缓存测试通过")
+
+    def test_fetch_hmd_raw(self):
+        """测试 /fetch-data HMD_RAW 返回类型化数据"""
+        res = self.client.post("/api/fetch-data", json={"source": "HMD_RAW"})
+        self.assertEqual(res.status_code, 200)
+        body = res.get_json()
+        self.assertEqual(body["metadata"]["rows"], 10101)
+        self.assertEqual(body["data"][0], {"Year": 1933, "Age": 0, "Female": 0.054177,
+                                           "Male": 0.068175, "Total": 0.061292})
+        print("✅ HMD_RAW 接口测试通过")
+
+    def test_fetch_paging_filters_and_stream(self):
+        """测试 /fetch-data 分页、筛选、列投影与NDJSON流式输出"""
+        query = {"source": "HMD_RAW", "startYear": 2020, "endYear": 2021,
+                 "startAge": 60, "endAge": 64, "columns": ["Year", "Age", "Total"], "limit": 4}
+        body = self.client.post("/api/fetch-data", json=query).get_json()
+        self.assertEqual(body["page"]["total"], 10)
+        self.assertEqual(len(body["data"]), 4)
+        self.assertEqual(set(body["data"][0]), {"Year", "Age", "Total"})
+        last = self.client.post("/api/fetch-data", json={**query, "cursor": "8"}).get_json()
+        self.assertEqual(len(last["data"]), 2)
+        self.assertIsNone(last["page"]["nextCursor"])
+
+        res = self.client.post("/api/fetch-data", json={**query, "limit": None, "format": "ndjson"})
+        lines = res.get_data(as_text=True).splitlines()
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertEqual(len(lines), 10)
+        self.assertNotIn("X-Next-Cursor", res.headers)
+        from app.routes import data_sources
+        cap, data_sources.MAX_STREAM_ROWS = data_sources.MAX_STREAM_ROWS, 3
+        try:
+            res = self.client.post("/api/fetch-data", json={**query, "limit": None, "format": "ndjson"})
+            self.assertEqual(len(res.get_data(as_text=True).splitlines()), 3)
+            self.assertEqual(res.headers["X-Next-Cursor"], "3")
+        finally:
+            data_sources.MAX_STREAM_ROWS = cap
+        for bad in ({"cursor": "abc"}, {"limit": "all"}, {"startYear": "1990s"}):
+            self.assertEqual(self.client.post("/api/fetch-data", json={**query, **bad}).status_code, 400, bad)
+        print("✅ 分页筛选与流式输出测试通过")
+
+    def test_lee_carter_recovers_parameters(self):
+        """测试Lee-Carter批量SVD拟合（约束 sum b=1, sum k=0）"""
+        ages, years = np.arange(40), np.arange(30)
+        a = -9 + 0.08 * ages
+        b = np.linspace(2, 1, 40) / np.linspace(2, 1, 40).sum()
+        k = -1.5 * (years - years.mean())
+        log_m = np.stack([a[:, None] + s * b[:, None] * k[None, :] for s in (1.0, 1.2)])
+        fit = fit_lee_carter(log_m)
+        np.testing.assert_allclose(fit["a_x"][0], a, atol=1e-10)
+        np.testing.assert_allclose(fit["b_x"][1], b, atol=1e-10)
+        np.testing.assert_allclose(fit["k_t"][1], 1.2 * k, atol=1e-8)
+
+        res = self.client.post("/api/model/lee-carter/fit", json={"startYear": 1990, "endAge": 100})
+        body = res.get_json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(body["fits"]), {"Female", "Male", "Total"})
+        self.assertAlmostEqual(sum(body["fits"]["Male"]["parameters"]["b_x"]), 1.0)
+        self.assertEqual(self.client.post("/api/model/lee-carter/fit", json={"startYear": "1990"}).status_code, 200)
+        for bad in ({"startYear": "recent"}, {"endAge": [90]}, {"sexes": ["Nobody"]}):
+            self.assertEqual(self.client.post("/api/model/lee-carter/fit", json=bad).status_code, 400, bad)
+        for url in ("/api/compare", "/api/backtest", "/api/life-table"):
+            self.assertEqual(self.client.post(url, json={"startAge": "sixty"}).status_code, 400, url)
+        print("✅ Lee-Carter拟合测试通过")
+
+    def test_monte_carlo_fan_chunking(self):
+        """测试蒙特卡洛扇形图：分块计算与单块一致、种子可复现"""
+        k = simulation.simulate_indices([0.0, 0.0], [-0.5, 0.01], np.diag([0.2, 0.001]), 6, 2500, seed=7)
+        self.assertEqual(k.shape, (2500, 6, 2))
+        np.testing.assert_array_equal(k, simulation.simulate_indices([0.0, 0.0], [-0.5, 0.01],
+                                                                     np.diag([0.2, 0.001]), 6, 2500, seed=7))
+        alpha, loadings = np.linspace(-8, -1, 30), np.c_[np.ones(30), np.arange(30) - 15.0]
+        probs = simulation.fan_probs()
+        whole = simulation.project_quantiles(alpha, loadings, k, probs)
+        blocks = simulation.project_quantiles(alpha, loadings, k, probs, memory_mb=0.2, max_workers=1)
+        np.testing.assert_allclose(whole, blocks)
+        k_hist = np.c_[np.linspace(0, -5, 12), np.linspace(0.1, 0.2, 12)]
+        fan = simulation.simulate_fan(alpha, loadings, k_hist, 6, 2500, seed=3)["rates"]
+        years = list(simulation.iter_fan_quantiles(alpha, loadings, k_hist, 6, 2500, seed=3, memory_mb=0.1))
+        self.assertEqual(len(years), 6)
+        np.testing.assert_allclose([q["median"] for q in years], fan["median"])
+        np.testing.assert_allclose([q["bands"]["95"]["upper"] for q in years], fan["bands"]["95"]["upper"])
+
+        res = self.client.post("/api/forecast", json={"n_simulations": 500, "time_horizon": 3, "seed": 1})
+        fan = res.get_json()["forecasts"]["Total"]["rates"]
+        self.assertEqual(len(fan["median"]), 3)
+        self.assertTrue(np.all(np.array(fan["bands"]["99"]["lower"]) <= np.array(fan["bands"]["90"]["lower"])))
+        # 小数置信水平按百分比解读，无有效水平时返回400
+        res = self.client.post("/api/forecast", json={"n_simulations": 50, "time_horizon": 2, "seed": 1,
+                                                      "confidence_level": 0.95}).get_json()
+        self.assertEqual(res["levels"], [95])
+        self.assertEqual(list(res["forecasts"]["Total"]["rates"]["bands"]), ["95"])
+        for bad in ({"confidence_levels": [0, 100]}, {"confidence_level": "high"}, {"confidence_levels": [None]}):
+            self.assertEqual(self.client.post("/api/forecast", json={"seed": 1, **bad}).status_code, 400, bad)
+        print("✅ 蒙特卡洛预测测试通过")
+
+    def test_cbd_single_solve(self):
+        """测试CBD一次性最小二乘拟合所有年份"""
+        ages, years = np.arange(60, 90), np.arange(25)
+        k1, k2 = -3 - 0.02 * years, 0.1 + 0.001 * years
+        eta = k1[None, :] + (ages - ages.mean())[:, None] * k2[None, :]
+        fit = fit_cbd(log_m_from_logit_q(eta)[None], ages)
+        np.testing.assert_allclose(fit["kappa1"][0], k1, atol=1e-9)
+        np.testing.assert_allclose(fit["kappa2"][0], k2, atol=1e-9)
+        self.assertLess(np.abs(fit["residuals"]).max(), 1e-9)
+        print("✅ CBD拟合测试通过")
+
+    def test_apc_sparse_fit(self):
+        """测试APC稀疏求解与可识别性约束"""
+        ages, years = np.arange(20, 60), np.arange(1980, 2010)
+        rng = np.random.default_rng(1)
+        cohorts = years[None, :] - ages[:, None]
+        log_m = (-9 + 0.09 * ages)[:, None] + rng.normal(0, 0.05, len(years))[None, :] \
+            + 0.02 * np.sin(cohorts / 3.0)
+        fit = fit_apc(log_m, ages, years)
+        c = fit["cohorts"] - fit["cohorts"].mean()
+        self.assertAlmostEqual(fit["beta_t"][0].sum(), 0.0, places=8)
+        self.assertAlmostEqual(fit["gamma_c"][0].sum(), 0.0, places=8)
+        self.assertAlmostEqual(c @ fit["gamma_c"][0], 0.0, places=8)
+        self.assertLess(fit["diagnostics"]["rmse"][0], 1e-8)
+        print("✅ APC稀疏拟合测试通过")
+
+    def test_gompertz_makeham_batched(self):
+        """测试Gompertz/Makeham按年批量估计"""
+        x = np.arange(40, 91)
+        b, c, a = np.linspace(2e-5, 1e-5, 12), np.linspace(1.09, 1.1, 12), np.linspace(5e-4, 2e-4, 12)
+        log_m = np.log(a[None, :] + b[None, :] * c[None, :] ** x[:, None])
+        fit = fit_gompertz(log_m, x, makeham=True)
+        np.testing.assert_allclose(fit["A"][0], a, rtol=1e-6)
+        np.testing.assert_allclose(fit["c"][0], c, rtol=1e-8)
+        gomp = fit_gompertz(np.log(b[None, :] * c[None, :] ** x[:, None]), x)
+        np.testing.assert_allclose(gomp["B"][0], b, rtol=1e-8)
+        print("✅ Gompertz/Makeham拟合测试通过")
+
+    def test_dataset_store_eviction(self):
+        """测试列式数据集仓库的内存预算、LRU淘汰与按需重载"""
+        root = os.path.join(self.tmp, "store_test")
+        os.makedirs(root)
+        store = DatasetStore(root, budget_bytes=20000)
+        frames = [pd.DataFrame({"year": np.arange(1000) + i, "val": np.random.rand(1000)}) for i in range(3)]
+        ids = [store.put(df, f"t{i}.csv") for i, df in enumerate(frames)]
+        self.assertLessEqual(store.memory_usage(), 20000)
+        self.assertNotIn(ids[0], store._mem)
+        pd.testing.assert_frame_equal(store.get(ids[0]), frames[0])
+        self.assertEqual([m["name"] for m in DatasetStore(root, 0).list()], ["t0.csv", "t1.csv", "t2.csv"])
+        frames[1].to_csv(os.path.join(root, "ext.csv"), index=False)
+        self.assertEqual(len(store.get("file::ext.csv")), 1000)
+        self.assertEqual(store.index("file::ext.csv", "year").count({"min": -1e9}), 1000)
+        frames[1].head(10).to_csv(os.path.join(root, "ext.csv"), index=False)
+        os.utime(os.path.join(root, "ext.csv"), ns=(0, 0))  # a new mtime even on coarse clocks
+        self.assertEqual(len(store.get("file::ext.csv")), 10)
+        self.assertEqual(store.index("file::ext.csv", "year").count({"min": -1e9}), 10)
+        self.assertEqual(sum(1 for k in store._mem if isinstance(k, tuple)), 1)
+        print("✅ 数据集仓库测试通过")
+
+    def test_dataset_ids_cannot_escape_store(self):
+        """测试数据集ID校验：拒绝路径穿越，路由返回404"""
+        root = os.path.join(self.tmp, "traversal", "data")
+        secret = os.path.join(self.tmp, "traversal", "secret")
+        os.makedirs(root)
+        os.makedirs(secret)
+        with open(os.path.join(secret, "creds.json"), "w") as f:
+            json.dump({"token": "x"}, f)
+        pd.DataFrame({"a": [1]}).to_parquet(os.path.join(secret, "creds.parquet"))
+        store = DatasetStore(root, budget_bytes=10 ** 6)
+        for dsid in ("../../secret/creds", "../secret/creds", "clean-../../x", "sas-a/b", "not-a-uuid"):
+            with self.assertRaises(KeyError):
+                store.meta(dsid)
+            with self.assertRaises(KeyError):
+                store.get(dsid)
+            self.assertFalse(store.exists(dsid))
+        for dsid in (5, ["a"], {"id": "x"}, None):
+            for call in (store.meta, store.get, lambda d: list(store.iter_chunks(d, 10))):
+                with self.assertRaises(KeyError):
+                    call(dsid)
+        with self.assertRaises(KeyError):
+            store.put(pd.DataFrame({"a": [1]}), "x.csv", id="../escape")
+        self.assertEqual(store.meta(store.put(pd.DataFrame({"a": [1]}), "ok.csv", id="clean-abc123"))["name"], "ok.csv")
+
+        res = self.client.get("/api/datasets/..%2F..%2Fsecret%2Fcreds")
+        self.assertEqual(res.status_code, 404)
+        res = self.client.post("/api/apply-filters", json={"datasetId": "../../secret/creds", "filters": {}})
+        self.assertEqual(res.status_code, 404)
+        # 未知ID不回退到最新数据集
+        for table in ("nope", 5):
+            self.assertEqual(self.client.post("/api/get-table-fields", json={"table": table}).status_code, 404)
+            self.assertEqual(self.client.post("/api/apply-filters", json={"table": table}).status_code, 404)
+        self.assertEqual(self.client.post("/api/get-table-fields", json={"table": "main"}).status_code, 200)
+        print("✅ 数据集路径穿越测试通过")
+
+    def test_indexed_filter_pushdown(self):
+        """测试基于排序索引的向量化筛选（区间、IN列表、多列）"""
+        rng = np.random.default_rng(3)
+        df = pd.DataFrame({"Year": rng.integers(1950, 2024, 5000), "age": rng.integers(0, 100, 5000),
+                           "sex": rng.choice(["F", "M"], 5000), "q": rng.random(5000)})
+        df.loc[::97, "Year"] = np.nan
+        filters = {"year": {"min": 2000, "max": 2005}, "AGE": {"in": [30, 31, 99]}, "sex": {"in": ["F"]}}
+        rows = run_query(df, filters, lambda col: SortedIndex(df[col]) if col != "q" else None)
+        expected = np.flatnonzero(df["Year"].between(2000, 2005) & df["age"].isin([30, 31, 99]) & (df["sex"] == "F"))
+        np.testing.assert_array_equal(rows, expected)
+        np.testing.assert_array_equal(run_query(df, filters), expected)
+
+        # 旧式 startYear/endYear 与基线一致：保留年份缺失或非数字的行
+        legacy = {"year": {"min": 2000, "max": 2005, "optional": True, "keep_missing": True}}
+        expected = np.flatnonzero(df["Year"].isna() | df["Year"].between(2000, 2005))
+        np.testing.assert_array_equal(run_query(df, legacy, lambda col: SortedIndex(df[col])), expected)
+        np.testing.assert_array_equal(run_query(df, legacy), expected)
+        text = pd.DataFrame({"year": ["1999", "2001", "n/a", "2010"], "v": range(4)})
+        self.assertEqual(list(run_query(text, legacy, lambda col: SortedIndex(text[col]))), [1, 2])
+        dsid = extensions.datasets.put(text, "text_years.csv")
+        res = self.client.post("/api/apply-filters", json={"datasetId": dsid, "startYear": 2000, "endYear": 2005})
+        self.assertEqual([r["v"] for r in res.get_json()["filteredData"]], [1, 2])
+        for bad in ({"offset": "x"}, {"limit": "all"}, {"startYear": "recent"}):
+            self.assertEqual(self.client.post("/api/apply-filters", json={"datasetId": dsid, **bad}).status_code,
+                             400, bad)
+        print("✅ 索引筛选测试通过")
+
+    def test_chunked_csv_ingestion(self):
+        """测试分块CSV导入：整数降级与分类列合并"""
+        path = os.path.join(self.tmp, "upload.csv")
+        df = pd.DataFrame({"year": np.arange(900) + 1900, "age": np.arange(900) % 100,
+                           "sex": ["F"] * 450 + ["M"] * 450, "q": np.linspace(0, 1, 900)})
+        df.to_csv(path, index=False)
+        out = read_upload(path, "upload.csv", chunk_rows=200)
+        self.assertEqual(str(out["age"].dtype), "int8")
+        self.assertEqual(str(out["year"].dtype), "int16")
+        self.assertEqual(sorted(out["sex"].cat.categories), ["F", "M"])
+        pd.testing.assert_frame_equal(out.astype({"year": "int64", "age": "int64", "sex": object}),
+                                      df.astype({"sex": object}), check_dtype=False)
+        with self.assertRaises(ValueError):
+            read_upload(path, "upload.xlsx")
+        print("✅ 分块导入测试通过")
+
+    def test_chunked_ingestion_mixed_types(self):
+        """测试分块导入：前后分块类型不一致的列统一为文本，全空分类列可合并，入库不报错"""
+        path = os.path.join(self.tmp, "mixed.csv")
+        lines = ["year,code,sex"] + [f"{2000 + i},{i},M" for i in range(7)] + [f"2007,X{i},F" for i in range(3)] \
+            + ["2010,,"] * 5 + ["2011,5,M"]
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        out = read_upload(path, "mixed.csv", chunk_rows=5)
+        self.assertEqual(out["code"].dtype, object)
+        self.assertEqual(out["code"].tolist()[:8], ["0", "1", "2", "3", "4", "5", "6", "X0"])
+        self.assertTrue(out["code"].iloc[10:15].isna().all())
+        self.assertEqual(sorted(out["sex"].cat.categories), ["F", "M"])
+        dsid = extensions.datasets.put(out, "mixed.csv")
+        self.assertEqual(extensions.datasets.get(dsid)["code"].tolist()[7], "X0")
+        # 逐块写入Parquet，不在内存中拼接整表
+        streamed = extensions.datasets.put_chunks(iter_upload(path, "mixed.csv", chunk_rows=5), "mixed.csv")
+        pd.testing.assert_frame_equal(extensions.datasets.get(streamed),
+                                      pd.read_parquet(extensions.datasets._parquet(dsid)), check_categorical=False)
+        self.assertEqual(extensions.datasets.meta(streamed)["fingerprint"], extensions.datasets.meta(dsid)["fingerprint"])
+        with open(path, "rb") as f:
+            res = self.client.post("/api/upload-custom-data", data={"file": (f, "mixed.csv")}).get_json()
+        self.assertEqual(res["metadata"]["rows"], 16)
+        self.assertEqual(res["data"][7]["code"], "X0")
+        self.assertEqual(extensions.datasets.meta(res["id"])["fingerprint"],
+                         lineage.fingerprint(read_upload(path, "mixed.csv")))
+
+        base = extensions.datasets.put(pd.DataFrame({"year": [2000, 2001], "deaths": [5, 7]}), "base.csv")
+        res = self.client.post(f"/api/datasets/{base}/append", json={"data": [{"year": 2002, "deaths": "n/a"}]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(extensions.datasets.get(res.get_json()["id"])["deaths"].tolist(), ["5", "7", "n/a"])
+        with open(path, "rb") as f:
+            bad = self.client.post("/api/upload-custom-data", data={"file": (f, "broken.parquet")})
+        self.assertEqual(bad.status_code, 400)
+        print("✅ 混合类型分块导入测试通过")
+
+    def test_clean_data_pipeline_versions(self):
+        """测试按数据集引用的清洗流水线与版本缓存"""
+        df = pd.DataFrame({"year": [2000] * 5 + [2000], "age": [0, 1, 2, 3, 4, 0],
+                           "q": [0.1, np.nan, 0.3, np.nan, 9.0, 0.1]})
+        dsid = extensions.datasets.put(df, "clean.csv")
+        steps = [{"op": "dedupe"}, {"op": "clip", "column": "q", "max": 0.5}, {"op": "interpolate", "columns": ["q"]}]
+        first = self.client.post("/api/clean-data", json={"datasetId": dsid, "steps": steps}).get_json()
+        self.assertEqual([r["q"] for r in first["data"]], [0.1, 0.2, 0.3, 0.4, 0.5])
+        self.assertFalse(first["cached"])
+        again = self.client.post("/api/clean-data", json={"datasetId": dsid, "steps": steps}).get_json()
+        self.assertTrue(again["cached"])
+        self.assertEqual(again["id"], first["id"])
+        self.assertEqual(extensions.datasets.meta(first["id"])["parent"], dsid)
+        for bad in (["dedupe"], "dedupe", [{"op": "clip", "column": "q", "max": "0.5"}],
+                    [{"op": "winsorize", "upper": [0.9]}], [{"op": "unknown"}]):
+            res = self.client.post("/api/clean-data", json={"datasetId": dsid, "steps": bad})
+            self.assertEqual(res.status_code, 400, bad)
+        res = self.client.post("/api/clean-data", json={"datasetId": dsid, "steps": [{"op": "winsorize", "lower": None}]})
+        self.assertEqual(res.status_code, 200)
+        print("✅ 清洗流水线测试通过")
+
+    def test_fingerprints_and_lineage_ancestry(self):
+        """测试列缓冲指纹与索引化血缘存储的祖先查询"""
+        df = pd.DataFrame({"year": [2000, 2001, 2002], "q": [0.1, np.nan, 0.3], "sex": ["F", "M", "F"]})
+        self.assertEqual(lineage.fingerprint(df), lineage.fingerprint(df.copy()))
+        changed = df.assign(q=[0.1, 0.2, 0.3])
+        self.assertNotEqual(lineage.fingerprint(changed), lineage.fingerprint(df))
+        before, after = lineage.column_fingerprints(df), lineage.column_fingerprints(changed)
+        self.assertEqual([c for c in before if before[c] != after[c]], ["q"])
+
+        dsid = extensions.datasets.put(df, "lineage.csv")
+        self.assertEqual(extensions.datasets.meta(dsid)["fingerprint"], lineage.fingerprint(df))
+        extensions.lineage.record("upload", outputs={dsid: lineage.fingerprint(df)})
+        cleaned = self.client.post("/api/clean-data", json={"datasetId": dsid, "steps": [{"op": "drop_null_rows"}]})
+        clean_id = cleaned.get_json()["id"]
+        appended = self.client.post(f"/api/datasets/{clean_id}/append",
+                                    json={"data": [{"year": 2003, "q": 0.4, "sex": "M"}]}).get_json()["id"]
+        res = self.client.get(f"/api/lineage/{appended}")
+        self.assertEqual(res.status_code, 200)
+        records = res.get_json()["records"]
+        self.assertEqual([(r["operation"], r["depth"]) for r in records], [("append", 1), ("clean", 2), ("upload", 3)])
+        self.assertEqual(records[1]["inputs"], {dsid: extensions.datasets.meta(dsid)["fingerprint"]})
+        rid = self.client.post("/api/compare", json={"items": ["lee-carter"]}).get_json()["resultId"]
+        self.assertEqual(extensions.lineage.ancestry(rid)[0]["operation"], "compare")
+        self.assertEqual(self.client.get("/api/lineage/unknown").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/lineage/{appended}?depth=x").status_code, 400)
+        self.assertEqual(len(self.client.get(f"/api/lineage/{appended}?depth=1").get_json()["records"]), 1)
+        print("✅ 数据血缘测试通过")
+
+    def test_report_streaming_matches_in_memory(self):
+        """测试单遍统计引擎：分块合并与整表结果一致"""
+        rng = np.random.default_rng(3)
+        df = pd.DataFrame({"year": rng.integers(2000, 2005, 3000), "age": rng.integers(0, 100, 3000),
+                           "q": rng.normal(size=3000), "sex": rng.choice(["F", "M"], 3000)})
+        df.loc[::9, "q"] = np.nan
+        df.loc[7, "q"] = 25.0
+        dsid = extensions.datasets.put(df, "report.csv")
+        inline = self.client.post("/api/generate-report", json={"data": to_records(df)}).get_json()["report"]
+        stream = self.client.post("/api/generate-report", json={"datasetId": dsid, "chunkRows": 700}).get_json()["report"]
+        q = df["q"].dropna()
+        stats = next(s for s in stream["summaryStats"] if s["field"] == "q")
+        self.assertAlmostEqual(stats["mean"], q.mean(), places=12)
+        self.assertAlmostEqual(stats["std"], q.std(), places=12)
+        counts, _ = np.histogram(q, bins=10)
+        self.assertEqual(next(d for d in stream["dataDistribution"] if d["field"] == "q")["counts"], counts.tolist())
+        self.assertEqual(stream["outlierReport"], inline["outlierReport"])
+        self.assertEqual(stream["missingValueReport"], [{"field": "q", "missing": 334, "percent": 11.13}])
+        self.assertEqual(stream["timeSeriesAnalysis"], inline["timeSeriesAnalysis"])
+        self.assertEqual(sum(r["count"] for r in stream["timeSeriesAnalysis"]), 3000)
+        self.assertEqual(self.client.post("/api/generate-report", json={"datasetId": "nope"}).status_code, 404)
+        for bad in ({"bins": "many"}, {"chunkRows": None}, {"chunkRows": [700]}):
+            self.assertEqual(self.client.post("/api/generate-report", json={"datasetId": dsid, **bad}).status_code,
+                             400, bad)
+        print("✅ 报告统计测试通过")
+
+    def test_report_cache_folds_appended_rows(self):
+        """测试报告统计按数据集版本缓存，追加数据只合并新增行"""
+        rng = np.random.default_rng(4)
+        df = pd.DataFrame({"year": np.repeat(np.arange(2000, 2010), 400), "q": rng.normal(size=4000)})
+        dsid = extensions.datasets.put(df.iloc[:3000], "fold.csv")
+        first = self.client.post("/api/generate-report", json={"datasetId": dsid}).get_json()["report"]
+        self.assertNotIn("approximate", first)
+        self.assertIsNotNone(extensions.datasets.load_artifact(dsid, "report-v1-10"))
+
+        res = self.client.post(f"/api/datasets/{dsid}/append", json={"data": to_records(df.iloc[3000:])})
+        new_id = res.get_json()["id"]
+        self.assertEqual(extensions.datasets.meta(new_id)["baseRows"], 3000)
+        folded = self.client.post("/api/generate-report", json={"datasetId": new_id}).get_json()["report"]
+        full = describe_frame(df)
+        for got, want in zip(folded["summaryStats"], full["summaryStats"]):
+            for k in ("count", "mean", "std", "min", "max"):
+                self.assertAlmostEqual(got[k], want[k], places=9)
+        self.assertEqual(folded["timeSeriesAnalysis"], full["timeSeriesAnalysis"])
+        self.assertEqual(folded["approximate"], ["outlierReport", "dataDistribution"])
+        got = np.array(folded["dataDistribution"][1]["counts"])
+        want = np.array(full["dataDistribution"][1]["counts"])
+        self.assertEqual(got.sum(), 4000)
+        self.assertLessEqual(np.abs(got - want).max(), 10)
+        bad = self.client.post(f"/api/datasets/{dsid}/append", json={"data": [{"year": 2011}]})
+        self.assertEqual(bad.status_code, 400)
+        print("✅ 报告增量缓存测试通过")
+
+    def test_compare_models_parallel(self):
+        """测试并行模型对比：真实AIC/BIC/残差自相关/样本外误差与排名"""
+        import multiprocessing
+        res = self.client.post("/api/compare", json={"items": ["lee-carter", "cbd", "apc", "gompertz"],
+                                                     "sexes": ["Female", "Male"]})
+        self.assertEqual(res.status_code, 200)
+        results = res.get_json()["results"]
+        self.assertEqual(results["data"]["ages"], [50, 90])
+        ranking = results["summary"]["model_ranking"]
+        self.assertEqual(len(ranking), 4)
+        scores = [r["aic"] + 100 * abs(r["residual_autocorr"]) for r in ranking]
+        self.assertEqual(scores, sorted(scores))
+        self.assertEqual(results["summary"]["best_model"], ranking[0]["model_id"])
+        for metric in ("AIC", "BIC", "Residual", "MAPE", "OOS_RMSE", "OOS_MAPE"):
+            self.assertTrue(all(np.isfinite(results["metrics"][metric])), metric)
+        self.assertTrue(all(v > 0 for v in results["metrics"]["OOS_MAPE"]))
+        # APC剔除稀疏队列后，所有模型在同一批单元格上计算AIC
+        self.assertEqual(len({d["data"]["n_obs"] for d in results["details"]}), 1)
+
+        lc = fit_lee_carter(np.log(np.full((1, 3, 12), 0.01) * np.exp(-0.02 * np.arange(12))))
+        self.assertTrue(np.allclose(comparison.project("lee-carter", lc, [0, 1, 2], 2),
+                                    np.log(0.01) - 0.02 * np.arange(12, 14)))
+        m = np.exp(np.random.default_rng(0).normal(-4, 0.1, (1, 10, 20)))
+        jobs = {str(i): ("lee-carter", m, np.arange(10), np.arange(20), 5, {}) for i in range(2)}
+        late = comparison.run_parallel(jobs, timeout=0, max_workers=2)
+        self.assertTrue(any("timed out" in r.get("error", "") for r in late.values()))
+        for workers in (1, 2):  # a TypeError in one fit is a per-model error in both modes
+            typed = comparison.run_parallel({"ok": jobs["0"], "apc": ("apc", m, np.arange(10), np.arange(20), 5,
+                                                                      {"minCohortCells": None})}, 60, workers)
+            self.assertIn("aic", typed["ok"])
+            self.assertIn("error", typed["apc"])
+        for bad in ({"holdout": "x"}, {"items": [{"id": "apc", "minCohortCells": "few"}]}):
+            self.assertEqual(self.client.post("/api/compare", json=bad).status_code, 400, bad)
+        jobs["bad"] = ("soa-calibration", m, np.arange(10), np.arange(20), 5, {})
+        mixed = comparison.run_parallel(jobs, timeout=60, max_workers=2)  # the third job waits for a slot
+        self.assertEqual(list(mixed), ["0", "1", "bad"])
+        self.assertTrue(all("aic" in mixed[k] for k in ("0", "1")))
+        self.assertIn("cannot be compared", mixed["bad"]["error"])
+        self.assertEqual(multiprocessing.active_children(), [])
+        bad = self.client.post("/api/compare", json={"items": ["soa-calibration"]})
+        self.assertEqual(bad.status_code, 400)
+        print("✅ 模型对比测试通过")
+
+    def test_result_store_shared_and_bounded(self):
+        """测试结果存储：唯一ID、跨进程可见、紧凑数组与容量淘汰"""
+        res = self.client.post("/api/compare", json={"items": ["lee-carter", "gompertz"]}).get_json()
+        saved = self.client.post("/api/save-comparison", json={"results": res["results"]}).get_json()
+        self.assertNotEqual(res["resultId"], saved["resultId"])
+        other_worker = ResultStore(extensions.results.path)
+        self.assertEqual(other_worker.get(saved["resultId"])["summary"], res["results"]["summary"])
+        export = self.client.post("/api/export-comparison", json={"resultId": res["resultId"]})
+        self.assertEqual(export.status_code, 200)
+        self.assertEqual(self.client.post("/api/export-comparison", json={"resultId": "result_0"}).status_code, 400)
+
+        store = ResultStore(os.path.join(self.tmp, "results_small.sqlite"), max_bytes=30000)
+        series = {"k_t": np.linspace(0, 1, 2000).tolist(), "labels": ["a"] * 3}
+        first = store.put(series)
+        self.assertEqual(store.get(first), series)
+        self.assertLess(store.usage()["bytes"], len(json.dumps(series)))
+        ids = [store.put({"x": np.random.default_rng(i).random(2000).tolist()}) for i in range(3)]
+        self.assertLessEqual(store.usage()["bytes"], 30000)
+        self.assertIsNone(store.get(first))
+        self.assertIsNotNone(store.get(ids[-1]))
+        print("✅ 结果存储测试通过")
+
+    def test_export_comparison_streams_zip(self):
+        """测试流式导出：离线图表、汇总表与预测扇形图/模拟路径表"""
+        import io
+        import zipfile
+        rid = self.client.post("/api/compare", json={"items": ["lee-carter", "cbd", "gompertz"],
+                                                     "sexes": ["Female", "Male"]}).get_json()["resultId"]
+        spec = {"horizon": 5, "n_simulations": 200, "seed": 7, "format": "parquet", "paths": True}
+        res = self.client.post("/api/export-comparison", json={"resultId": rid, "forecast": spec})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        z = zipfile.ZipFile(io.BytesIO(res.get_data()))
+        self.assertIsNone(z.testzip())
+        names = set(z.namelist())
+        for name in ("summary.csv", "details.json", "chart_1.html", "forecasts/manifest.json",
+                     "forecasts/lee-carter_Male_fan.parquet", "forecasts/cbd_Female_paths.parquet"):
+            self.assertIn(name, names)
+        self.assertFalse(any(n.startswith("forecasts/gompertz") for n in names))
+        self.assertNotIn("cdn.plot.ly", z.read("chart_1.html").decode())
+        summary = pd.read_csv(io.BytesIO(z.read("summary.csv")))
+        self.assertEqual(list(summary["Item"]), ["Lee-Carter", "CBD", "Gompertz"])
+        fan = pd.read_parquet(io.BytesIO(z.read("forecasts/lee-carter_Male_fan.parquet")))
+        self.assertEqual(len(fan), 5 * 41)
+        self.assertTrue((fan["lower_95"] <= fan["median"]).all() and (fan["median"] <= fan["upper_95"]).all())
+        paths = pd.read_parquet(io.BytesIO(z.read("forecasts/cbd_Female_paths.parquet")))
+        self.assertEqual(len(paths), 200 * 5)
+        self.assertEqual(list(paths.columns), ["path", "year", "kappa1", "kappa2"])
+
+        again = self.client.post("/api/export-comparison", json={"resultId": rid, "forecast": spec}).get_data()
+        self.assertEqual(zipfile.ZipFile(io.BytesIO(again)).read("forecasts/cbd_Female_paths.parquet"),
+                         z.read("forecasts/cbd_Female_paths.parquet"))
+        bad = self.client.post("/api/export-comparison", json={"resultId": rid, "forecast": {"format": "xlsx"}})
+        self.assertEqual(bad.status_code, 400)
+        print("✅ 流式导出测试通过")
+
+    def test_audit_writer_buffers_and_rotates(self):
+        """测试审计日志：后台批量写入、按大小轮转与关闭时落盘"""
+        self.client.post("/api/fetch-data", json={"source": "HMD_RAW"})
+        self.assertTrue(audit.flush(timeout=10))
+        with open(os.environ["AUDIT_LOG_PATH"], encoding="utf-8") as f:
+            actions = [json.loads(line)["action"] for line in f]
+        self.assertIn("HMD_RAW_FETCH", actions)
+
+        path = os.path.join(self.tmp, "audit_rotate", "audit.log")
+        writer = audit.AuditWriter(path, max_bytes=2000, backups=2, fsync="always")
+        for i in range(600):
+            writer.write({"action": "TEST", "details": {"i": i}})
+        writer.close()
+        files = sorted(os.listdir(os.path.dirname(path)))
+        self.assertEqual(files, ["audit.log", "audit.log.1", "audit.log.2", "audit.log.lock"])
+        self.assertTrue(all(os.path.getsize(os.path.join(os.path.dirname(path), f)) <= 2000 for f in files[:3]))
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.readlines()[-1])["details"]["i"], 599)
+        with self.assertRaises(ValueError):
+            audit.AuditWriter(path, fsync="sometimes")
+        print("✅ 审计日志测试通过")
+
+    def test_audit_rotation_across_processes(self):
+        """测试审计日志：多个进程共用同一文件轮转时不丢行、不写入已轮转的文件"""
+        import multiprocessing
+        path = os.path.join(self.tmp, "audit_procs", "audit.log")
+
+        def worker(n):
+            writer = audit.AuditWriter(path, max_bytes=3000, backups=100, flush_seconds=0.01)
+            for i in range(300):
+                writer.write({"action": "TEST", "details": {"worker": n, "i": i}})
+                if i % 50 == 0:
+                    writer.flush(timeout=10)
+            writer.close()
+
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=worker, args=(n,)) for n in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(60)
+            self.assertEqual(p.exitcode, 0)
+        folder = os.path.dirname(path)
+        logs = [f for f in os.listdir(folder) if not f.endswith(".lock")]
+        seen = []
+        for name in logs:
+            self.assertLessEqual(os.path.getsize(os.path.join(folder, name)), 3000)
+            with open(os.path.join(folder, name), encoding="utf-8") as f:
+                seen += [(e["details"]["worker"], e["details"]["i"]) for e in map(json.loads, f)]
+        self.assertEqual(sorted(seen), [(n, i) for n in range(4) for i in range(300)])
+        print("✅ 审计日志多进程轮转测试通过")
+
+    def test_sas_job_queue(self):
+        """测试SAS作业队列：异步提交、结果入库、按脚本与输入缓存、取消与临时目录清理"""
+        import time
+        dsid = extensions.datasets.put(pd.DataFrame({"year": [2000, 2001], "deaths": [5, 7]}), "cdc_input.csv")
+        body = {"script": "proc means data=in.src; run;", "inputs": {"src": dsid}, "params": {"state": "NY"}}
+        res = self.client.post("/api/sas-jobs", json=body)
+        self.assertEqual(res.status_code, 202)
+        job = extensions.sas_jobs.wait(res.get_json()["id"], timeout=10)
+        self.assertEqual(job["status"], "done")
+        output = job["result"]["outputs"][0]
+        self.assertEqual(len(extensions.datasets.get(output["id"])), 100)
+        self.assertIn("src.csv", job["result"]["log"])
+        again = self.client.post("/api/sas-jobs", json=body).get_json()
+        self.assertTrue(again["cached"])
+        self.assertEqual(again["status"], "done")
+        self.assertEqual(again["result"]["outputs"], job["result"]["outputs"])
+        self.assertEqual(os.listdir(os.path.join(self.tmp, "cache", "sas")), [])
+        self.assertEqual(self.client.post("/api/sas-jobs", json={"script": "x", "inputs": {"a": "nope"}}).status_code,
+                         404)
+        for bad in ({"inputs": ["a"]}, {"inputs": "a"}, {"params": [1]}):
+            self.assertEqual(self.client.post("/api/sas-jobs", json={"script": "x", **bad}).status_code, 400, bad)
+        self.assertEqual(self.client.get("/api/sas-jobs/sas_0").status_code, 404)
+        cdc = self.client.post("/api/fetch-data", json={"source": "CDC"}).get_json()
+        self.assertIsNotNone(extensions.sas_jobs.status(cdc["metadata"]["jobId"]))
+
+        slow = SasJobQueue(os.path.join(self.tmp, "sas_slow.sqlite"), MockExecutor(delay=30), extensions.datasets,
+                           max_workers=1, max_queued=1, work_dir=os.path.join(self.tmp, "sas_slow"))
+        running = slow.submit("data a; run;")
+        while slow.status(running["id"])["status"] != "running":
+            time.sleep(0.01)
+        queued = slow.submit("data b; run;")
+        self.assertEqual(slow.submit("data b; run;")["id"], queued["id"])
+        with self.assertRaises(QueueFull):
+            slow.submit("data c; run;")
+        self.assertEqual(slow.cancel(queued["id"])["status"], "cancelled")
+        start = time.monotonic()
+        other_worker = SasJobQueue(slow.db_path, MockExecutor(), extensions.datasets)
+        self.assertEqual(other_worker.cancel(running["id"])["status"], "cancelling")
+        self.assertEqual(slow.wait(running["id"], timeout=5)["status"], "cancelled")
+        self.assertLess(time.monotonic() - start, 5)
+        slow.shutdown()
+        self.assertEqual(os.listdir(os.path.join(self.tmp, "sas_slow")), [])
+        print("✅ SAS作业队列测试通过")
+
+    def test_sas_jobs_recover_from_lost_workers(self):
+        """测试SAS作业心跳：进程退出后遗留的排队/运行作业被判定失败，不再阻塞队列"""
+        import sqlite3
+        import time
+        path = os.path.join(self.tmp, "sas_lost.sqlite")
+        dead = SasJobQueue(path, MockExecutor(), extensions.datasets, max_queued=1)
+        stale = time.time() - 3600
+        key = SasJobQueue.job_key("data lost; run;", {"inputs": {}, "params": {}})
+        with sqlite3.connect(path) as db:  # rows left behind by a worker that died
+            db.executemany("INSERT INTO jobs (id, key, status, submitted, owner, heartbeat) VALUES (?, ?, ?, ?, ?, ?)",
+                           [("sas_run", key, "running", stale, "gone:1:x", stale),
+                            ("sas_wait", "other", "queued", stale, "gone:1:x", stale),
+                            ("sas_stop", "third", "cancelling", stale, "gone:1:x", stale)])
+        self.assertEqual(dead.status("sas_run")["status"], "failed")
+        self.assertIn("worker lost", dead.status("sas_run")["error"])
+        self.assertEqual(dead.status("sas_stop")["status"], "cancelled")
+
+        restarted = SasJobQueue(path, MockExecutor(), extensions.datasets, max_queued=1, stale_seconds=0.3)
+        self.assertEqual(restarted.status("sas_wait")["status"], "failed")
+        fresh = restarted.submit("data lost; run;")  # not deduplicated onto the dead job, queue not full
+        self.assertNotEqual(fresh["id"], "sas_run")
+        self.assertEqual(restarted.wait(fresh["id"], timeout=10)["status"], "done")
+
+        # a live worker keeps its long job alive past the stale limit
+        slow = SasJobQueue(path, MockExecutor(delay=2), extensions.datasets, stale_seconds=0.3)
+        job = slow.submit("data slow; run;")
+        time.sleep(0.8)
+        self.assertIn(restarted.status(job["id"])["status"], ("queued", "running"))
+        self.assertEqual(slow.wait(job["id"], timeout=10)["status"], "done")
+        for queue in (dead, restarted, slow):
+            queue.shutdown()
+        print("✅ SAS作业失联恢复测试通过")
+
+    def test_life_table_engine(self):
+        """测试向量化生命表：恒等关系、开放年龄组、婴儿a0与按数据版本缓存"""
+        m = np.array([[0.01, 0.002, 0.005, 0.3]])
+        lt = life_table.life_table(m, [0, 1, 2, 3], ["Female"])
+        a0 = 0.14903 - 2.05527 * 0.01
+        self.assertAlmostEqual(lt["ax"][0, 0], a0)
+        self.assertAlmostEqual(lt["qx"][0, 0], 0.01 / (1 + (1 - a0) * 0.01))
+        self.assertEqual(lt["qx"][0, -1], 1.0)
+        self.assertAlmostEqual(lt["Lx"][0, -1], lt["lx"][0, -1] / 0.3)
+        self.assertTrue(np.allclose(lt["dx"].sum(-1), life_table.RADIX))
+        self.assertTrue(np.allclose(lt["ex"] * lt["lx"], lt["Tx"]))
+        gap = life_table.life_table(np.array([0.01, np.nan, 0.005, 0.0]), [0, 1, 2, 3])
+        self.assertEqual(gap["mx"][1], 0.01)
+        self.assertEqual(gap["mx"][-1], 0.005)
+        with self.assertRaises(ValueError):
+            life_table.life_table(m, [0, 1, 5, 6])
+
+        body = {"sexes": ["Female", "Male"], "columns": ["ex", "qx"], "ages": [0, 65, 110]}
+        res = self.client.post("/api/life-table", json=body)
+        self.assertEqual(res.status_code, 200)
+        out = res.get_json()
+        self.assertEqual(out["ages"], [0, 65, 110])
+        self.assertEqual(len(out["table"]["Female"]["ex"]), len(out["years"]))
+        e0_f, e0_m = out["table"]["Female"]["ex"][-1][0], out["table"]["Male"]["ex"][-1][0]
+        self.assertTrue(60 < e0_m < e0_f < 95)
+        self.assertEqual(out["table"]["Male"]["qx"][0][2], 1.0)
+        hits = extensions.cache.stats["hits_local"]
+        self.assertEqual(self.client.post("/api/life-table", json=body).get_json(), out)
+        self.assertEqual(extensions.cache.stats["hits_local"], hits + 1)
+        self.assertEqual(self.client.post("/api/life-table", json={"columns": ["px"]}).status_code, 400)
+        print("✅ 生命表测试通过")
+
+    def test_multiple_decrement_engine(self):
+        """测试多重减因表：UDD/常数力转换、往返一致性与多情景接口"""
+        a, b, c = 0.1, 0.2, 0.05
+        dep = decrements.to_dependent([a, b, c], "udd")
+        self.assertAlmostEqual(dep[0], a * (1 - (b + c) / 2 + b * c / 3))
+        self.assertAlmostEqual(dep.sum(), 1 - (1 - a) * (1 - b) * (1 - c))
+        const = decrements.to_dependent([a, b], "constant_force")
+        self.assertAlmostEqual(const[0] / const[1], np.log(1 - a) / np.log(1 - b))
+        q = np.random.default_rng(5).uniform(0, 0.5, (3, 200, 40))  # decrement x cohort x age
+        for assumption in decrements.ASSUMPTIONS:
+            back = decrements.to_independent(decrements.to_dependent(q, assumption), assumption)
+            self.assertTrue(np.allclose(back, q, atol=1e-9), assumption)
+        entry = np.arange(200) % 40
+        table = decrements.multiple_decrement_table(decrements.to_dependent(q), entry=entry)
+        self.assertTrue(np.allclose(table["lx"][np.arange(200), entry], life_table.RADIX))
+        self.assertEqual(table["lx"][5, 4], 0.0)
+        self.assertTrue(np.allclose(table["dx"].sum(0)[:, :-1],
+                                    -np.diff(table["lx"], axis=-1) * (np.arange(39) >= entry[:, None])))
+
+        lapse = extensions.datasets.put(pd.DataFrame({"Age": np.arange(20, 111), "lapse": 0.04}), "lapse.csv")
+        body = {"startAge": 20, "endAge": 110, "assumption": "udd",
+                "decrements": [{"name": "death", "source": "hmd", "sex": "Female", "year": 2019},
+                               {"name": "lapse", "datasetId": lapse, "column": "lapse"},
+                               {"name": "retirement", "rates": [0.0] * 40 + [0.1] * 51}],
+                "scenarios": {"base": {}, "mass_lapse": {"lapse": 2.0}}}
+        res = self.client.post("/api/multiple-decrement", json=body)
+        self.assertEqual(res.status_code, 200)
+        out = res.get_json()["scenarios"]
+        base, shocked = out["base"], out["mass_lapse"]
+        indep = np.array([base["independent"][n] for n in ("death", "lapse", "retirement")])
+        self.assertTrue(np.allclose(1 - np.array(base["q_total"]), np.prod(1 - indep, axis=0)))
+        self.assertTrue(np.allclose(shocked["independent"]["lapse"], 0.08))
+        self.assertLess(shocked["dependent"]["death"][10], base["dependent"]["death"][10])
+        self.assertAlmostEqual(base["dependent"]["death"][-1], 1.0 - base["dependent"]["lapse"][-1]
+                               - base["dependent"]["retirement"][-1])
+        bad = dict(body, decrements=[{"name": "x", "constant": 0.6}, {"name": "y", "constant": 0.6}],
+                   rateType="dependent")
+        self.assertEqual(self.client.post("/api/multiple-decrement", json=bad).status_code, 400)
+        print("✅ 多重减因测试通过")
+
+    def test_valuation_engine(self):
+        """测试换算函数缓存与批量保单准备金计算"""
+        ages = np.arange(0, 101)
+        q = np.full(len(ages), 0.02)
+        q[-1] = 1.0
+        ct = valuation.CommutationTable(ages, life_table.lx_from_qx(q), 0.04)
+        # 常数死亡率下终身寿险的解析解（末端年龄前几乎不受截断影响）
+        self.assertAlmostEqual(float(ct.insurance(0)), 0.02 / 0.06, places=2)
+        self.assertAlmostEqual(float(ct.annuity_due(0)), (1 - float(ct.insurance(0))) * 1.04 / 0.04)
+        endow = ct.insurance(30, 20, "endowment")
+        self.assertAlmostEqual(float(endow), float(ct.insurance(30, 20, "term") + ct.pure_endowment(30, 20)))
+        t = np.arange(20)
+        reserve = ct.reserve(30, t, 20, "endowment")
+        premium = float(ct.net_premium(30, 20, "endowment"))
+        self.assertAlmostEqual(float(reserve[0]), 0.0)
+        # 准备金递推：(tV + P)(1 + i) = q + p · t+1V
+        nxt = np.append(reserve[1:], 1.0)
+        self.assertTrue(np.allclose((reserve + premium) * 1.04, 0.02 + 0.98 * nxt))
+        self.assertEqual(float(ct.reserve(30, 25, 20, "term")), 0.0)
+
+        calls = []
+        build = lambda: calls.append(1) or (ages, life_table.lx_from_qx(q))
+        self.assertIs(valuation.commutation_table("flat", 0.04, build), valuation.commutation_table("flat", 0.04, build))
+        self.assertEqual(len(calls), 1)
+
+        policies = {"issueAge": [30, 40, 50], "term": [20, None, 10], "duration": [5, 0, 3],
+                    "benefit": ["endowment", "whole", "term"], "sumAssured": [1000, 2000, 500],
+                    "sex": ["F", "M", "T"]}
+        res = self.client.post("/api/valuation", json={"interest": 0.03, "policies": policies}).get_json()
+        self.assertEqual(res["count"], 3)
+        self.assertAlmostEqual(res["policies"]["reserve"][1], 0.0)
+        self.assertGreater(res["policies"]["reserve"][0], 0)
+        self.assertAlmostEqual(res["totals"]["reserve"], sum(res["policies"]["reserve"]))
+        heavier = self.client.post("/api/valuation", json={"interest": 0.03, "policies": policies,
+                                                           "mortalityScale": 1.5, "summaryOnly": True}).get_json()
+        self.assertNotIn("policies", heavier)
+        self.assertGreater(heavier["totals"]["annualPremium"], res["totals"]["annualPremium"])
+        bad = {"policies": dict(policies, benefit=["whole", "annuity", "term"])}
+        self.assertEqual(self.client.post("/api/valuation", json=bad).status_code, 400)
+        print("✅ 保单估值测试通过")
+
+    def test_sensitivity_grid_streams(self):
+        """测试情景网格：冲击广播、分片并行与流式进度输出"""
+        profile = scenarios.shock_profile("二次爆发", "重尾", 5)
+        self.assertGreater(profile[2], profile[1])
+        self.assertTrue(np.all(scenarios.shock_profile("疫情延续", "轻尾", 3) == 1.0))
+        coef = scenarios.age_coefficients(np.arange(100), {"0-39": 0.5, "65+": 2})
+        self.assertEqual((coef[10], coef[50], coef[99]), (0.5, 1.0, 2.0))
+
+        ages = np.arange(101)
+        q = np.minimum(0.0005 * np.exp(0.09 * ages), 1.0)
+        q[-1] = 1.0
+        q_base = np.stack([q, q * 1.1])
+        points = scenarios.grid([1.0, 1.3], ["中尾"], ["基准", "二次爆发"])
+        ct = valuation.CommutationTable(ages, life_table.lx_from_qx(q_base), 0.03)
+        # 无冲击时队列生存等于时期生命表，准备金与换算函数一致
+        age, dur, term = np.array([40, 50]), np.array([5, 2]), np.array([200, 15])
+        benefit, sex = np.array(["whole", "endowment"]), np.array([0, 1])
+        policies = {"sex": sex, "attained": age + dur, "left": term - dur, "pay_left": term - dur,
+                    "benefit": benefit, "sum_assured": np.array([1.0, 2.0]),
+                    "premium": ct.net_premium(age, term, benefit, term, sex)}
+        serial = [r for _, shard in scenarios.run_grid(q_base, ages, points, [{}], 0.03, policies, 1, 1)
+                  for r in shard]
+        pooled = sorted((r for _, shard in scenarios.run_grid(q_base, ages, points, [{}], 0.03, policies, 1, 2)
+                         for r in shard), key=lambda r: (r["intensity"], r["scenario"] != "基准"))
+        self.assertEqual([r["reserve"] for r in serial], [r["reserve"] for r in pooled])
+        expected = ct.reserve(age, dur, term, benefit, term, sex) @ np.array([1.0, 2.0])
+        self.assertAlmostEqual(serial[0]["reserve"], float(expected))
+        self.assertAlmostEqual(serial[0]["annuity65"][1], float(ct.annuity_due(65, row=1)))
+        self.assertGreater(serial[3]["reserve"], serial[2]["reserve"])
+        self.assertLess(serial[3]["e65"][0], serial[0]["e65"][0])
+
+        res = self.client.post("/api/sensitivity", json={"intensities": [0.8, 1.5], "tails": ["轻尾", "重尾"],
+                                                         "ageGroups": [{}, {"65+": 1.5}]})
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual((lines[0]["type"], lines[-1]["type"]), ("grid", "done"))
+        done = [p for line in lines if line["type"] == "progress" for p in line["points"]]
+        self.assertEqual(sorted(p["id"] for p in done), list(range(24)))
+        heavy = next(p for p in done if p["intensity"] == 1.5 and p["tail"] == "重尾" and p["scenario"] == "疫情延续"
+                     and p["ageGroup"] == 1)
+        self.assertGreater(heavy["reserveImpact"], 0)
+        sse = self.client.post("/api/sensitivity", json={"intensities": [1.1], "format": "sse"})
+        self.assertTrue(sse.get_data(as_text=True).startswith("data: "))
+        bad = self.client.post("/api/sensitivity", json={"scenarios": ["自定义"]})
+        self.assertEqual(bad.status_code, 400)
+        for groups in (["65+"], [{"65+": [1.5]}], [{"65+": "high"}], "65+"):
+            self.assertEqual(self.client.post("/api/sensitivity", json={"ageGroups": groups}).status_code, 400, groups)
+        print("✅ 敏感性网格测试通过")
+
+    def test_rolling_origin_backtest(self):
+        """测试滚动起点回溯测试矩阵：并行分块与串行一致、APC分解复用"""
+        ages, years = np.arange(40, 80), np.arange(1960, 2000)
+        k = -0.02 * (years - years[0])
+        log_m = (-9 + 0.09 * ages)[:, None] + k[None, :]
+        m = np.exp(np.stack([log_m, log_m + 0.1]))
+        origins = backtest.origin_years(years, 5, 8, window=20)
+        self.assertEqual((origins[0], origins[-1]), (1991, 1998))
+        serial = backtest.run_backtest(backtest.BACKTEST_MODELS, m, ages, years, origins, 5, 20, max_workers=1)
+        pooled = backtest.run_backtest(backtest.BACKTEST_MODELS, m, ages, years, origins, 5, 20, max_workers=3)
+        for mid in backtest.BACKTEST_MODELS:
+            self.assertEqual(serial[mid]["rmse"].shape, (2, 8, 5))
+            np.testing.assert_allclose(serial[mid]["mape"], pooled[mid]["mape"])
+        # 线性趋势下Lee-Carter漂移预测无误差；超出数据的期限为NaN
+        self.assertLess(np.nanmax(serial["lee-carter"]["rmse"]), 1e-8)
+        self.assertTrue(np.isnan(serial["apc"]["rmse"][0, -1, 1]))
+        self.assertFalse(np.isnan(serial["apc"]["rmse"][0, 0, 4]))
+
+        opts = {"apc": {"minCohortCells": None}}  # TypeError inside the fit
+        for workers in (1, 3):
+            broken = backtest.run_backtest(["lee-carter", "apc"], m, ages, years, origins, 5, 20, opts, workers)
+            self.assertIn("error", broken["apc"])
+            self.assertIn("rmse", broken["lee-carter"])
+
+        # CBD逐年独立求解：整体拟合切片与逐窗口重新拟合一致
+        for win in (20, None):
+            sliced = backtest.backtest_model("cbd", m, ages, years, origins, 5, window=win)
+            for o, origin in enumerate(origins[:3]):
+                end = int(np.searchsorted(years, origin, side="right"))
+                start = end - win if win else 0
+                fit, _, _ = comparison._fit("cbd", np.log(m[..., start:end]), ages, years[start:end], {})
+                fit["last_year"] = years[end - 1]
+                pred = comparison.project("cbd", fit, ages, 1)[..., 0]
+                rmse = np.sqrt(np.mean((pred - np.log(m[..., end])) ** 2, axis=1))
+                np.testing.assert_allclose(sliced["rmse"][:, o, 0], rmse, rtol=1e-8)
+
+        from app.utils import apc
+        apc._system.cache_clear()
+        backtest.backtest_model("apc", m, ages, years, origins, 3, window=20)
+        self.assertEqual(apc._system.cache_info().currsize, 1)
+
+        res = self.client.post("/api/backtest", json={"horizon": 5, "origins": 12, "step": 2}).get_json()
+        self.assertTrue(res["resultId"].startswith("backtest_"))
+        export = self.client.post("/api/export-comparison", json={"resultId": res["resultId"]})
+        self.assertEqual(export.status_code, 400)
+        body = res["results"]
+        self.assertEqual(len(body["origins"]), 12)
+        self.assertEqual(set(body["models"]), {"lee-carter", "cbd", "apc"})
+        matrix = body["models"]["cbd"]["mape"]["Total"]
+        self.assertEqual((len(matrix), len(matrix[0])), (12, 5))
+        self.assertIsNone(matrix[-1][-1])
+        self.assertEqual(body["visualizations"][0]["data"][0]["type"], "heatmap")
+        for bad_body in ({"items": ["gompertz"]}, {"window": 3}, {"horizon": "ten"}, {"origins": "all"}):
+            self.assertEqual(self.client.post("/api/backtest", json=bad_body).status_code, 400, bad_body)
+        print("✅ 回溯测试矩阵测试通过")
+
+    def test_two_tier_cache(self):
+        """测试两级缓存：本地LRU、Redis压缩存储、故障降级与并发合并"""
+        import redis
+        import threading
+
+        class FakeRedis(dict):
+            def set(self, key, value, ex=None):
+                self[key] = value
+
+            def ttl(self, key):
+                return 60
+
+            def delete(self, key):
+                self.pop(key, None)
+
+        class DownRedis:
+            def get(self, *args):
+                raise redis.ConnectionError("down")
+            set = delete = ttl = get
+
+        remote = FakeRedis()
+        cache = TwoTierCache(client=remote, max_bytes=10000, compress_min=100)
+        cache.set("big", {"x": list(range(500))})
+        self.assertTrue(remote["dap:big"].startswith(b"z"))
+        other = TwoTierCache(client=remote)  # another worker: remote hit, then local
+        self.assertEqual(other.get("big"), {"x": list(range(500))})
+        other.get("big")
+        self.assertEqual((other.stats["hits_remote"], other.stats["hits_local"]), (1, 1))
+        small = TwoTierCache(max_bytes=10000)
+        for i in range(20):  # byte budget evicts the oldest local entries
+            small.set(f"k{i}", "v" * 1000)
+        self.assertLessEqual(small.info()["local_bytes"], 10000)
+        self.assertIsNone(small.get("k0"))
+        self.assertEqual(small.get("k19"), "v" * 1000)
+        # the budget counts decoded objects: a list that compresses to ~100 bytes but takes
+        # ~80 kB in memory is not kept locally
+        floats = [0.5] * 10000
+        self.assertGreater(cache_module.object_size(floats), 80000)
+        small.set("floats", floats)
+        self.assertLessEqual(small.info()["local_bytes"], 10000)
+        self.assertNotIn("floats", small._local)
+
+        down = TwoTierCache(client=DownRedis())
+        down.set("a", 1)
+        self.assertEqual(down.get("a"), 1)
+        self.assertEqual(down.info()["remote"], "down")
+
+        calls, gate = [], threading.Event()
+
+        def slow():
+            calls.append(1)
+            gate.wait(2)
+            return 42
+        local = TwoTierCache()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(local.get_or_compute("k", slow))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        while not calls:
+            pass
+        gate.set()
+        for t in threads:
+            t.join()
+        self.assertEqual((results, len(calls)), ([42] * 4, 1))
+
+        fit = self.client.post("/api/model/lee-carter/fit", json={"startYear": 1990}).get_json()
+        again = self.client.post("/api/model/lee-carter/fit", json={"startYear": 1990}).get_json()
+        self.assertEqual(fit, again)
+        self.assertGreater(self.client.get("/api/cache-stats").get_json()["hits_local"], 0)
+        print("✅ 两级缓存测试通过")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -54,6 +54,7 @@ function initAnalysis(){
       const fd = new FormData(); fd.append('file', file);
       const res = await fetch(API('/upload-custom-data'), { method:'POST', body: fd });
       const json = await res.json(); window.__DATA__ = json.data || [];
+      window.__DATASET_ID__ = json.id;
       document.getElementById('generateReportBtn')?.removeAttribute('disabled');
       document.getElementById('cleanDataBtn')?.removeAttribute('disabled');
     });
@@ -64,9 +65,12 @@ function initAnalysis(){
     const res = await fetch(API('/clean-data'), {
       method:'POST',
       headers:{'Content-Type':'application/json'},
-      body: JSON.stringify({data: window.__DATA__||[], options:{}})
+      body: JSON.stringify(window.__DATASET_ID__
+        ? {datasetId: window.__DATASET_ID__, steps:[{op:'drop_null_rows'}, {op:'dedupe'}]}
+        : {data: window.__DATA__||[]})
     });
     const json = await res.json(); window.__DATA__ = json.data || window.__DATA__;
+    if(json.id) window.__DATASET_ID__ = json.id;
   });
 
   // report
@@ -74,7 +78,7 @@ function initAnalysis(){
     const res = await fetch(API('/generate-report'), {
       method:'POST',
       headers:{'Content-Type':'application/json'},
-      body: JSON.stringify({data: window.__DATA__||[]})
+      body: JSON.stringify(window.__DATASET_ID__ ? {datasetId: window.__DATASET_ID__} : {data: window.__DATA__||[]})
     });
     const json = await res.json();
     const el = document.getElementById('reportContent');
@@ -115,9 +119,25 @@ function initHistory(){
     const json = await res.json();
     const target = document.getElementById('historyResult');
     target.innerHTML = `<pre>${JSON.stringify(json.data.slice(0,20), null, 2)}</pre>`;
+    if(src === 'HMD_RAW') target.insertAdjacentHTML('afterbegin', await lifeExpectancyTable());
   });
 }
 
+// e_0 / e_65 by year (latest 20 years) from the cached life-table endpoint
+async function lifeExpectancyTable(){
+  const res = await fetch(API('/life-table'), {
+    method:'POST',
+    headers:{'Content-Type':'application/json'},
+    body: JSON.stringify({columns:['ex'], ages:[0, 65]})
+  });
+  if(!res.ok) return '';
+  const {sexes, years, table} = await res.json();
+  const head = sexes.map(s=>`<th>${s} e0</th><th>${s} e65</th>`).join('');
+  const rows = years.map((y, i)=>`<tr><td>${y}</td>${sexes.map(s=>
+    table[s].ex[i].map(v=>`<td>${v.toFixed(2)}</td>`).join('')).join('')}</tr>`).slice(-20).reverse().join('');
+  return `<h5>预期寿命</h5><table class="table table-sm"><thead><tr><th>年份</th>${head}</tr></thead><tbody>${rows}</tbody></table>`;
+}
+
 /* -------------------------
    Model Lab Page
 ------------------------- */
@@ -129,7 +149,64 @@ function initModelLab(){
    Sensitivity Page
 ------------------------- */
 function initSensitivity(){
-  document.getElementById('sensitivityContent').innerHTML = "<em>敏感性测试功能开发中…</em>";
+  const range = document.getElementById('impactRange');
+  const label = document.getElementById('impactLabel');
+  range.addEventListener('input', ()=>{ label.textContent = `0.8 – ${Number(range.value).toFixed(1)}`; });
+  document.getElementById('runSensitivityBtn').addEventListener('click', runSensitivity);
+}
+
+// streams the scenario grid (NDJSON) and appends each shard's points as it arrives
+async function runSensitivity(){
+  const top = Number(document.getElementById('impactRange').value);
+  const intensities = [];
+  for(let v = 0.8; v <= top + 1e-9; v += 0.1) intensities.push(Number(v.toFixed(1)));
+  const tails = [...document.getElementById('tailSelect').selectedOptions].map(o=>o.value);
+  const scenarios = [...document.querySelectorAll('#scenarioChecks input:checked')].map(i=>i.value);
+  const groups = {};
+  document.querySelectorAll('#ageGroupInputs input').forEach(i=>{ groups[i.dataset.band] = Number(i.value); });
+
+  const target = document.getElementById('sensitivityContent');
+  const bar = document.getElementById('sensitivityProgress');
+  bar.style.width = '0%';
+  target.innerHTML = '<em>计算中…</em>';
+  const res = await fetch(API('/sensitivity'), {
+    method:'POST',
+    headers:{'Content-Type':'application/json'},
+    body: JSON.stringify({intensities, tails, scenarios, ageGroups:[groups]})
+  });
+  if(!res.ok){
+    target.innerHTML = `<div class="text-danger">${(await res.json()).error}</div>`;
+    return;
+  }
+  const pct = v => v == null ? '-' : `${(100 * v).toFixed(2)}%`;
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '', tbody = null;
+  const handle = msg => {
+    if(msg.type === 'grid'){
+      const b = msg.baseline;
+      target.innerHTML = `<p class="small text-muted">${msg.year} 年基准：e0 ${b.e0[2].toFixed(2)}，e65 ${b.e65[2].toFixed(2)}，
+        ä65 ${b.annuity65[2].toFixed(3)}，准备金 ${b.reserve.toFixed(4)}</p>
+        <table class="table table-sm"><thead><tr><th>强度</th><th>尾部</th><th>情景</th><th>e0</th><th>e65</th>
+        <th>ä65</th><th>准备金影响</th></tr></thead><tbody></tbody></table>`;
+      tbody = target.querySelector('tbody');
+    } else if(msg.type === 'progress'){
+      bar.style.width = `${(100 * msg.done / msg.total).toFixed(0)}%`;
+      tbody.insertAdjacentHTML('beforeend', msg.points.map(p=>`<tr><td>${p.intensity.toFixed(1)}</td><td>${p.tail}</td>
+        <td>${p.scenario}</td><td>${p.e0[2].toFixed(2)}</td><td>${p.e65[2].toFixed(2)}</td>
+        <td>${p.annuity65[2].toFixed(3)}</td><td>${pct(p.reserveImpact)}</td></tr>`).join(''));
+    } else if(msg.type === 'error'){
+      target.insertAdjacentHTML('beforeend', `<div class="text-danger">${msg.error}</div>`);
+    }
+  };
+  for(;;){
+    const {done, value} = await reader.read();
+    if(done) break;
+    buffer += decoder.decode(value, {stream: true});
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.filter(Boolean).forEach(l => handle(JSON.parse(l)));
+  }
 }
 
 /* -------------------------